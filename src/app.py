@@ -6,7 +6,7 @@ import warnings
 from telegram.warnings import PTBUserWarning
 from telegram.ext import (
     ApplicationBuilder, ConversationHandler, MessageHandler, CallbackQueryHandler,
-    CommandHandler, filters, ContextTypes, Application
+    CommandHandler, ChatMemberHandler, filters, ContextTypes, Application
 )
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 from telegram.request import HTTPXRequest
@@ -14,13 +14,14 @@ from telegram.error import NetworkError
 
 import database as db  # برای خواندن base_url/port از DB
 
-from bot import jobs, constants
+from bot import jobs, constants, antiflood
 from bot.handlers import (
     start as start_h, gift as gift_h, charge as charge_h, buy as buy_h,
     user_services as us_h, account_actions as acc_act, support as support_h,
     usage as usage_h
 )
-from bot.handlers.common_handlers import check_channel_membership
+from bot.handlers.common_handlers import check_channel_membership, on_chat_member_update
+from bot.callback_router import CallbackRouterHandler, exact, prefix
 from bot.handlers.admin import (
     common as admin_c, plans as admin_plans, reports as admin_reports,
     settings as admin_settings, backup as admin_backup, users as admin_users,
@@ -162,18 +163,92 @@ async def show_overview_webapp(update: Update, context: ContextTypes.DEFAULT_TYP
         await context.bot.send_message(chat_id=update.effective_user.id, text=text, reply_markup=kb)
 
 
+def build_callback_routes() -> dict:
+    """
+    جدول مسیرهای callback سطح بالا (خارج از ConversationHandler ها)، به تفکیک group.
+    ترتیب group ها همان ترتیب قبلی است؛ داخل هر group، prefix ها هم‌پوشانی ندارند.
+    """
+    cm = check_channel_membership
+    return {
+        0: [
+            # Home/menu checks
+            exact("check_membership", cm(start_h.start)),
+            exact("home_menu", cm(start_h.start)),
+            # GUIDES
+            exact("guide_connection", cm(start_h.show_guide_content)),
+            exact("guide_charging", cm(start_h.show_guide_content)),
+            exact("guide_buying", cm(start_h.show_guide_content)),
+            exact("guide_back_to_menu", cm(start_h.back_to_guide_menu)),
+            # PLANS (User browsing)
+            prefix("user_cat_", cm(buy_h.show_plans_in_category)),
+            exact("back_to_cats", cm(buy_h.buy_service_list)),
+            # BUY PANEL SELECT (Multi-panel)
+            prefix("buy_select_panel_", cm(buy_panels.choose_panel_callback)),
+        ],
+        1: [
+            # Gift management catch-all
+            exact("admin_gift", admin_gift.gift_router),
+            prefix("gift_", admin_gift.gift_router),
+            prefix("promo_", admin_gift.gift_router),
+            # Support replies (admin side)
+            prefix("close_ticket_", support_h.close_ticket),
+            # Admin charge decision
+            prefix("admin_confirm_charge_", admin_users.admin_confirm_charge_callback),
+            prefix("admin_reject_charge_", admin_users.admin_reject_charge_callback),
+        ],
+        2: [
+            # Buy confirm/cancel
+            exact("confirmbuy", buy_h.confirm_purchase_callback),
+            exact("cancelbuy", buy_h.cancel_purchase_callback),
+            # Usage
+            exact("acc_usage", usage_h.show_usage_menu),
+            exact("acc_usage_refresh", usage_h.show_usage_menu),
+            # USER SERVICES (user side)
+            prefix("view_service_", cm(us_h.view_service_callback)),
+            exact("back_to_services", cm(us_h.back_to_services_callback)),
+            prefix("getlink_", cm(us_h.get_link_callback)),
+            prefix("refresh_", cm(us_h.refresh_service_details)),
+            prefix("more_links_", cm(us_h.more_links_callback)),
+            prefix("renew_", cm(us_h.renew_service_handler)),
+            exact("confirmrenew", cm(us_h.confirm_renewal_callback)),
+            exact("cancelrenew", cm(us_h.cancel_renewal_callback)),
+            prefix("delete_service_", cm(us_h.delete_service_callback)),
+            # ACCOUNT INFO
+            exact("acc_purchase_history", cm(start_h.show_purchase_history_callback)),
+            exact("acc_charge_history", cm(start_h.show_charge_history_callback)),
+            exact("acc_charging_guide", cm(start_h.show_charging_guide_callback)),
+            exact("acc_back_to_main", cm(start_h.show_account_info)),
+        ],
+    }
+
+
 def build_application() -> Application:
-    request = HTTPXRequest(connect_timeout=15.0, read_timeout=75.0, write_timeout=30.0, pool_timeout=90.0)
+    try:
+        from config import UPDATE_CONCURRENCY
+    except Exception:
+        UPDATE_CONCURRENCY = 32
+    concurrency = max(1, int(UPDATE_CONCURRENCY or 1))
+
+    # با پردازش همزمان، pool اتصال باید جا برای درخواست‌های موازی داشته باشد
+    request = HTTPXRequest(
+        connection_pool_size=max(8, concurrency + 4),
+        connect_timeout=15.0, read_timeout=75.0, write_timeout=30.0, pool_timeout=90.0
+    )
 
-    application = (
+    builder = (
         ApplicationBuilder()
         .token(BOT_TOKEN)
         .request(request)
         .post_init(jobs.post_init)
         .post_shutdown(jobs.post_shutdown)
-        .build()
     )
+    if concurrency > 1:
+        from bot.update_processor import get_processor
+        builder = builder.concurrent_updates(get_processor(concurrency))
+    application = builder.build()
     application.add_error_handler(error_handler)
+    # محدودیت نرخ دکمه‌ها قبل از مسیریابی (روی update processor یا group -1)
+    antiflood.install(application)
 
     # Filters
     try:
@@ -463,6 +538,9 @@ def build_application() -> Application:
                 CallbackQueryHandler(panels_admin.edit_panel_start, pattern=r'^panel_edit_'),
                 CallbackQueryHandler(panels_admin.delete_panel_ask, pattern=r'^panel_del_(?!yes_)'),
                 CallbackQueryHandler(panels_admin.delete_panel_confirm, pattern=r'^panel_del_yes_'),
+                CallbackQueryHandler(panels_admin.show_domain_health, pattern=r'^panel_health(_probe)?$'),
+                CallbackQueryHandler(panels_admin.reconcile_fix_ask, pattern=r'^panel_reconcile_fix$'),
+                CallbackQueryHandler(panels_admin.show_reconcile, pattern=r'^panel_reconcile(_fix_yes)?$'),
                 CallbackQueryHandler(panels_admin.panel_cancel, pattern=r'^panel_cancel$'),
                 CallbackQueryHandler(admin_plans.plan_management_menu, pattern=r'^admin_plans$'),
             ],
@@ -639,6 +717,7 @@ def build_application() -> Application:
             CallbackQueryHandler(admin_backup.edit_auto_backup_start, pattern=r"^edit_auto_backup$"),
             CallbackQueryHandler(admin_backup.edit_backup_interval_start, pattern=r"^edit_backup_interval$"),
             CallbackQueryHandler(admin_backup.set_backup_interval, pattern=r"^set_backup_interval_\d+$"),
+            CallbackQueryHandler(admin_backup.toggle_backup_mode, pattern=r"^toggle_backup_mode$"),
             CallbackQueryHandler(admin_backup.edit_backup_target_start, pattern=r"^edit_backup_target$"),
             CallbackQueryHandler(admin_backup.admin_confirm_restore_callback, pattern=r"^admin_confirm_restore$"),
             CallbackQueryHandler(admin_backup.admin_cancel_restore_callback, pattern=r"^admin_cancel_restore$"),
@@ -720,6 +799,7 @@ def build_application() -> Application:
             CallbackQueryHandler(admin_backup.edit_auto_backup_start, pattern=r"^edit_auto_backup$"),
             CallbackQueryHandler(admin_backup.edit_backup_interval_start, pattern=r"^edit_backup_interval$"),
             CallbackQueryHandler(admin_backup.set_backup_interval, pattern=r"^set_backup_interval_\d+$"),
+            CallbackQueryHandler(admin_backup.toggle_backup_mode, pattern=r"^toggle_backup_mode$"),
             CallbackQueryHandler(admin_backup.edit_backup_target_start, pattern=r"^edit_backup_target$"),
             CallbackQueryHandler(admin_backup.admin_confirm_restore_callback, pattern=r"^admin_confirm_restore$"),
             CallbackQueryHandler(admin_backup.admin_cancel_restore_callback, pattern=r"^admin_cancel_restore$"),
@@ -832,75 +912,19 @@ def build_application() -> Application:
     application.add_handler(support_conv, group=0)
     application.add_handler(admin_conv, group=0)
 
-    # Gift management catch-all
-    application.add_handler(
-        CallbackQueryHandler(admin_gift.gift_router, pattern=r'^(admin_gift$|gift_.*|promo_.*)$'),
-        group=1
-    )
-
     # Admin settings commands
     application.add_handler(CommandHandler("set_trial_days", set_trial_days, filters=admin_filter))
     application.add_handler(CommandHandler("set_trial_gb", set_trial_gb, filters=admin_filter))
 
-    # Buy confirm/cancel
-    application.add_handler(CallbackQueryHandler(buy_h.confirm_purchase_callback, pattern=r"^confirmbuy$"), group=2)
-    application.add_handler(CallbackQueryHandler(buy_h.cancel_purchase_callback, pattern=r"^cancelbuy$"), group=2)
-
     # Support replies (admin side)
     application.add_handler(MessageHandler(filters.REPLY & admin_filter, support_h.admin_reply_handler), group=1)
-    application.add_handler(CallbackQueryHandler(support_h.close_ticket, pattern=r"^close_ticket_"), group=1)
 
-    # Home/menu checks
-    application.add_handler(CallbackQueryHandler(check_channel_membership(start_h.start), pattern=r"^check_membership$"))
-    application.add_handler(CallbackQueryHandler(check_channel_membership(start_h.start), pattern=r"^home_menu$"))
-
-    # Usage
-    application.add_handler(CallbackQueryHandler(usage_h.show_usage_menu, pattern=r"^acc_usage$"), group=2)
-    application.add_handler(CallbackQueryHandler(usage_h.show_usage_menu, pattern=r"^acc_usage_refresh$"), group=2)
-
-    # Admin charge decision
-    application.add_handler(CallbackQueryHandler(admin_users.admin_confirm_charge_callback, pattern=r'^admin_confirm_charge_'), group=1)
-    application.add_handler(CallbackQueryHandler(admin_users.admin_reject_charge_callback, pattern=r'^admin_reject_charge_'), group=1)
-
-    # USER SERVICES (user side)
-    for h in [
-        CallbackQueryHandler(check_channel_membership(us_h.view_service_callback), pattern=r"^view_service_"),
-        CallbackQueryHandler(check_channel_membership(us_h.back_to_services_callback), pattern=r"^back_to_services$"),
-        CallbackQueryHandler(check_channel_membership(us_h.get_link_callback), pattern=r"^getlink_"),
-        CallbackQueryHandler(check_channel_membership(us_h.refresh_service_details), pattern=r"^refresh_"),
-        CallbackQueryHandler(check_channel_membership(us_h.more_links_callback), pattern=r"^more_links_"),
-        CallbackQueryHandler(check_channel_membership(us_h.renew_service_handler), pattern=r"^renew_"),
-        CallbackQueryHandler(check_channel_membership(us_h.confirm_renewal_callback), pattern=r"^confirmrenew$"),
-        CallbackQueryHandler(check_channel_membership(us_h.cancel_renewal_callback), pattern=r"^cancelrenew$"),
-        CallbackQueryHandler(check_channel_membership(us_h.delete_service_callback), pattern=r"^delete_service_"),
-    ]:
-        application.add_handler(h, group=2)
-
-    # ACCOUNT INFO
-    for h in [
-        CallbackQueryHandler(check_channel_membership(start_h.show_purchase_history_callback), pattern=r"^acc_purchase_history$"),
-        CallbackQueryHandler(check_channel_membership(start_h.show_charge_history_callback), pattern=r"^acc_charge_history$"),
-        CallbackQueryHandler(check_channel_membership(start_h.show_charging_guide_callback), pattern=r"^acc_charging_guide$"),
-        CallbackQueryHandler(check_channel_membership(start_h.show_account_info), pattern=r"^acc_back_to_main$"),
-    ]:
-        application.add_handler(h, group=2)
-
-    # GUIDES
-    for h in [
-        CallbackQueryHandler(check_channel_membership(start_h.show_guide_content), pattern=r"^guide_(connection|charging|buying)$"),
-        CallbackQueryHandler(check_channel_membership(start_h.back_to_guide_menu), pattern=r"^guide_back_to_menu$"),
-    ]:
-        application.add_handler(h)
-
-    # PLANS (User browsing)
-    for h in [
-        CallbackQueryHandler(check_channel_membership(buy_h.show_plans_in_category), pattern=r"^user_cat_"),
-        CallbackQueryHandler(check_channel_membership(buy_h.buy_service_list), pattern=r"^back_to_cats$"),
-    ]:
-        application.add_handler(h)
+    # Force-join cache refresh (وقتی ربات ادمین کانال باشد)
+    application.add_handler(ChatMemberHandler(on_chat_member_update, ChatMemberHandler.CHAT_MEMBER), group=3)
 
-    # BUY PANEL SELECT (Multi-panel)
-    application.add_handler(CallbackQueryHandler(check_channel_membership(buy_panels.choose_panel_callback), pattern=r"^buy_select_panel_"))
+    # Callback های سطح بالا: یک router با ایندکس prefix در هر group (به‌جای ده‌ها CallbackQueryHandler)
+    for group, routes in build_callback_routes().items():
+        application.add_handler(CallbackRouterHandler(routes), group=group)
 
     # MAIN MENU (user)
     for h in [
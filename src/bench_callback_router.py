@@ -0,0 +1,86 @@
+# filename: bench_callback_router.py
+# -*- coding: utf-8 -*-
+"""
+میکروبنچمارک هزینه مسیریابی هر callback query:
+  legacy: CallbackQueryHandler های regex پشت سر هم (همان الگوهای قبلی، به ترتیب هر group)
+  router: CallbackRouterHandler (ایندکس exact/prefix) روی همان جدول app.build_callback_routes
+
+    python bench_callback_router.py                 # جدول واقعی
+    python bench_callback_router.py --extra 200     # + ۲۰۰ route مصنوعی برای دیدن رشد خطی legacy
+"""
+
+import argparse
+import time
+
+from telegram import CallbackQuery, Update, User
+from telegram.ext import CallbackQueryHandler
+
+from app import build_callback_routes
+from bot.callback_router import CallbackRouterHandler, prefix
+
+
+async def _noop(update, context):
+    return None
+
+
+def _updates(routes_by_group: dict) -> list:
+    user = User(id=1, first_name="bench", is_bot=False)
+    datas = []
+    for routes in routes_by_group.values():
+        for r in routes:
+            datas.append(r.key + ("42" if r.is_prefix else ""))
+    datas += ["unknown_button", "x", "noop"]  # miss
+    return [
+        Update(update_id=i, callback_query=CallbackQuery(id=str(i), from_user=user, chat_instance="c", data=d))
+        for i, d in enumerate(datas)
+    ]
+
+
+def _bench(dispatch, updates, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for u in updates:
+            dispatch(u)
+    return (time.perf_counter() - started) / (rounds * len(updates)) * 1e9
+
+
+def main():
+    ap = argparse.ArgumentParser(description="callback routing micro-benchmark")
+    ap.add_argument("--rounds", type=int, default=2000)
+    ap.add_argument("--extra", type=int, default=0, help="تعداد route مصنوعی اضافه در group 2")
+    args = ap.parse_args()
+
+    routes_by_group = build_callback_routes()
+    if args.extra:
+        routes_by_group[2] = routes_by_group[2] + [prefix(f"bench{i}_", _noop) for i in range(args.extra)]
+
+    legacy = {g: [CallbackQueryHandler(_noop, pattern=r.pattern) for r in routes] for g, routes in routes_by_group.items()}
+    router = {g: [CallbackRouterHandler(routes)] for g, routes in routes_by_group.items()}
+    updates = _updates(routes_by_group)
+
+    def dispatcher(groups):
+        def dispatch(update):
+            # مثل Application.process_update: در هر group اولین handler منطبق
+            for handlers in groups.values():
+                for h in handlers:
+                    if h.check_update(update):
+                        break
+        return dispatch
+
+    # صحت: هر دو روش برای همه آپدیت‌ها همان route را انتخاب کنند
+    for u in updates:
+        for g, routes in routes_by_group.items():
+            want = next((r for r, h in zip(routes, legacy[g]) if h.check_update(u)), None)
+            got = router[g][0].check_update(u)
+            assert (got[0] if got else None) is want, (u.callback_query.data, g)
+
+    n_routes = sum(len(r) for r in routes_by_group.values())
+    t_legacy = _bench(dispatcher(legacy), updates, args.rounds)
+    t_router = _bench(dispatcher(router), updates, args.rounds)
+    print(f"routes: {n_routes} in {len(routes_by_group)} groups, updates/round: {len(updates)}, rounds: {args.rounds}")
+    print(f"legacy regex scan : {t_legacy:9.0f} ns/update")
+    print(f"prefix router     : {t_router:9.0f} ns/update  ({t_legacy / t_router:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
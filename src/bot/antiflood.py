@@ -0,0 +1,187 @@
+# filename: bot/antiflood.py
+# -*- coding: utf-8 -*-
+"""
+محدودیت نرخ دکمه‌ها برای هر کاربر (token bucket با بودجه جدا برای هر نوع عمل) + ادغام درخواست‌های همزمان.
+
+- gate(update): قبل از مسیریابی اجرا می‌شود. دکمه‌هایی که درخواست زنده به پنل می‌زنند (refresh_ / view_service_ /
+  getlink_ / renew_) بودجه کمتری دارند. اگر بودجه تمام شده باشد یا همان سرویس هم‌اکنون در حال دریافت باشد،
+  فقط یک answer کوتاه «صبر کنید» داده می‌شود و آپدیت به handler ها نمی‌رسد.
+  با ChatSerializedUpdateProcessor این بررسی قبل از قفل چت انجام می‌شود (فشارهای پشت سر هم پشت درخواست کند
+  صف نمی‌شوند)؛ در حالت ترتیبی یک TypeHandler در group -1 همین کار را می‌کند (install).
+- coalesce(key, factory): درخواست‌های همزمان با یک key به همان درخواست در حال اجرا وصل می‌شوند.
+- busy(key): علامت «در حال اجرا» برای gate (مثلاً svc:<service_id> در زمان رندر جزئیات سرویس).
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, ContextTypes, TypeHandler
+
+from bot.keyboards import _is_admin
+
+try:
+    from config import ANTIFLOOD_ENABLED
+except Exception:
+    ANTIFLOOD_ENABLED = True
+
+try:
+    from config import ANTIFLOOD_BUDGETS
+except Exception:
+    ANTIFLOOD_BUDGETS = {}
+
+logger = logging.getLogger(__name__)
+
+# action: (ظرفیت burst، توکن در ثانیه)
+BUDGETS: Dict[str, Tuple[float, float]] = {
+    "panel": (4, 1 / 5),      # درخواست زنده به پنل
+    "refresh": (3, 1 / 3),    # بروزرسانی از snapshot
+    "callback": (12, 2.0),    # سایر دکمه‌ها
+}
+BUDGETS.update({k: tuple(v) for k, v in (ANTIFLOOD_BUDGETS or {}).items()})
+
+# (prefix, action, تابع ساخت key درحال‌اجرا از باقی callback_data)
+_RULES: List[Tuple[str, str, Optional[Callable[[str], str]]]] = sorted([
+    ("refresh_", "panel", lambda rest: f"svc:{rest}"),
+    ("view_service_", "panel", lambda rest: f"svc:{rest}"),
+    ("getlink_", "panel", None),
+    ("renew_", "panel", None),
+    ("acc_usage_refresh", "refresh", None),
+], key=lambda r: -len(r[0]))
+
+MSG_WAIT = "⏳ لطفاً چند لحظه صبر کنید..."
+MSG_INFLIGHT = "⏳ در حال دریافت اطلاعات؛ همان درخواست قبلی به‌روز می‌شود."
+
+_MAX_BUCKETS = 20000
+
+_buckets: Dict[Tuple[int, str], List[float]] = {}
+_inflight: Dict[str, asyncio.Future] = {}
+_busy: Dict[str, int] = {}
+stats = {"allowed": 0, "limited": 0, "attached": 0}
+
+
+def classify(data: str) -> Tuple[str, Optional[str]]:
+    """(action، key درحال‌اجرا یا None) برای یک callback_data."""
+    for pfx, action, key_fn in _RULES:
+        if data.startswith(pfx):
+            return action, (key_fn(data[len(pfx):]) if key_fn else None)
+    return "callback", None
+
+
+def _prune(now: float) -> None:
+    # حذف bucket هایی که دوباره پر شده‌اند (معادل کاربری که مدتی فعالیت نداشته)
+    for k, (tokens, ts) in list(_buckets.items()):
+        burst, rate = BUDGETS.get(k[1], BUDGETS["callback"])
+        if tokens + (now - ts) * rate >= burst:
+            del _buckets[k]
+
+
+def take(user_id: int, action: str, now: Optional[float] = None) -> bool:
+    """برداشتن یک توکن از bucket کاربر برای این action."""
+    burst, rate = BUDGETS.get(action, BUDGETS["callback"])
+    now = time.monotonic() if now is None else now
+    b = _buckets.get((user_id, action))
+    if b is None:
+        if len(_buckets) >= _MAX_BUCKETS:
+            _prune(now)
+        b = _buckets[(user_id, action)] = [float(burst), now]
+    else:
+        b[0] = min(float(burst), b[0] + (now - b[1]) * rate)
+        b[1] = now
+    if b[0] >= 1.0:
+        b[0] -= 1.0
+        return True
+    return False
+
+
+def is_busy(key: str) -> bool:
+    return key in _busy or key in _inflight
+
+
+@contextmanager
+def busy(key: str):
+    _busy[key] = _busy.get(key, 0) + 1
+    try:
+        yield
+    finally:
+        _busy[key] -= 1
+        if _busy[key] <= 0:
+            _busy.pop(key, None)
+
+
+async def coalesce(key: str, factory: Callable[[], Awaitable]):
+    """
+    اگر درخواستی با همین key در حال اجراست، منتظر همان نتیجه بمان؛ وگرنه factory() را اجرا کن.
+    لغو یک منتظر، درخواست اصلی را لغو نمی‌کند.
+    """
+    fut = _inflight.get(key)
+    if fut is not None:
+        stats["attached"] += 1
+        return await asyncio.shield(fut)
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        result = await factory()
+        fut.set_result(result)
+        return result
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            fut.cancel()  # لغو فراخواننده اول؛ منتظرها هم آزاد می‌شوند
+        else:
+            fut.set_exception(e)
+            fut.exception()  # جلوگیری از هشدار «exception was never retrieved»
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+async def gate(update: object) -> bool:
+    """True = آپدیت پردازش شود. در صورت رد، callback query پاسخ داده می‌شود."""
+    if not ANTIFLOOD_ENABLED or not isinstance(update, Update):
+        return True
+    q = update.callback_query
+    if q is None or not isinstance(q.data, str) or q.from_user is None:
+        return True
+    uid = q.from_user.id
+    if _is_admin(uid):
+        return True
+
+    action, key = classify(q.data)
+    if key is not None and is_busy(key):
+        reason = MSG_INFLIGHT
+    elif take(uid, action):
+        stats["allowed"] += 1
+        return True
+    else:
+        reason = MSG_WAIT
+    stats["limited"] += 1
+    logger.debug("antiflood: dropped %r from user %s (%s)", q.data, uid, action)
+    try:
+        await q.answer(reason)
+    except Exception:
+        pass
+    return False
+
+
+async def _gate_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await gate(update):
+        raise ApplicationHandlerStop
+
+
+def install(application: Application) -> None:
+    """gate را روی update processor (در صورت پشتیبانی) یا به‌صورت TypeHandler در group -1 نصب می‌کند."""
+    processor = getattr(application, "update_processor", None)
+    if processor is not None and hasattr(processor, "gate"):
+        processor.gate = gate
+    else:
+        application.add_handler(TypeHandler(Update, _gate_handler), group=-1)
+
+
+def format_stats() -> str:
+    return (
+        f"antiflood: مجاز {stats['allowed']} | ردشده {stats['limited']} | "
+        f"ادغام‌شده {stats['attached']} | bucket ها {len(_buckets)}"
+    )
@@ -0,0 +1,261 @@
+# filename: bot/backup_archive.py
+# -*- coding: utf-8 -*-
+"""
+بسته‌بندی فایل‌های بکاپ برای ارسال و نگهداری.
+
+- pack: فایل به صورت جریانی فشرده می‌شود (zstd در صورت نصب zstandard، وگرنه gzip) و در قطعه‌های
+  شماره‌دار حداکثر BACKUP_CHUNK_MB نوشته می‌شود. اگر بیش از یک قطعه باشد، یک manifest (JSON) با
+  اندازه و sha256 هر قطعه و فایل اصلی هم ساخته می‌شود. فایل تک‌قطعه همان <name>.gz / <name>.zst است.
+- unpack: بررسی sha256 قطعه‌ها، اتصال و باز کردن جریانی، و بررسی sha256 فایل نهایی.
+- retention_keep: نگهداری لایه‌ای (ساعتی/روزانه/هفتگی) بر اساس زمان هر بکاپ.
+
+حد دانلود فایل برای ربات‌ها ۲۰ مگابایت است؛ BACKUP_CHUNK_MB پیش‌فرض کمتر از آن است تا قطعه‌ها
+از طریق خود ربات (بخش بازیابی) هم قابل بازگرداندن باشند.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import zstandard  # اختیاری؛ در نبودِ آن gzip
+except Exception:
+    zstandard = None
+
+try:
+    from config import BACKUP_CHUNK_MB
+except Exception:
+    BACKUP_CHUNK_MB = 19
+
+try:
+    from config import BACKUP_COMPRESSION
+except Exception:
+    BACKUP_COMPRESSION = "auto"
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest.json"
+CODEC_EXT = {"zstd": ".zst", "gzip": ".gz"}
+_BLOCK = 1 << 20
+
+
+def codec() -> str:
+    want = str(BACKUP_COMPRESSION or "auto").strip().lower()
+    if want in ("auto", "zstd") and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def codec_for_name(name: str) -> Optional[str]:
+    for c, ext in CODEC_EXT.items():
+        if name.endswith(ext):
+            return c
+    return None
+
+
+def _compressobj(c: str):
+    if c == "zstd":
+        return zstandard.ZstdCompressor(level=10).compressobj()
+    return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> قالب gzip
+
+
+def _decompressobj(c: str):
+    if c == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandard is not installed; cannot read .zst backups")
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+def _sha256_file(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_BLOCK), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class _ChunkWriter:
+    """نوشتن جریان فشرده در فایل‌های <base>.001، <base>.002، ... با سقف اندازه هر قطعه."""
+
+    def __init__(self, base_path: str, limit: int):
+        self.base_path, self.limit = base_path, max(1, limit)
+        self.parts: List[dict] = []
+        self._f = None
+
+    def _open(self):
+        path = f"{self.base_path}.{len(self.parts) + 1:03d}"
+        self._f = open(path, "wb")
+        self.parts.append({"path": path, "size": 0, "sha": hashlib.sha256()})
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            if self._f is None or self.parts[-1]["size"] >= self.limit:
+                self.close()
+                self._open()
+            cur = self.parts[-1]
+            n = min(len(view), self.limit - cur["size"])
+            self._f.write(view[:n])
+            cur["sha"].update(view[:n])
+            cur["size"] += n
+            view = view[n:]
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def pack(src_path: str, out_dir: str, name: Optional[str] = None, chunk_mb: Optional[float] = None) -> Tuple[List[str], dict]:
+    """
+    (فایل‌هایی که باید ارسال شوند به ترتیب، manifest). فایل manifest در صورت وجود آخرین عضو لیست است.
+    name نام فایل اصلی (پیش‌فرض basename مبدأ) است.
+    """
+    c = codec()
+    name = name or os.path.basename(src_path)
+    base = os.path.join(out_dir, name + CODEC_EXT[c])
+    limit = int(float(chunk_mb or BACKUP_CHUNK_MB) * 1024 * 1024)
+
+    comp = _compressobj(c)
+    sha = hashlib.sha256()
+    size = 0
+    writer = _ChunkWriter(base, limit)
+    try:
+        with open(src_path, "rb") as f:
+            for block in iter(lambda: f.read(_BLOCK), b""):
+                sha.update(block)
+                size += len(block)
+                writer.write(comp.compress(block))
+        writer.write(comp.flush())
+    finally:
+        writer.close()
+    if not writer.parts:  # فایل خالی
+        writer._open()
+        writer.close()
+
+    manifest = {
+        "name": name, "codec": c, "size": size, "sha256": sha.hexdigest(),
+        "parts": [{"name": os.path.basename(p["path"]), "size": p["size"], "sha256": p["sha"].hexdigest()} for p in writer.parts],
+    }
+    if len(writer.parts) == 1:
+        os.replace(writer.parts[0]["path"], base)
+        manifest["parts"][0]["name"] = os.path.basename(base)
+        return [base], manifest
+
+    manifest_path = os.path.join(out_dir, name + MANIFEST_SUFFIX)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return [p["path"] for p in writer.parts] + [manifest_path], manifest
+
+
+def read_manifest(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        m = json.load(f)
+    if not isinstance(m, dict) or not m.get("parts") or m.get("codec") not in CODEC_EXT:
+        raise ValueError("invalid manifest")
+    return m
+
+
+def missing_parts(manifest: dict, available: Iterable[str]) -> List[str]:
+    have = set(available)
+    return [p["name"] for p in manifest["parts"] if p["name"] not in have]
+
+
+def unpack(manifest: dict, part_paths: Dict[str, str], out_path: str) -> int:
+    """part_paths: {نام قطعه در manifest: مسیر محلی}. اندازه فایل بازشده را برمی‌گرداند."""
+    missing = missing_parts(manifest, part_paths)
+    if missing:
+        raise ValueError(f"missing parts: {', '.join(missing)}")
+    for p in manifest["parts"]:
+        if _sha256_file(part_paths[p["name"]]) != p["sha256"]:
+            raise ValueError(f"{p['name']}: checksum mismatch")
+
+    dec = _decompressobj(manifest["codec"])
+    sha = hashlib.sha256()
+    size = 0
+    tmp = out_path + ".tmp"
+    try:
+        with open(tmp, "wb") as out:
+            for p in manifest["parts"]:
+                with open(part_paths[p["name"]], "rb") as f:
+                    for block in iter(lambda: f.read(_BLOCK), b""):
+                        data = dec.decompress(block)
+                        sha.update(data)
+                        size += len(data)
+                        out.write(data)
+            tail = dec.flush()
+            sha.update(tail)
+            size += len(tail)
+            out.write(tail)
+        if sha.hexdigest() != manifest["sha256"] or size != manifest["size"]:
+            raise ValueError("checksum mismatch after decompression")
+        os.replace(tmp, out_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return size
+
+
+def decompress_file(src_path: str, out_path: str) -> int:
+    """فایل تک‌قطعه .gz/.zst (بدون manifest) -> out_path."""
+    c = codec_for_name(src_path)
+    if c is None:
+        raise ValueError("unknown compressed format")
+    dec = _decompressobj(c)
+    size = 0
+    with open(src_path, "rb") as f, open(out_path, "wb") as out:
+        for block in iter(lambda: f.read(_BLOCK), b""):
+            data = dec.decompress(block)
+            size += len(data)
+            out.write(data)
+        tail = dec.flush()
+        size += len(tail)
+        out.write(tail)
+    return size
+
+
+# -------------------- Tiered retention --------------------
+def retention_keep(stamps: Iterable[datetime], hourly: int, daily: int, weekly: int) -> Set[datetime]:
+    """
+    جدیدترین بکاپ هر ساعت برای hourly ساعت اخیرِ دارای بکاپ، جدیدترین هر روز برای daily روز
+    و جدیدترین هر هفته (ISO) برای weekly هفته نگه داشته می‌شود.
+    """
+    keep: Set[datetime] = set()
+    ordered = sorted(set(stamps), reverse=True)
+    tiers = (
+        (hourly, lambda t: (t.date(), t.hour)),
+        (daily, lambda t: t.date()),
+        (weekly, lambda t: t.isocalendar()[:2]),
+    )
+    for limit, bucket in tiers:
+        seen = set()
+        for t in ordered:
+            b = bucket(t)
+            if b in seen:
+                continue
+            if len(seen) >= limit:
+                break
+            seen.add(b)
+            keep.add(t)
+    return keep
+
+
+async def send_files(bot, chat_id, paths: List[str], caption: str) -> list:
+    """
+    ارسال قطعه‌ها به ترتیب؛ در صورت چندقطعه‌ای بودن، شماره قطعه به caption اضافه می‌شود.
+    خروجی send_document هر قطعه (با OutboxBot شناسه ردیف صف) برگردانده می‌شود.
+    """
+    from telegram import InputFile
+
+    results = []
+    n = len(paths)
+    for i, path in enumerate(paths, start=1):
+        text = caption if n == 1 else f"{caption}\n📦 فایل {i}/{n}" + (" (manifest)" if path.endswith(MANIFEST_SUFFIX) else "")
+        with open(path, "rb") as f:
+            results.append(await bot.send_document(chat_id=chat_id, document=InputFile(f, filename=os.path.basename(path)), caption=text))
+    return results
@@ -0,0 +1,114 @@
+# filename: bot/callback_router.py
+# -*- coding: utf-8 -*-
+"""
+مسیریابی callback_data با جدول اعلانی (declarative) به‌جای زنجیره CallbackQueryHandler های regex.
+
+هر route یا «exact» است (callback_data دقیقاً برابر) یا «prefix» (مثل view_service_ / renew_).
+exact ها در یک dict و prefix ها در dict جدا بر اساس طول prefix ایندکس می‌شوند؛ پیدا کردن route
+یک lookup در dict exact و حداکثر یک lookup برای هر طول متمایز prefix است (طولانی‌ترین اول)،
+مستقل از تعداد route ها. پارامتر (باقی‌مانده بعد از prefix) یک بار استخراج و مثل CallbackQueryHandler
+در context.matches قرار می‌گیرد (context.match.group(1)).
+
+    handler = CallbackRouterHandler([
+        exact("acc_usage", usage_h.show_usage_menu),
+        prefix("view_service_", us_h.view_service_callback),
+    ])
+    application.add_handler(handler, group=2)
+
+بنچمارک: python bench_callback_router.py
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseHandler
+
+
+class Route:
+    __slots__ = ("key", "is_prefix", "callback", "_param_re")
+
+    def __init__(self, key: str, callback: Callable, is_prefix: bool):
+        if not key:
+            raise ValueError("route key must not be empty")
+        self.key = key
+        self.is_prefix = is_prefix
+        self.callback = callback
+        # فقط برای ساخت re.Match سازگار با context.match (یک بار برای route انتخاب‌شده اجرا می‌شود)
+        self._param_re = re.compile(re.escape(key) + (r"(.*)" if is_prefix else r"()"), re.DOTALL)
+
+    @property
+    def pattern(self) -> str:
+        """regex معادل در CallbackQueryHandler (برای مقایسه/بنچمارک)."""
+        return "^" + re.escape(self.key) + ("" if self.is_prefix else "$")
+
+    def match(self, data: str) -> "re.Match[str]":
+        return self._param_re.fullmatch(data)
+
+    def __repr__(self) -> str:
+        return f"Route({self.key!r}{'*' if self.is_prefix else ''})"
+
+
+def exact(data: str, callback: Callable) -> Route:
+    return Route(data, callback, is_prefix=False)
+
+
+def prefix(data_prefix: str, callback: Callable) -> Route:
+    return Route(data_prefix, callback, is_prefix=True)
+
+
+class CallbackRouter:
+    def __init__(self, routes: List[Route]):
+        self.routes = list(routes)
+        self._exact: Dict[str, Route] = {}
+        self._prefix: Dict[int, Dict[str, Route]] = {}
+        for r in self.routes:
+            table = self._prefix.setdefault(len(r.key), {}) if r.is_prefix else self._exact
+            if r.key in table:
+                raise ValueError(f"duplicate callback route: {r!r}")
+            table[r.key] = r
+        self._lengths: Tuple[int, ...] = tuple(sorted(self._prefix, reverse=True))
+
+    def resolve(self, data: str) -> Optional[Route]:
+        r = self._exact.get(data)
+        if r is not None:
+            return r
+        n = len(data)
+        for length in self._lengths:
+            if length <= n:
+                r = self._prefix[length].get(data[:length])
+                if r is not None:
+                    return r
+        return None
+
+
+class CallbackRouterHandler(BaseHandler[Update, Any]):
+    """یک handler برای کل جدول؛ جایگزین چند CallbackQueryHandler در یک group."""
+
+    __slots__ = ("router",)
+
+    def __init__(self, routes: List[Route], block: bool = True):
+        super().__init__(self._unused, block=block)
+        self.router = CallbackRouter(routes)
+
+    @staticmethod
+    async def _unused(update, context):  # callback واقعی از route انتخاب‌شده می‌آید
+        return None
+
+    def check_update(self, update: object) -> Optional[Tuple[Route, "re.Match[str]"]]:
+        if not isinstance(update, Update) or not update.callback_query:
+            return None
+        data = update.callback_query.data
+        if not isinstance(data, str):
+            return None
+        route = self.router.resolve(data)
+        if route is None:
+            return None
+        return route, route.match(data)
+
+    def collect_additional_context(self, context, update, application, check_result) -> None:
+        context.matches = [check_result[1]]
+
+    async def handle_update(self, update, application, check_result, context):
+        self.collect_additional_context(context, update, application, check_result)
+        return await check_result[0].callback(update, context)
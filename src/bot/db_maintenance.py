@@ -0,0 +1,123 @@
+# filename: bot/db_maintenance.py
+# -*- coding: utf-8 -*-
+"""
+نگهداری دوره‌ای دیتابیس: checkpoint فایل WAL و PRAGMA optimize.
+
+- هر DB_MAINTENANCE_INTERVAL_MIN دقیقه یک wal_checkpoint(PASSIVE) (بدون انتظار برای قفل) اجرا می‌شود.
+- در ساعات کم‌ترافیک (DB_MAINTENANCE_QUIET_HOURS) یا وقتی WAL از DB_WAL_TRUNCATE_MB بزرگ‌تر شده باشد،
+  اگر همه فریم‌ها checkpoint شده باشند، wal_checkpoint(TRUNCATE) فایل WAL را کوچک می‌کند.
+- در ساعات کم‌ترافیک PRAGMA optimize (با analysis_limit محدود) آمار planner را به‌روز می‌کند.
+- اندازه WAL قبل/بعد هر اجرا در setting «db_wal_history» (آخرین _HISTORY_LEN نقطه) ذخیره می‌شود تا در
+  گزارش آمار ادمین (حتی در حالت worker) دیده شود.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Optional
+
+from telegram.ext import ContextTypes
+
+import database as db
+from bot import executors
+
+try:
+    from config import DB_MAINTENANCE_INTERVAL_MIN
+except Exception:
+    DB_MAINTENANCE_INTERVAL_MIN = 15
+
+try:
+    from config import DB_MAINTENANCE_QUIET_HOURS
+except Exception:
+    DB_MAINTENANCE_QUIET_HOURS = (3, 6)   # [شروع، پایان) ساعت محلی
+
+try:
+    from config import DB_WAL_TRUNCATE_MB
+except Exception:
+    DB_WAL_TRUNCATE_MB = 64
+
+logger = logging.getLogger(__name__)
+
+HISTORY_KEY = "db_wal_history"
+_HISTORY_LEN = 96
+_ANALYSIS_LIMIT = 400
+
+
+def wal_size() -> int:
+    try:
+        return os.path.getsize(db.DB_NAME + "-wal")
+    except OSError:
+        return 0
+
+
+def is_quiet(now: Optional[datetime] = None) -> bool:
+    start, end = (int(h) % 24 for h in DB_MAINTENANCE_QUIET_HOURS)
+    hour = (now or datetime.now()).hour
+    return start <= hour < end if start <= end else (hour >= start or hour < end)
+
+
+def run_maintenance(deep: bool) -> dict:
+    """
+    روی اتصال جداگانه (sync؛ با executors.run_io). deep=True یعنی TRUNCATE (در صورت امکان) + optimize.
+    """
+    started = time.monotonic()
+    res = {"wal_before": wal_size(), "truncated": False, "optimized": False}
+    conn = sqlite3.connect(db.DB_NAME, timeout=5, isolation_level=None)
+    try:
+        busy, log_frames, ckpt = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        res.update(busy=busy, log_frames=log_frames, checkpointed=ckpt)
+        too_big = res["wal_before"] > float(DB_WAL_TRUNCATE_MB) * 1024 * 1024
+        if (deep or too_big) and busy == 0 and log_frames == ckpt:
+            busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            res["truncated"] = busy == 0
+        if deep:
+            conn.execute(f"PRAGMA analysis_limit = {_ANALYSIS_LIMIT}")
+            conn.execute("PRAGMA optimize")
+            res["optimized"] = True
+    finally:
+        conn.close()
+    res["wal_after"] = wal_size()
+    res["duration"] = round(time.monotonic() - started, 3)
+    return res
+
+
+def _record(res: dict) -> None:
+    try:
+        history = json.loads(db.get_setting(HISTORY_KEY) or "[]")
+    except ValueError:
+        history = []
+    history.append([int(time.time()), res["wal_before"] // 1024, res["wal_after"] // 1024])
+    db.set_setting(HISTORY_KEY, json.dumps(history[-_HISTORY_LEN:]))
+
+
+async def db_maintenance_job(context: ContextTypes.DEFAULT_TYPE):
+    deep = is_quiet()
+    try:
+        res = await executors.run_io(run_maintenance, deep)
+        _record(res)
+        logger.info(
+            "DB maintenance (%s): WAL %d -> %d KiB, frames %s/%s, truncated=%s, optimized=%s in %.2fs",
+            "deep" if deep else "passive", res["wal_before"] // 1024, res["wal_after"] // 1024,
+            res["checkpointed"], res["log_frames"], res["truncated"], res["optimized"], res["duration"],
+        )
+    except Exception as e:
+        logger.error("db_maintenance_job failed: %s", e, exc_info=True)
+
+
+def format_stats() -> str:
+    try:
+        history = json.loads(db.get_setting(HISTORY_KEY) or "[]")
+    except ValueError:
+        history = []
+    text = f"WAL: {wal_size() // 1024:,}KiB"
+    if history:
+        before = [h[1] for h in history]
+        last = datetime.fromtimestamp(history[-1][0]).strftime("%H:%M")
+        text += (
+            f" | آخرین نگهداری {last}: {history[-1][1]:,}→{history[-1][2]:,}KiB"
+            f" | بیشینه {max(before):,}KiB، میانگین {sum(before) // len(before):,}KiB ({len(history)} اجرا)"
+        )
+    return text
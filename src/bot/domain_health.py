@@ -0,0 +1,213 @@
+# filename: bot/domain_health.py
+# -*- coding: utf-8 -*-
+"""
+سلامت ساب‌دامین‌های لینک اشتراک.
+
+- domain_health_job: همه ساب‌دامین‌های پیکربندی‌شده (هر پنل + تنظیمات sub_domains / unlimited / volume_based)
+  به‌صورت همزمان probe می‌شوند (دسترسی‌پذیری + تأخیر) و نتیجه در جدول domain_health ذخیره می‌شود؛
+  در حالت worker هم پروسس ربات همان نتیجه را از DB می‌خواند.
+- pick_host: انتخاب تصادفی وزن‌دار (هاست سریع‌تر وزن بیشتر) و حذف هاست‌هایی که پشت سر هم خطا داده‌اند.
+  اگر همه حذف شوند یا هنوز probe انجام نشده باشد، همان انتخاب یکنواخت قبلی.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from telegram.ext import ContextTypes
+
+import database as db
+from bot import panels as pnl
+
+try:
+    from config import SUB_DOMAINS as _CFG_SUB_DOMAINS
+except Exception:
+    _CFG_SUB_DOMAINS = []
+
+try:
+    from config import DOMAIN_PROBE_INTERVAL_MIN
+except Exception:
+    DOMAIN_PROBE_INTERVAL_MIN = 5
+
+try:
+    from config import DOMAIN_PROBE_TIMEOUT_SEC
+except Exception:
+    DOMAIN_PROBE_TIMEOUT_SEC = 6.0
+
+try:
+    from config import DOMAIN_FAIL_THRESHOLD
+except Exception:
+    DOMAIN_FAIL_THRESHOLD = 2
+
+logger = logging.getLogger(__name__)
+
+_PROBE_CONCURRENCY = 16
+_EWMA_ALPHA = 0.3
+_LATENCY_FLOOR_MS = 50.0
+_CACHE_TTL_SEC = 30.0
+
+_cache: Dict[str, dict] = {}
+_cache_at = 0.0
+
+
+def configured_hosts() -> Dict[str, dict]:
+    """{host: {"panel_id", "verify"}} برای همه ساب‌دامین‌های قابل استفاده در لینک‌ها."""
+    hosts: Dict[str, dict] = {}
+    for p in pnl.load_panels():
+        subs = p.get("sub_domains") or []
+        if not subs and p.get("panel_domain"):
+            subs = [pnl._host(p["panel_domain"])]
+        for h in subs:
+            if h:
+                hosts.setdefault(h, {"panel_id": p.get("id"), "verify": bool(p.get("verify_ssl", True))})
+    for key in ("sub_domains", "unlimited_sub_domains", "volume_based_sub_domains"):
+        try:
+            raw = db.get_setting(key)
+        except Exception:
+            raw = None
+        for h in pnl._norm_subdomains(raw or ""):
+            hosts.setdefault(h, {"panel_id": None, "verify": True})
+    for h in pnl._norm_subdomains(_CFG_SUB_DOMAINS):
+        hosts.setdefault(h, {"panel_id": None, "verify": True})
+    return hosts
+
+
+async def _probe(host: str, verify: bool, sem: asyncio.Semaphore) -> dict:
+    async with sem:
+        started = time.monotonic()
+        try:
+            async with httpx.AsyncClient(timeout=DOMAIN_PROBE_TIMEOUT_SEC, verify=verify) as client:
+                resp = await client.get(f"https://{host}/")
+            latency = (time.monotonic() - started) * 1000.0
+            # هر پاسخ HTTP (حتی 404) یعنی TLS و سرور در دسترس است؛ فقط 5xx خطا حساب می‌شود
+            if resp.status_code >= 500:
+                return {"ok": False, "latency_ms": latency, "error": f"HTTP {resp.status_code}"}
+            return {"ok": True, "latency_ms": latency, "error": None}
+        except Exception as e:
+            return {"ok": False, "latency_ms": None, "error": f"{type(e).__name__}: {e}"[:200]}
+
+
+async def probe_all() -> List[dict]:
+    """probe همزمان همه هاست‌ها و ذخیره نتیجه (EWMA تأخیر، شمارش خطاهای پشت سر هم)."""
+    global _cache_at
+    hosts = configured_hosts()
+    if not hosts:
+        return []
+    previous = db.get_domain_health()
+    sem = asyncio.Semaphore(_PROBE_CONCURRENCY)
+    names = list(hosts)
+    results = await asyncio.gather(*(_probe(h, hosts[h]["verify"], sem) for h in names))
+
+    rows = []
+    for host, res in zip(names, results):
+        prev = previous.get(host) or {}
+        latency = res["latency_ms"]
+        if res["ok"] and prev.get("latency_ms") is not None:
+            latency = _EWMA_ALPHA * latency + (1 - _EWMA_ALPHA) * float(prev["latency_ms"])
+        elif not res["ok"]:
+            latency = prev.get("latency_ms")
+        rows.append({
+            "host": host,
+            "panel_id": hosts[host]["panel_id"],
+            "ok": res["ok"],
+            "latency_ms": round(latency, 1) if latency is not None else None,
+            "consecutive_failures": 0 if res["ok"] else int(prev.get("consecutive_failures") or 0) + 1,
+            "last_error": res["error"],
+        })
+    db.save_domain_health(rows)
+    db.delete_domain_health_except(names)
+    _cache_at = 0.0
+    return rows
+
+
+def _health_map() -> Dict[str, dict]:
+    global _cache, _cache_at
+    now = time.monotonic()
+    if now - _cache_at > _CACHE_TTL_SEC:
+        try:
+            _cache = db.get_domain_health()
+        except Exception as e:
+            logger.debug("domain_health read failed: %s", e)
+            _cache = {}
+        _cache_at = now
+    return _cache
+
+
+def host_weights(hosts: List[str]) -> Dict[str, float]:
+    """وزن انتخاب هر هاست؛ 0 = حذف‌شده. هاست بدون داده وزن متوسط هاست‌های سالم را می‌گیرد."""
+    health = _health_map()
+    weights: Dict[str, Optional[float]] = {}
+    for h in hosts:
+        row = health.get(h)
+        if row is None:
+            weights[h] = None
+        elif int(row.get("consecutive_failures") or 0) >= DOMAIN_FAIL_THRESHOLD:
+            weights[h] = 0.0
+        elif row.get("latency_ms") is None:
+            weights[h] = None
+        else:
+            weights[h] = 1.0 / (float(row["latency_ms"]) + _LATENCY_FLOOR_MS)
+    known = [w for w in weights.values() if w]
+    default = (sum(known) / len(known)) if known else 1.0
+    return {h: (default if w is None else w) for h, w in weights.items()}
+
+
+def pick_host(hosts: List[str]) -> str:
+    """انتخاب وزن‌دار؛ اگر همه هاست‌ها ناسالم باشند، انتخاب یکنواخت (لینک بهتر از بدون لینک)."""
+    hosts = [h for h in hosts if h]
+    if not hosts:
+        return ""
+    if len(hosts) == 1:
+        return hosts[0]
+    weights = host_weights(hosts)
+    candidates = [h for h in hosts if weights[h] > 0]
+    if not candidates:
+        return random.choice(hosts)
+    return random.choices(candidates, weights=[weights[h] for h in candidates], k=1)[0]
+
+
+def format_report() -> str:
+    """گزارش متنی سلامت دامنه‌ها برای ادمین (HTML)."""
+    hosts = configured_hosts()
+    health = db.get_domain_health()
+    if not hosts:
+        return "🩺 سلامت ساب‌دامین‌ها\n\nهیچ ساب‌دامینی تنظیم نشده است."
+    lines = ["🩺 <b>سلامت ساب‌دامین‌ها</b>\n"]
+    by_panel: Dict[str, list] = {}
+    for h, meta in hosts.items():
+        by_panel.setdefault(meta["panel_id"] or "تنظیمات عمومی", []).append(h)
+    for panel_id, items in by_panel.items():
+        lines.append(f"\n<b>{panel_id}</b>")
+        weights = host_weights(items)
+        total_w = sum(weights.values()) or 1.0
+        for h in items:
+            row = health.get(h)
+            if not row:
+                lines.append(f"⚪️ <code>{h}</code> — هنوز بررسی نشده")
+                continue
+            fails = int(row.get("consecutive_failures") or 0)
+            icon = "🟢" if row.get("ok") else ("🔴" if fails >= DOMAIN_FAIL_THRESHOLD else "🟠")
+            lat = f"{row['latency_ms']:.0f}ms" if row.get("latency_ms") is not None else "—"
+            share = 100.0 * weights.get(h, 0.0) / total_w
+            line = f"{icon} <code>{h}</code> — {lat} | سهم انتخاب {share:.0f}%"
+            if not row.get("ok"):
+                err = str(row.get("last_error") or "").replace("<", "&lt;").replace(">", "&gt;")
+                line += f"\n      خطا ({fails}x): {err[:80]}"
+            lines.append(line)
+    checked = [r.get("checked_at") for r in health.values() if r.get("checked_at")]
+    if checked:
+        lines.append(f"\nآخرین بررسی: {max(checked)}")
+    return "\n".join(lines)
+
+
+async def domain_health_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        rows = await probe_all()
+        bad = [r["host"] for r in rows if not r["ok"]]
+        if bad:
+            logger.warning("Sub-domain probe: %d/%d failing: %s", len(bad), len(rows), ", ".join(bad))
+    except Exception as e:
+        logger.error("domain_health_job failed: %s", e, exc_info=True)
@@ -0,0 +1,171 @@
+# filename: bot/executors.py
+# -*- coding: utf-8 -*-
+"""
+سرویس مشترک اجرای کارهای سنگین خارج از event loop.
+
+- run_cpu: کارهای CPU-bound (مثل رندر QR) در ProcessPool
+- run_io:  کارهای IO مسدودکننده (integrity_check، VACUUM INTO، فشرده‌سازی فایل) در ThreadPool
+
+هر pool صف محدود دارد (Semaphore)؛ اگر صف پر بماند، فراخوانی بعد از timeout با ExecutorBusy خطا می‌دهد.
+توابعی که به run_cpu داده می‌شوند باید top-level و picklable باشند.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+try:
+    from config import EXECUTOR_CPU_WORKERS
+except Exception:
+    EXECUTOR_CPU_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+try:
+    from config import EXECUTOR_IO_WORKERS
+except Exception:
+    EXECUTOR_IO_WORKERS = 4
+
+try:
+    from config import EXECUTOR_QUEUE_SIZE
+except Exception:
+    EXECUTOR_QUEUE_SIZE = 64
+
+try:
+    from config import EXECUTOR_QUEUE_TIMEOUT_SEC
+except Exception:
+    EXECUTOR_QUEUE_TIMEOUT_SEC = 30.0
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusy(RuntimeError):
+    """صف pool پر است و در زمان مقرر جایی آزاد نشد."""
+
+
+class _Pool:
+    def __init__(self, name: str, kind: str, workers: int, queue_size: int):
+        self.name = name
+        self.kind = kind
+        self.workers = max(1, int(workers))
+        self.capacity = self.workers + max(0, int(queue_size))
+        self._executor = None
+        self._sem: asyncio.Semaphore | None = None
+        # metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.waiting = 0
+        self.running = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: امن‌تر از fork وقتی پروسه اصلی چند thread دارد
+                ctx = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"exec-{self.name}")
+        return self._executor
+
+    def _get_sem(self) -> asyncio.Semaphore:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.capacity)
+        return self._sem
+
+    async def run(self, fn, *args, **kwargs):
+        sem = self._get_sem()
+        self.submitted += 1
+        self.waiting += 1
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(sem.acquire(), timeout=EXECUTOR_QUEUE_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ExecutorBusy(f"{self.name} pool is full")
+        finally:
+            self.waiting -= 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            call = partial(fn, *args, **kwargs) if kwargs else partial(fn, *args)
+            fut = loop.run_in_executor(self._get_executor(), call)
+            self.running += 1
+            started = time.monotonic()
+            try:
+                result = await fut
+            finally:
+                self.running -= 1
+                # wait = زمان انتظار در صف تا شروع اجرا (تقریبی: تا تحویل به executor)
+                waited = started - t0
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            sem.release()
+
+    def metrics(self) -> dict:
+        done = self.completed + self.failed
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "queue_depth": self.waiting + max(0, self.running - self.workers),
+            "running": self.running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round((self.wait_total / done) * 1000, 1) if done else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 1),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            try:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            except Exception as e:
+                logger.debug("executor %s shutdown error: %s", self.name, e)
+            self._executor = None
+        self._sem = None
+
+
+_cpu_pool = _Pool("cpu", "process", EXECUTOR_CPU_WORKERS, EXECUTOR_QUEUE_SIZE)
+_io_pool = _Pool("io", "thread", EXECUTOR_IO_WORKERS, EXECUTOR_QUEUE_SIZE)
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """اجرای تابع CPU-bound در process pool (fn و آرگومان‌ها باید picklable باشند)."""
+    return await _cpu_pool.run(fn, *args, **kwargs)
+
+
+async def run_io(fn, *args, **kwargs):
+    """اجرای تابع IO مسدودکننده در thread pool."""
+    return await _io_pool.run(fn, *args, **kwargs)
+
+
+def get_metrics() -> dict:
+    return {"cpu": _cpu_pool.metrics(), "io": _io_pool.metrics()}
+
+
+def format_metrics() -> str:
+    lines = []
+    for name, m in get_metrics().items():
+        lines.append(
+            f"{name}: صف {m['queue_depth']} | در حال اجرا {m['running']}/{m['workers']} | "
+            f"انتظار میانگین {m['avg_wait_ms']}ms (حداکثر {m['max_wait_ms']}ms) | رد شده {m['rejected']}"
+        )
+    return "\n".join(lines)
+
+
+def shutdown():
+    _cpu_pool.shutdown()
+    _io_pool.shutdown()
@@ -1,17 +1,19 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import shutil
 import tempfile
 from datetime import datetime, timedelta
 import sqlite3
 
 from telegram.ext import ContextTypes, ConversationHandler
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest
 from telegram.constants import ParseMode
 
 from bot.utils import is_valid_sqlite
+from bot import backup_archive, executors, incremental_backup, plan_catalog
 from bot.constants import (
     CMD_CANCEL, BACKUP_MENU, ADMIN_MENU, RESTORE_UPLOAD, AWAIT_SETTING_VALUE
 )
@@ -72,6 +74,16 @@ async def backup_restore_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
     return BACKUP_MENU
 
 # ---------------- Download Backup ----------------
+def _write_snapshot(backup_path: str):
+    try:
+        # روش سریع (SQLite 3.27+)
+        with sqlite3.connect(db.DB_NAME) as conn:
+            conn.execute("VACUUM INTO ?", (backup_path,))
+    except Exception:
+        # روش جایگزین
+        with sqlite3.connect(db.DB_NAME) as src, sqlite3.connect(backup_path) as dst:
+            src.backup(dst)
+
 async def send_backup_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = getattr(update, "callback_query", None)
     if q:  # اگر از کال‌بک آمده
@@ -86,22 +98,15 @@ async def send_backup_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         db.close_db()
-        try:
-            # روش سریع (SQLite 3.27+)
-            with sqlite3.connect(db.DB_NAME) as conn:
-                conn.execute("VACUUM INTO ?", (backup_path,))
-        except Exception:
-            # روش جایگزین
-            with sqlite3.connect(db.DB_NAME) as src, sqlite3.connect(backup_path) as dst:
-                src.backup(dst)
+        await executors.run_io(_write_snapshot, backup_path)
 
         await update.effective_message.reply_text("📦 در حال ارسال فایل پشتیبان...")
-        with open(backup_path, 'rb') as f:
-            await context.bot.send_document(
-                chat_id=update.effective_user.id,
-                document=InputFile(f, filename=os.path.basename(backup_path)),
-                caption=f"پشتیبان دیتابیس - {ts}"
-            )
+        out_dir = tempfile.mkdtemp(prefix="vpnbot_ship_")
+        try:
+            paths, _ = await executors.run_io(backup_archive.pack, backup_path, out_dir)
+            await backup_archive.send_files(context.bot, update.effective_user.id, paths, f"پشتیبان دیتابیس - {ts}")
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
         # نمایش منو
         await update.effective_message.reply_text("منوی پشتیبان‌گیری:", reply_markup=_backup_menu_inline_kb())
     except Exception as e:
@@ -116,32 +121,105 @@ async def send_backup_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return BACKUP_MENU
 
 # ---------------- Restore Backup ----------------
+_PART_RE = re.compile(r"\.(gz|zst)\.\d{3}$")
+
+def _restore_kind(name: str):
+    n = (name or "").lower()
+    if n.endswith(backup_archive.MANIFEST_SUFFIX):
+        return "manifest"
+    if n.endswith(".db") or n.endswith(".sqlite3"):
+        return "sqlite"
+    if backup_archive.codec_for_name(n):
+        return "compressed"
+    if _PART_RE.search(n):
+        return "part"
+    return None
+
+def _clear_restore_parts(context: ContextTypes.DEFAULT_TYPE):
+    d = context.user_data.pop('restore_parts_dir', None)
+    context.user_data.pop('restore_parts', None)
+    context.user_data.pop('restore_manifest', None)
+    if d:
+        shutil.rmtree(d, ignore_errors=True)
+
 async def restore_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _clear_restore_parts(context)
     text = (
         "⚠️ هشدار: بازیابی دیتابیس تمام اطلاعات فعلی را حذف می‌کند.\n"
-        "برای ادامه، فایل SQLite با پسوند .db یا .sqlite3 را ارسال کنید."
+        "برای ادامه، فایل SQLite (.db / .sqlite3) یا بکاپ فشرده (.gz / .zst) را ارسال کنید.\n"
+        "برای بکاپ چندقطعه‌ای، همه قطعه‌ها و فایل manifest.json را (به هر ترتیب) بفرستید."
     )
     await _send_or_edit(update, text, reply_markup=_back_to_backup_kb(), parse_mode=ParseMode.HTML)
     return RESTORE_UPLOAD
 
+async def _receive_part(em, context: ContextTypes.DEFAULT_TYPE, doc, kind: str, dl_path: str):
+    """قطعه/manifest را نگه می‌دارد؛ وقتی همه رسیدند، فایل بازسازی‌شده در dl_path نوشته و True برمی‌گردد."""
+    parts_dir = context.user_data.get('restore_parts_dir')
+    if not parts_dir:
+        parts_dir = context.user_data['restore_parts_dir'] = tempfile.mkdtemp(prefix="restore_parts_")
+    name = os.path.basename(doc.file_name)
+    local = os.path.join(parts_dir, name)
+    f = await doc.get_file()
+    await f.download_to_drive(local)
+
+    if kind == "manifest":
+        context.user_data['restore_manifest'] = local
+    else:
+        context.user_data.setdefault('restore_parts', {})[name] = local
+
+    manifest_path = context.user_data.get('restore_manifest')
+    if not manifest_path:
+        await em.reply_text(f"📦 قطعه {name} دریافت شد. قطعه‌های بعدی و فایل manifest را ارسال کنید.")
+        return False
+    manifest = backup_archive.read_manifest(manifest_path)
+    parts = context.user_data.get('restore_parts', {})
+    missing = backup_archive.missing_parts(manifest, parts)
+    if missing:
+        await em.reply_text(f"📦 دریافت شد. {len(missing)} قطعه باقی مانده: {', '.join(missing[:5])}")
+        return False
+
+    await em.reply_text("⏳ در حال بررسی و بازسازی فایل پشتیبان...")
+    await executors.run_io(backup_archive.unpack, manifest, parts, dl_path)
+    _clear_restore_parts(context)
+    return True
+
 async def restore_receive_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     em = update.effective_message
     doc = em.document
-    if not doc or not (doc.file_name.endswith('.db') or doc.file_name.endswith('.sqlite3')):
-        await em.reply_text("❌ فرمت فایل نامعتبر است. لطفاً یک فایل .db یا .sqlite3 ارسال کنید.", reply_markup=_backup_menu_inline_kb())
+    kind = _restore_kind(doc.file_name) if doc else None
+    if kind is None:
+        await em.reply_text("❌ فرمت فایل نامعتبر است. لطفاً یک فایل .db، .sqlite3، .gz، .zst یا قطعه/manifest بکاپ ارسال کنید.", reply_markup=_backup_menu_inline_kb())
         return BACKUP_MENU
 
     tmp_dir = tempfile.gettempdir()
     dl_path = os.path.join(tmp_dir, f"restore_{doc.file_unique_id}.sqlite3")
 
     try:
-        f = await doc.get_file()
-        await f.download_to_drive(dl_path)
+        if kind in ("part", "manifest"):
+            if not await _receive_part(em, context, doc, kind, dl_path):
+                return RESTORE_UPLOAD
+        elif kind == "compressed":
+            packed = dl_path + backup_archive.CODEC_EXT[backup_archive.codec_for_name(doc.file_name.lower())]
+            f = await doc.get_file()
+            await f.download_to_drive(packed)
+            try:
+                await executors.run_io(backup_archive.decompress_file, packed, dl_path)
+            finally:
+                if os.path.exists(packed):
+                    os.remove(packed)
+        else:
+            f = await doc.get_file()
+            await f.download_to_drive(dl_path)
     except Exception as e:
+        _clear_restore_parts(context)
         await em.reply_text(f"❌ خطا در دریافت فایل: {e}", reply_markup=_backup_menu_inline_kb())
         return BACKUP_MENU
 
-    if not is_valid_sqlite(dl_path):
+    try:
+        valid = await executors.run_io(is_valid_sqlite, dl_path)
+    except executors.ExecutorBusy:
+        valid = False
+    if not valid:
         await em.reply_text("❌ فایل ارسالی یک دیتابیس SQLite معتبر نیست.", reply_markup=_backup_menu_inline_kb())
         try:
             if os.path.exists(dl_path):
@@ -173,6 +251,7 @@ async def admin_confirm_restore_callback(update: Update, context: ContextTypes.D
         db.close_db()
         shutil.move(path, db.DB_NAME)
         db.init_db()
+        plan_catalog.invalidate()
         await q.edit_message_text(
             "✅ دیتابیس با موفقیت بازیابی شد.\n\nبرای اعمال کامل تغییرات، ربات را ری‌استارت کنید.",
             reply_markup=_backup_menu_inline_kb(),
@@ -192,6 +271,7 @@ async def admin_confirm_restore_callback(update: Update, context: ContextTypes.D
 async def admin_cancel_restore_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
+    _clear_restore_parts(context)
     path = context.user_data.get('restore_path')
     if path and os.path.exists(path):
         try:
@@ -206,10 +286,12 @@ async def admin_cancel_restore_callback(update: Update, context: ContextTypes.DE
 async def edit_auto_backup_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     current_interval = db.get_setting("auto_backup_interval_hours") or "24"
     current_target = db.get_setting("backup_target_chat_id") or "ادمین اصلی"
+    mode_label = "افزایشی" if incremental_backup.mode() == "incremental" else "کامل"
 
     rows = [
         [InlineKeyboardButton(f"🕒 بازه فعلی: {current_interval}h", callback_data="edit_backup_interval")],
         [InlineKeyboardButton(f"🎯 مقصد فعلی: {current_target}", callback_data="edit_backup_target")],
+        [InlineKeyboardButton(f"🧩 نوع بکاپ: {mode_label}", callback_data="toggle_backup_mode")],
         [InlineKeyboardButton("🔙 بازگشت به منوی پشتیبان‌گیری", callback_data="back_to_backup_menu")]
     ]
     await _send_or_edit(update, "⚙️ تنظیمات پشتیبان‌گیری خودکار:", reply_markup=_kb(rows))
@@ -238,8 +320,8 @@ async def set_backup_interval(update: Update, context: ContextTypes.DEFAULT_TYPE
         db.set_setting("auto_backup_interval_hours", str(hours))
 
         from bot import jobs
-        # حذف جاب قبلی و برنامه‌ریزی مجدد
-        if context.application.job_queue:
+        # حذف جاب قبلی و برنامه‌ریزی مجدد (در حالت worker، job_worker.py تغییر تنظیم را خودش اعمال می‌کند)
+        if context.application.job_queue and jobs.JOB_RUNNER_MODE != "worker":
             for job in context.application.job_queue.jobs():
                 if job.name == 'auto_backup_job':
                     job.schedule_removal()
@@ -258,6 +340,12 @@ async def set_backup_interval(update: Update, context: ContextTypes.DEFAULT_TYPE
         await q.edit_message_text(f"❌ خطا در ذخیره تنظیم: {e}")
     return BACKUP_MENU
 
+async def toggle_backup_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # کامل: هر بار VACUUM INTO کل دیتابیس | افزایشی: پایه دوره‌ای + فقط صفحه‌های تغییرکرده
+    new_mode = "full" if incremental_backup.mode() == "incremental" else "incremental"
+    db.set_setting("backup_mode", new_mode)
+    return await edit_auto_backup_start(update, context)
+
 async def edit_backup_target_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
@@ -1,6 +1,7 @@
 # filename: bot/handlers/admin/panels_admin.py
 # -*- coding: utf-8 -*-
 
+import html
 import json
 import logging
 from typing import Dict, List, Optional
@@ -10,8 +11,9 @@ from telegram.error import BadRequest
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
 
-from bot.ui import btn, nav_row, markup  # همه دکمه‌ها شیشه‌ای (Inline)
+from bot.ui import btn, nav_row, markup, confirm_row  # همه دکمه‌ها شیشه‌ای (Inline)
 from bot import panels as pnl
+from bot import domain_health, reconcile
 import database as db
 
 logger = logging.getLogger(__name__)
@@ -131,6 +133,8 @@ async def panels_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 btn("🗑️ حذف", f"panel_del_{p.get('id')}")
             ])
     rows.append([btn("➕ افزودن پنل جدید", "panel_add")])
+    rows.append([btn("🩺 سلامت ساب‌دامین‌ها", "panel_health")])
+    rows.append([btn("🧮 تطبیق ربات با پنل‌ها", "panel_reconcile")])
     # ناوبری زیر
     rows.append([btn("⬅️ بازگشت به مدیریت پلن‌ها", "admin_plans"), btn("🏠 منوی ادمین", "admin_panel")])
 
@@ -146,6 +150,91 @@ async def panels_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return PANELS_MENU
 
 
+# ---------- Sub-domain health ----------
+
+async def show_domain_health(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    وضعیت سلامت/تأخیر ساب‌دامین‌ها (نتیجه آخرین probe) و سهم هر کدام در انتخاب لینک.
+    panel_health_probe: اجرای فوری probe.
+    """
+    q = update.callback_query
+    await q.answer()
+    if q.data == "panel_health_probe":
+        try:
+            await q.message.edit_text("⏳ در حال بررسی ساب‌دامین‌ها...")
+        except BadRequest:
+            pass
+        try:
+            await domain_health.probe_all()
+        except Exception as e:
+            logger.error("Manual domain probe failed: %s", e, exc_info=True)
+
+    text = domain_health.format_report()
+    kb = markup([
+        [btn("🔄 بررسی اکنون", "panel_health_probe")],
+        [btn("⬅️ بازگشت", "admin_panels")],
+    ])
+    try:
+        await q.message.edit_text(text, reply_markup=kb, parse_mode=ParseMode.HTML)
+    except BadRequest:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text, reply_markup=kb, parse_mode=ParseMode.HTML)
+    return PANELS_MENU
+
+
+# ---------- DB <-> panel reconciliation ----------
+
+async def reconcile_fix_ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """panel_reconcile_fix: تأیید قبل از حذف سرویس‌های یتیم."""
+    q = update.callback_query
+    await q.answer()
+    count = context.user_data.get("reconcile_orphans")
+    text = (
+        "آیا از حذف سرویس‌هایی که در پنل وجود ندارند مطمئن هستید؟\n"
+        + (f"در آخرین تطبیق {count} مورد یافت شد. " if count is not None else "")
+        + "تطبیق دوباره اجرا می‌شود و به کاربران این سرویس‌ها اطلاع داده می‌شود."
+    )
+    kb = markup([confirm_row("panel_reconcile_fix_yes", "panel_reconcile", yes_text="✅ بلی، حذف شود")])
+    await q.message.edit_text(text, reply_markup=kb)
+    return PANELS_MENU
+
+
+async def show_reconcile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    panel_reconcile: تطبیق فوری و فقط گزارش.
+    panel_reconcile_fix_yes: (بعد از تأیید) تطبیق و حذف سرویس‌هایی که در پنل وجود ندارند.
+    """
+    q = update.callback_query
+    await q.answer()
+    apply = q.data == "panel_reconcile_fix_yes"
+    try:
+        await q.message.edit_text("⏳ در حال دریافت لیست کاربران پنل‌ها و تطبیق...")
+    except BadRequest:
+        pass
+    try:
+        results = await reconcile.run(context.bot, apply=apply)
+        parts = reconcile.format_report_parts(results, apply)
+        context.user_data["reconcile_orphans"] = sum(len(r.get("db_orphans") or []) for r in results)
+    except Exception as e:
+        logger.error("Manual reconcile failed: %s", e, exc_info=True)
+        parts = [html.escape(f"❌ تطبیق ناموفق بود: {e}")]
+    kb = markup([
+        [btn("🔄 تطبیق دوباره", "panel_reconcile"), btn("🧹 حذف سرویس‌های یتیم", "panel_reconcile_fix")],
+        [btn("⬅️ بازگشت", "admin_panels")],
+    ])
+    # بخش اول جای پیام «در حال ...»؛ بقیه پیام جدید و کیبورد زیر آخرین بخش
+    first_kb = kb if len(parts) == 1 else None
+    try:
+        await q.message.edit_text(parts[0], reply_markup=first_kb, parse_mode=ParseMode.HTML)
+    except BadRequest:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=parts[0], reply_markup=first_kb, parse_mode=ParseMode.HTML)
+    for i, part in enumerate(parts[1:], start=2):
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id, text=part,
+            reply_markup=kb if i == len(parts) else None, parse_mode=ParseMode.HTML,
+        )
+    return PANELS_MENU
+
+
 # ---------- Cancel (go back to panels menu) ----------
 
 async def panel_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -12,6 +12,7 @@ from bot.constants import (
     EDIT_PLAN_NAME, EDIT_PLAN_PRICE, EDIT_PLAN_DAYS, EDIT_PLAN_GB, EDIT_PLAN_CATEGORY,
 )
 import database as db
+from bot import plan_catalog
 
 
 # ---------- Inline UI builders ----------
@@ -248,6 +249,7 @@ async def plan_category_received(update: Update, context: ContextTypes.DEFAULT_T
         context.user_data['plan_gb'],
         context.user_data['plan_category']
     )
+    plan_catalog.invalidate()
     await update.message.reply_text("✅ پلن جدید با موفقیت اضافه شد.", reply_markup=ReplyKeyboardRemove())
     # برگشت به منوی شیشه‌ای
     await update.message.reply_text("🧩 بخش مدیریت پلن‌ها", reply_markup=_plan_menu_inline())
@@ -371,6 +373,7 @@ async def finish_plan_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("هیچ تغییری اعمال نشد.", reply_markup=ReplyKeyboardRemove())
     else:
         db.update_plan(plan_id, new_data)
+        plan_catalog.invalidate()
         await update.message.reply_text("✅ پلن با موفقیت به‌روزرسانی شد!", reply_markup=ReplyKeyboardRemove())
 
     await update.message.reply_text("🧩 بخش مدیریت پلن‌ها", reply_markup=_plan_menu_inline())
@@ -393,6 +396,7 @@ async def admin_delete_plan_callback(update: Update, context: ContextTypes.DEFAU
         return PLAN_MENU
 
     res = db.delete_plan_safe(plan_id)
+    plan_catalog.invalidate()
     if res is None:
         await _send_or_edit(update, context, "❌ حذف پلن ناموفق بود. لطفاً بعداً تلاش کنید.", reply_markup=_inline_back_to_plan_menu(), parse_mode=None)
         return PLAN_MENU
@@ -427,6 +431,7 @@ async def admin_toggle_plan_visibility_callback(update: Update, context: Context
         return PLAN_MENU
 
     db.toggle_plan_visibility(plan_id)
+    plan_catalog.invalidate()
     # کارت را رفرش کن
     p = db.get_plan(plan_id)
     if not p:
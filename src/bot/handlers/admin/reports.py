@@ -74,6 +74,26 @@ async def show_stats_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"💰 مجموع فروش: {float(stats.get('total_revenue', 0.0)):,.0f} تومان\n"
         f"🚫 کاربران مسدود: {int(stats.get('banned_users', 0)):,}"
     )
+    try:
+        from bot import executors
+        text += "\n\n⚙️ صف پردازش پس‌زمینه:\n" + executors.format_metrics()
+    except Exception:
+        pass
+    try:
+        from bot import update_processor
+        text += "\n" + update_processor.format_metrics()
+    except Exception:
+        pass
+    try:
+        from bot import antiflood
+        text += "\n" + antiflood.format_stats()
+    except Exception:
+        pass
+    try:
+        from bot import db_maintenance
+        text += "\n" + db_maintenance.format_stats()
+    except Exception:
+        pass
     kb = _back_to_reports_kb()
     try:
         if q:
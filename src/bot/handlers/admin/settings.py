@@ -10,7 +10,7 @@ from telegram.constants import ParseMode
 from telegram.error import BadRequest
 
 import database as db
-from bot import utils
+from bot import utils, plan_catalog
 from bot.constants import ADMIN_MENU, AWAIT_SETTING_VALUE, ADMIN_SETTINGS_MENU, GIFT_CODES_MENU
 from bot.keyboards import get_admin_menu_keyboard
 from bot.ui import nav_row, btn
@@ -259,6 +259,7 @@ async def toggle_global_discount(update: Update, context: ContextTypes.DEFAULT_T
             db.set_setting("global_discount_expires_at", "")
     else:
         db.set_setting("global_discount_enabled", "0")
+    plan_catalog.invalidate()
     return await global_discount_submenu(update, context)
 
 # --- Edit/Save Setting value ---
@@ -367,6 +368,9 @@ async def setting_value_received(update: Update, context: ContextTypes.DEFAULT_T
         else:
             db.set_setting("global_discount_expires_at", "")
 
+    if key in plan_catalog.SETTING_KEYS:
+        plan_catalog.invalidate()
+
     await update.message.reply_text(f"✅ مقدار «{key}» ذخیره شد.")
     dest = context.user_data.pop('settings_return_to', None) or _infer_return_target(key)
     context.user_data.pop('editing_setting_key', None)
@@ -382,7 +386,8 @@ async def setting_value_received(update: Update, context: ContextTypes.DEFAULT_T
 
 # --- Toggles/Back ---
 async def toggle_maintenance(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    _toggle("maintenance_enabled"); return await maintenance_and_join_submenu(update, context)
+    _toggle("maintenance_enabled"); plan_catalog.invalidate()
+    return await maintenance_and_join_submenu(update, context)
 
 async def toggle_force_join(update: Update, context: ContextTypes.DEFAULT_TYPE):
     _toggle("force_join_enabled"); return await maintenance_and_join_submenu(update, context)
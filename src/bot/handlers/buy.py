@@ -9,14 +9,14 @@ from typing import Optional
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram import (
     Update, InlineKeyboardButton, InlineKeyboardMarkup,
-    ReplyKeyboardRemove, InputFile
+    ReplyKeyboardRemove
 )
 from telegram.constants import ParseMode
 from telegram.error import BadRequest
 
 import database as db
 import hiddify_api
-from bot import utils
+from bot import utils, qr_cache, plan_catalog
 from bot.constants import GET_CUSTOM_NAME, CMD_CANCEL, CMD_SKIP, PROMO_CODE_ENTRY
 from bot.keyboards import get_main_menu_keyboard
 from bot import panels as pnl  # Multi-panel support
@@ -38,55 +38,17 @@ CB_CANCEL = "buy_cancel"
 
 
 def _maint_on() -> bool:
-    val = db.get_setting("maintenance_enabled")
-    return str(val).lower() in ("1", "true", "on", "yes")
+    return plan_catalog.maintenance()[0]
 
 
 def _maint_msg() -> str:
-    return db.get_setting("maintenance_message") or "⛔️ ربات در حال بروزرسانی است. لطفاً کمی بعد مراجعه کنید."
+    return plan_catalog.maintenance()[1]
 
 
 def _short_price(price: float) -> str:
     return utils.format_toman(price, persian_digits=True)
 
 
-def _vol_label(gb: int) -> str:
-    g = int(gb)
-    return "نامحدود" if g == 0 else f"{utils.to_persian_digits(str(g))} گیگ"
-
-
-def _is_global_discount_active(now: datetime | None = None) -> tuple[bool, float]:
-    enabled = str(db.get_setting("global_discount_enabled") or "0").lower() in ("1", "true", "on", "yes")
-    try:
-        percent = float(db.get_setting("global_discount_percent") or 0)
-    except Exception:
-        percent = 0.0
-    starts = utils.parse_date_flexible(db.get_setting("global_discount_starts_at")) if db.get_setting("global_discount_starts_at") else None
-    expires = utils.parse_date_flexible(db.get_setting("global_discount_expires_at")) if db.get_setting("global_discount_expires_at") else None
-
-    if not enabled or percent <= 0:
-        return False, 0.0
-    now = now or datetime.now().astimezone()
-    if starts and now < starts:
-        return False, 0.0
-    if expires and now > expires:
-        return False, 0.0
-    return True, percent
-
-
-def _short_label(p: dict) -> str:
-    name = (p.get('name') or 'پلن')[:18]
-    days = int(p.get('days', 0))
-    gb = int(p.get('gb', 0))
-    vol = _vol_label(gb)
-    price_str = _short_price(p.get('price', 0))
-    days_fa = utils.to_persian_digits(str(days))
-    gd_active, gd_percent = _is_global_discount_active()
-    off_tag = f" | {int(gd_percent)}٪ آف" if gd_active and gd_percent > 0 else ""
-    label = f"{name} | {days_fa} روز | {vol} | {price_str}{off_tag}"
-    return label[:62] + "…" if len(label) > 63 else label
-
-
 def _calc_promo_discount(user_id: int, plan_price: float, promo_code_in: str | None) -> tuple[int, str]:
     if not promo_code_in:
         return 0, ""
@@ -116,7 +78,7 @@ async def buy_service_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if _maint_on():
         await send_func(_maint_msg())
         return
-    categories = db.get_plan_categories()
+    categories = plan_catalog.categories()
     if not categories:
         await send_func("در حال حاضر پلنی برای خرید موجود نیست.")
         return
@@ -135,12 +97,12 @@ async def show_plans_in_category(update: Update, context: ContextTypes.DEFAULT_T
     q = update.callback_query
     await q.answer()
     category = q.data.replace("user_cat_", "")
-    plans = db.list_plans(only_visible=True, category=category)
+    plans = plan_catalog.plan_buttons(category)
     if not plans:
         await q.edit_message_text("در این دسته‌بندی پلنی یافت نشد.")
         return
     text = f"پلن‌های دسته‌بندی «{category}»:"
-    kb = [[InlineKeyboardButton(_short_label(p), callback_data=f"user_buy_{p['plan_id']}")] for p in plans]
+    kb = [[InlineKeyboardButton(label, callback_data=f"user_buy_{plan_id}")] for plan_id, label in plans]
     kb.append([InlineKeyboardButton("🔙 بازگشت به دسته‌بندی‌ها", callback_data="back_to_cats")])
     await q.edit_message_text(text, reply_markup=InlineKeyboardMarkup(kb))
 
@@ -202,7 +164,7 @@ async def buy_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         await q.answer("شناسه پلن نامعتبر است.", show_alert=True)
         return ConversationHandler.END
-    plan = db.get_plan(plan_id)
+    plan = plan_catalog.get_plan(plan_id)
     if not plan or not plan.get('is_visible', 1):
         await q.answer("این پلن در دسترس نیست.", show_alert=True)
         return ConversationHandler.END
@@ -326,7 +288,7 @@ async def skip_promo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def _ask_purchase_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE, custom_name: str):
     user_id = update.effective_user.id
-    plan = db.get_plan(context.user_data.get('buy_plan_id'))
+    plan = plan_catalog.get_plan(context.user_data.get('buy_plan_id'))
     if not plan:
         try:
             await context.bot.send_message(chat_id=user_id, text="❌ پلن نامعتبر است.", reply_markup=get_main_menu_keyboard(user_id))
@@ -335,7 +297,7 @@ async def _ask_purchase_confirm(update: Update, context: ContextTypes.DEFAULT_TY
         return ConversationHandler.END
 
     base_price = int(plan['price'])
-    gd_active, gd_percent = _is_global_discount_active()
+    gd_active, gd_percent = plan_catalog.global_discount()
     gd_amount = int(round(base_price * (gd_percent / 100.0))) if (gd_active and gd_percent > 0) else 0
     price_after_global = max(0, base_price - gd_amount)
 
@@ -364,7 +326,7 @@ async def _ask_purchase_confirm(update: Update, context: ContextTypes.DEFAULT_TY
     text = f"""🛒 تایید خرید سرویس
 نام سرویس: {custom_name or '(بدون نام)'}
 مدت: {utils.to_persian_digits(str(plan['days']))} روز
-حجم: {_vol_label(plan['gb'])}
+حجم: {plan_catalog.vol_label(plan['gb'])}
 {chr(10).join(lines)}
 با تایید، مبلغ از کیف‌پول شما کسر شده و سرویس بلافاصله ساخته می‌شود.""".strip()
 
@@ -426,7 +388,7 @@ async def cancel_purchase_callback(update: Update, context: ContextTypes.DEFAULT
 async def _do_purchase_confirmed(q, context: ContextTypes.DEFAULT_TYPE, custom_name: str):
     user_id, username = q.from_user.id, q.from_user.username
     data = context.user_data.get('pending_buy')
-    if not data or not (plan := db.get_plan(data.get('plan_id'))):
+    if not data or not (plan := plan_catalog.get_plan(data.get('plan_id'))):
         await q.edit_message_text("❌ پلن انتخاب‌شده نامعتبر است.")
         return
 
@@ -497,7 +459,6 @@ async def _send_service_info_to_user(context, user_id, new_uuid, plan):
         # لینک با توجه به پنل سرویس
         final_link = utils.build_subscription_url(new_uuid, name=config_name, plan_gb=int(plan['gb']), panel=panel)
 
-        qr_bio = utils.make_qr_bytes(final_link)
         caption = utils.create_service_info_caption(
             user_data, service_db_record=new_service_record, title="🎉 سرویس شما فعال شد", override_sub_url=final_link
         )
@@ -505,8 +466,8 @@ async def _send_service_info_to_user(context, user_id, new_uuid, plan):
             [InlineKeyboardButton("📚 راهنمای اتصال", callback_data="guide_connection"),
              InlineKeyboardButton("📋 سرویس‌های من", callback_data="back_to_services")]
         ])
-        await context.bot.send_photo(
-            chat_id=user_id, photo=InputFile(qr_bio), caption=caption, parse_mode=ParseMode.MARKDOWN, reply_markup=inline_kb
+        await qr_cache.send_qr_photo(
+            context.bot, user_id, final_link, caption=caption, parse_mode=ParseMode.MARKDOWN, reply_markup=inline_kb
         )
         await context.bot.send_message(chat_id=user_id, text="منوی اصلی:", reply_markup=get_main_menu_keyboard(user_id))
     else:
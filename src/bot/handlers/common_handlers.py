@@ -4,6 +4,7 @@
 from __future__ import annotations
 
 import re
+import time
 import logging
 from functools import wraps
 from typing import Callable, Awaitable, Optional, Tuple
@@ -15,8 +16,19 @@ from telegram.constants import ChatMemberStatus
 
 import database as db
 
+try:
+    from config import MEMBERSHIP_CACHE_TTL_POSITIVE, MEMBERSHIP_CACHE_TTL_NEGATIVE
+except Exception:
+    MEMBERSHIP_CACHE_TTL_POSITIVE = 900
+    MEMBERSHIP_CACHE_TTL_NEGATIVE = 20
+
 logger = logging.getLogger(__name__)
 
+# (channel_key, user_id) -> (is_member, expires_at)
+_membership_cache: dict[tuple[str, int], tuple[bool, float]] = {}
+_MEMBERSHIP_CACHE_MAX = 50000
+_MEMBER_STATUSES = (ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.MEMBER)
+
 
 def _get_bool_setting(key: str, default: bool = False) -> bool:
     v = db.get_setting(key)
@@ -78,10 +90,62 @@ def _parse_force_join_target(raw: str | None) -> Tuple[Optional[str], Optional[s
     return None, None
 
 
+def _channel_key(chat_id: str | int) -> str:
+    return str(chat_id).strip().lower()
+
+
+def _cache_membership(chat_key: str, user_id: int, is_member: bool) -> None:
+    ttl = MEMBERSHIP_CACHE_TTL_POSITIVE if is_member else MEMBERSHIP_CACHE_TTL_NEGATIVE
+    if len(_membership_cache) >= _MEMBERSHIP_CACHE_MAX:
+        now = time.monotonic()
+        for k in [k for k, (_, exp) in _membership_cache.items() if exp <= now]:
+            _membership_cache.pop(k, None)
+        if len(_membership_cache) >= _MEMBERSHIP_CACHE_MAX:
+            _membership_cache.clear()
+    _membership_cache[(chat_key, int(user_id))] = (bool(is_member), time.monotonic() + ttl)
+
+
+def invalidate_membership(user_id: int, chat_id: str | int | None = None) -> None:
+    """حذف نتیجه کش‌شده عضویت کاربر (برای یک کانال یا همه کانال‌ها)."""
+    if chat_id is not None:
+        _membership_cache.pop((_channel_key(chat_id), int(user_id)), None)
+        return
+    for k in [k for k in _membership_cache if k[1] == int(user_id)]:
+        _membership_cache.pop(k, None)
+
+
+async def _is_user_member_cached(context: ContextTypes.DEFAULT_TYPE, chat_id: str | int, user_id: int) -> bool:
+    key = (_channel_key(chat_id), int(user_id))
+    hit = _membership_cache.get(key)
+    if hit is not None and hit[1] > time.monotonic():
+        return hit[0]
+    is_member = await _is_user_member(context, chat_id, user_id)
+    _cache_membership(key[0], user_id, is_member)
+    return is_member
+
+
+async def on_chat_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    به‌روزرسانی کش از آپدیت‌های chat_member (فقط وقتی ربات ادمین کانال باشد ارسال می‌شوند).
+    """
+    cm = update.chat_member
+    if not cm or not cm.new_chat_member or not cm.chat:
+        return
+    member = cm.new_chat_member
+    status = getattr(member, "status", None)
+    is_member = status in _MEMBER_STATUSES or (
+        status == ChatMemberStatus.RESTRICTED and getattr(member, "is_member", False)
+    )
+    user_id = member.user.id
+    _cache_membership(_channel_key(cm.chat.id), user_id, is_member)
+    if cm.chat.username:
+        _cache_membership(_channel_key(f"@{cm.chat.username}"), user_id, is_member)
+
+
 async def _is_user_member(context: ContextTypes.DEFAULT_TYPE, chat_id: str | int, user_id: int) -> bool:
     """
     چک عضویت کاربر:
-      - True اگر status در {creator, administrator, member} یا ChatMemberRestricted با is_member=True
+      - True اگر status در {owner, administrator, member} یا ChatMemberRestricted با is_member=True
       - False در غیر این صورت
     نکات:
       - برای کانال خصوصی، Bot باید ادمین باشد؛ در غیر این صورت ممکن است Forbidden/BadRequest بدهد.
@@ -90,7 +154,7 @@ async def _is_user_member(context: ContextTypes.DEFAULT_TYPE, chat_id: str | int
         member = await context.bot.get_chat_member(chat_id, user_id)
         status = getattr(member, "status", None)
         # PTB v20: status رشته است؛ ChatMemberRestricted دارای is_member
-        if status in (ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.MEMBER):
+        if status in _MEMBER_STATUSES:
             return True
         # Restricted ولی عضو است
         if status == ChatMemberStatus.RESTRICTED and getattr(member, "is_member", False):
@@ -167,7 +231,12 @@ def check_channel_membership(handler: Callable[[Update, ContextTypes.DEFAULT_TYP
             if not user_id:
                 return  # آپدیت نامعتبر
 
-            is_member = await _is_user_member(context, chat_id, user_id)
+            q = getattr(update, "callback_query", None)
+            if q and q.data == "check_membership":
+                # کاربر صراحتاً درخواست بررسی مجدد داده است
+                invalidate_membership(user_id, chat_id)
+
+            is_member = await _is_user_member_cached(context, chat_id, user_id)
             if is_member:
                 return await handler(update, context)
 
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import asyncio
 from datetime import datetime
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram import Update, InlineKeyboardMarkup
@@ -10,7 +9,7 @@ from telegram.error import BadRequest
 from telegram.constants import ParseMode
 
 import database as db
-import hiddify_api
+from bot import usage_snapshot
 from bot.keyboards import get_main_menu_keyboard, get_admin_menu_keyboard
 from bot.constants import ADMIN_MENU
 from bot.handlers.charge import _get_payment_info_text
@@ -22,8 +21,32 @@ try:
 except ImportError:
     jdatetime = None
 
+try:
+    from config import ACCOUNT_SNAPSHOT_MAX_AGE_SEC
+except Exception:
+    ACCOUNT_SNAPSHOT_MAX_AGE_SEC = None
+
+try:
+    from config import USAGE_UPDATE_INTERVAL_MIN
+except Exception:
+    USAGE_UPDATE_INTERVAL_MIN = 10
+
 logger = logging.getLogger(__name__)
 
+
+def _snapshot_max_age() -> int:
+    """
+    حداکثر سن snapshot مصرف (ثانیه) قبل از رفرش زنده: مقدار config یا در نبود آن دو برابر فاصله
+    job مصرف (usage_update_interval_min)، تا snapshot هر دوره عادی کهنه حساب نشود.
+    """
+    if ACCOUNT_SNAPSHOT_MAX_AGE_SEC:
+        return int(ACCOUNT_SNAPSHOT_MAX_AGE_SEC)
+    try:
+        interval_min = int(db.get_setting("usage_update_interval_min") or USAGE_UPDATE_INTERVAL_MIN or 10)
+    except Exception:
+        interval_min = USAGE_UPDATE_INTERVAL_MIN or 10
+    return 2 * 60 * max(1, interval_min)
+
 # --- Helpers for long messages ---
 MAX_TG_TEXT = 4096
 
@@ -65,43 +88,37 @@ async def _send_long_text(
             disable_web_page_preview=disable_web_page_preview
         )
 
-# --- Helpers for accurate total usage (live from panel) ---
-async def _get_service_usage_gb(sub_uuid: str) -> float:
-    try:
-        info = await hiddify_api.get_user_info(sub_uuid)
-        if info and isinstance(info, dict):
-            val = info.get("current_usage_GB")
-            try:
-                return float(val or 0.0)
-            except Exception:
-                return 0.0
-    except Exception:
-        return 0.0
-    return 0.0
+# --- Account usage: snapshot first, live refresh only when stale ---
+def _account_text(user_id: int, user: dict, services_count: int, referral_count: int,
+                  join_date_jalali: str, total_usage_gb: float, age_sec, refreshing: bool) -> str:
+    age_line = usage_snapshot.format_age(age_sec)
+    if refreshing:
+        age_line += " (در حال بروزرسانی…)"
+    return (
+        f"👤 **اطلاعات حساب شما**\n\n"
+        f"▫️ شناسه عددی: `{user_id}`\n"
+        f"▫️ موجودی کیف پول: **{user['balance']:.0f} تومان**\n"
+        f"▫️ تعداد سرویس‌های فعال: **{services_count}**\n"
+        f"▫️ مصرف کل: **{total_usage_gb:.2f} GB**\n"
+        f"▫️ بروزرسانی مصرف: {age_line}\n"
+        f"▫️ تعداد دوستان دعوت‌شده: **{referral_count}**\n"
+        f"▫️ تاریخ عضویت: **{join_date_jalali}**"
+    )
 
-async def _compute_total_usage_gb(user_id: int) -> float:
-    """
-    مجموع مصرف واقعی کاربر را با فراخوانی پنل برای هر سرویس فعال محاسبه می‌کند.
-    در صورت عدم دسترسی به پنل، به مقدار اسنپ‌شات DB (user_traffic) برمی‌گردد.
-    """
-    services = db.get_user_services(user_id) or []
-    if not services:
-        return 0.0
-    coros = [_get_service_usage_gb(s["sub_uuid"]) for s in services if s.get("sub_uuid")]
-    if not coros:
-        return 0.0
-    results = await asyncio.gather(*coros, return_exceptions=True)
-    total = 0.0
-    for r in results:
-        if isinstance(r, (int, float)):
-            total += float(r)
-    if total > 0.0:
-        return total
-    # Fallback به اسنپ‌شات دیتابیس
+async def _refresh_account_message(message, render, user_id: int, reply_markup):
+    """رفرش زنده از پنل در پس‌زمینه و ویرایش همان پیام."""
     try:
-        return db.get_total_user_traffic(user_id)
-    except Exception:
-        return 0.0
+        await usage_snapshot.refresh_user_services(user_id)
+    except Exception as e:
+        logger.warning("Account live refresh failed for user %s: %s", user_id, e)
+    try:
+        total, age, _ = usage_snapshot.snapshot_summary(user_id)
+        await message.edit_text(render(total, age, False), reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            logger.debug("Account message edit failed for user %s: %s", user_id, e)
+    except Exception as e:
+        logger.debug("Account message edit failed for user %s: %s", user_id, e)
 
 # --- End helpers ---
 
@@ -167,15 +184,15 @@ async def show_account_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['guide_origin'] = 'account'
 
     user = db.get_or_create_user(user_id)
-    services_count = len(db.get_user_services(user_id))
     referral_count = db.get_user_referral_count(user_id)
     join_date = user.get('join_date', 'N/A')
 
-    # مصرف کل کاربر: ابتدا از پنل (دقیق)، در صورت عدم دسترسی fallback به اسنپ‌شات DB
+    # مصرف کل از snapshot دیتابیس (بدون انتظار برای پنل)؛ رفرش زنده فقط اگر snapshot کهنه باشد
     try:
-        total_usage_gb = await _compute_total_usage_gb(user_id)
+        total_usage_gb, age_sec, services_count = usage_snapshot.snapshot_summary(user_id)
     except Exception:
-        total_usage_gb = 0.0
+        total_usage_gb, age_sec, services_count = 0.0, None, len(db.get_user_services(user_id))
+    stale = services_count > 0 and (age_sec is None or age_sec > _snapshot_max_age())
 
     join_date_jalali = "N/A"
     if jdatetime and join_date != "N/A":
@@ -185,15 +202,10 @@ async def show_account_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception:
             pass
 
-    text = (
-        f"👤 **اطلاعات حساب شما**\n\n"
-        f"▫️ شناسه عددی: `{user_id}`\n"
-        f"▫️ موجودی کیف پول: **{user['balance']:.0f} تومان**\n"
-        f"▫️ تعداد سرویس‌های فعال: **{services_count}**\n"
-        f"▫️ مصرف کل: **{total_usage_gb:.2f} GB**\n"
-        f"▫️ تعداد دوستان دعوت‌شده: **{referral_count}**\n"
-        f"▫️ تاریخ عضویت: **{join_date_jalali}**"
-    )
+    def render(total, age, refreshing):
+        return _account_text(user_id, user, services_count, referral_count, join_date_jalali, total, age, refreshing)
+
+    text = render(total_usage_gb, age_sec, stale)
 
     keyboard = [
         [btn("📊 مصرف من", "acc_usage"), btn("💳 شارژ حساب", "acc_start_charge")],
@@ -202,15 +214,22 @@ async def show_account_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [btn("📚 منوی راهنما", "guide_back_to_menu")],  # از اینجا باز شود، باید Back به همین صفحه داشته باشد
         nav_row(home_cb="home_menu")
     ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
 
     if update.callback_query:
         await update.callback_query.answer()
         try:
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.MARKDOWN)
+            message = await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
         except Exception:
-            await context.bot.send_message(user_id, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.MARKDOWN)
+            message = await context.bot.send_message(user_id, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
     else:
-        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.MARKDOWN)
+        message = await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+    if stale and hasattr(message, "edit_text"):
+        context.application.create_task(
+            _refresh_account_message(message, render, user_id, reply_markup),
+            update=update,
+        )
 
 
 async def show_purchase_history_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -3,13 +3,13 @@
 
 import logging
 from telegram.ext import ContextTypes
-from telegram import Update, InputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.error import BadRequest
 from telegram.constants import ParseMode
 
 import database as db
 import hiddify_api
-from bot import utils
+from bot import utils, qr_cache
 
 # Optional multi-server configs (safe defaults if not present in config.py)
 try:
@@ -133,7 +133,6 @@ async def get_trial_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 # توجه: build_subscription_url پارامتر server_name ندارد؛ از plan_gb برای انتخاب دامنه مناسب استفاده می‌کنیم.
                 sub_url = utils.build_subscription_url(new_uuid, name=config_name, plan_gb=int(round(trial_gb)))
 
-            qr_bio = utils.make_qr_bytes(sub_url)
             caption = utils.create_service_info_caption(
                 user_data,
                 service_db_record=new_service_record,
@@ -147,9 +146,10 @@ async def get_trial_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 ]
             ])
 
-            await context.bot.send_photo(
-                chat_id=user_id,
-                photo=InputFile(qr_bio),
+            await qr_cache.send_qr_photo(
+                context.bot,
+                user_id,
+                sub_url,
                 caption=caption,
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=inline_kb
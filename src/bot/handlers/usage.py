@@ -2,16 +2,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-import asyncio
 import logging
 from typing import List, Tuple
 
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
 from telegram.ext import ContextTypes
 
-import database as db
-import hiddify_api
-from bot import utils
+from bot import utils, usage_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -24,66 +21,46 @@ def _format_gb(val: float) -> str:
     return utils.to_persian_digits(f"{f:.2f}")
 
 
-def _now_local_str() -> str:
-    from datetime import datetime
-    s = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    return utils.to_persian_digits(s)
-
-
-async def _fetch_service_usage(service: dict) -> Tuple[int, str, float]:
-    """
-    خروجی: (service_id, name, current_usage_GB)
-    اگر تماس پنل شکست بخورد، مقدار 0.0 برمی‌گرداند.
-    """
-    sid = int(service.get("service_id"))
-    name = service.get("name") or "سرویس"
-    uuid = service.get("sub_uuid")
-    usage = 0.0
+def _usage_webapp_url() -> str | None:
     try:
-        info = await hiddify_api.get_user_info(uuid)
-        if isinstance(info, dict):
-            usage = float(info.get("current_usage_GB") or 0.0)
-    except Exception as e:
-        logger.warning("Failed to fetch usage for service %s (uuid=%s): %s", sid, uuid, e)
-    return sid, name, usage
+        from bot import webapp_stats
+        return webapp_stats.public_url("/miniapp/usage")
+    except Exception:
+        return None
 
 
 async def _build_usage_text(user_id: int) -> Tuple[str, InlineKeyboardMarkup]:
     """
-    نمایش «مصرف زنده» به تفکیک سرویس (نه نود).
-    مجموع و تفکیک هر دو از پنل خوانده می‌شود.
-    در صورت خطا، مقدار هر سرویس صفر در نظر گرفته می‌شود.
+    نمایش مصرف به تفکیک سرویس از snapshot دیتابیس (service_state)؛ بدون تماس با پنل.
+    snapshot توسط job دوره‌ای update_user_usage_snapshot به‌روز می‌شود.
     """
-    services = db.get_user_services(user_id) or []
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton("🔄 بروزرسانی", callback_data="acc_usage_refresh")],
-        [InlineKeyboardButton("⬅️ بازگشت", callback_data="acc_back_to_main")]
-    ])
-
-    if not services:
+    rows_kb = [[InlineKeyboardButton("🔄 بروزرسانی", callback_data="acc_usage_refresh")]]
+    url = _usage_webapp_url()
+    if url:
+        rows_kb.insert(0, [InlineKeyboardButton("📈 داشبورد مصرف", web_app=WebAppInfo(url=url))])
+    rows_kb.append([InlineKeyboardButton("⬅️ بازگشت", callback_data="acc_back_to_main")])
+    kb = InlineKeyboardMarkup(rows_kb)
+
+    rows = usage_snapshot.service_rows(user_id)
+    if not rows:
         text = "📊 مصرف اینترنت شما\n\nدر حال حاضر سرویس فعالی ندارید."
         return text, kb
 
-    coros = [_fetch_service_usage(s) for s in services if s.get("sub_uuid")]
-    results = await asyncio.gather(*coros, return_exceptions=False)
-
-    # مرتب‌سازی بر اساس مصرف نزولی
-    results_sorted = sorted(results, key=lambda x: float(x[2] or 0.0), reverse=True)
-
-    total = sum(float(r[2] or 0.0) for r in results_sorted)
-    total_str = _format_gb(total)
-
+    total = sum(float(r["usage_gb"] or 0.0) for r in rows)
     per_service_lines: List[str] = []
-    for _, name, usage in results_sorted:
-        per_service_lines.append(f"• {name}: { _format_gb(usage) } GB")
+    for r in rows:
+        if r["updated_at"] is None:
+            per_service_lines.append(f"• {r['name']}: در انتظار اولین بروزرسانی")
+        else:
+            per_service_lines.append(f"• {r['name']}: {_format_gb(r['usage_gb'])} GB")
 
+    ages = [r["age_sec"] for r in rows if r["age_sec"] is not None]
     text = (
-        "📊 مصرف اینترنت شما (زنده از پنل)\n\n"
-        f"مجموع مصرف: {total_str} GB\n\n"
+        "📊 مصرف اینترنت شما\n\n"
+        f"مجموع مصرف: {_format_gb(total)} GB\n\n"
         "تفکیک بر اساس سرویس:\n"
         f"{chr(10).join(per_service_lines)}\n\n"
-        f"آخرین بروزرسانی: {_now_local_str()}\n"
-        "(برای بروزرسانی زنده، دکمه زیر را بزنید)"
+        f"آخرین بروزرسانی: {usage_snapshot.format_age(max(ages) if ages else None)}"
     )
 
     return text, kb
@@ -91,7 +68,7 @@ async def _build_usage_text(user_id: int) -> Tuple[str, InlineKeyboardMarkup]:
 
 async def show_usage_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    نمایش مصرف تجمیعی کاربر + تفکیک به ازای هر سرویس (زنده از پنل).
+    نمایش مصرف تجمیعی کاربر + تفکیک به ازای هر سرویس (از snapshot دیتابیس).
     از Message (📊 مصرف من) و Callback (🔄 بروزرسانی) پشتیبانی می‌کند.
     """
     user_id = update.effective_user.id
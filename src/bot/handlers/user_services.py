@@ -15,7 +15,7 @@ from telegram.constants import ParseMode
 
 import database as db
 import hiddify_api
-from bot import utils
+from bot import utils, qr_cache, plan_catalog, antiflood, usage_snapshot
 from bot.ui import nav_row, markup, chunk, btn, confirm_row
 from bot import panels as pnl  # Multi-panel support
 
@@ -25,6 +25,11 @@ except ImportError:
     ADMIN_ID = None
     HIDDIFY_API_VERIFY_SSL = True
 
+try:
+    from config import SERVICE_DETAILS_FRESH_SEC
+except Exception:
+    SERVICE_DETAILS_FRESH_SEC = 30
+
 logger = logging.getLogger(__name__)
 
 
@@ -56,6 +61,11 @@ def _same_user(a, b) -> bool:
         return str(a) == str(b)
 
 
+async def _panel_info(user_uuid: str, panel):
+    """get_user_info با ادغام درخواست‌های همزمان برای یک uuid."""
+    return await antiflood.coalesce(f"info:{user_uuid}", lambda: hiddify_api.get_user_info(user_uuid, panel=panel))
+
+
 async def list_my_services(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     services = db.get_user_services(user_id)
@@ -80,8 +90,38 @@ async def view_service_callback(update: Update, context: ContextTypes.DEFAULT_TY
             await q.message.delete()
         except BadRequest:
             pass
-    msg = await context.bot.send_message(chat_id=q.from_user.id, text="در حال دریافت اطلاعات سرویس... ⏳")
-    await send_service_details(context, q.from_user.id, service_id, original_message=msg, is_from_menu=True)
+    with antiflood.busy(f"svc:{service_id}"):
+        msg = await context.bot.send_message(chat_id=q.from_user.id, text="در حال دریافت اطلاعات سرویس... ⏳")
+        await send_service_details(context, q.from_user.id, service_id, original_message=msg, is_from_menu=True)
+
+
+def _details_keyboard(service: dict, plan: dict | None, is_from_menu: bool):
+    keyboard_rows = [
+        [
+            btn("🔄 به‌روزرسانی اطلاعات", f"refresh_{service['service_id']}"),
+            btn("🔗 لینک‌های بیشتر", f"more_links_{service['sub_uuid']}"),
+        ],
+    ]
+    if plan:
+        keyboard_rows.append([btn(f"⏳ تمدید سرویس ({int(plan['price']):,} تومان)", f"renew_{service['service_id']}")])
+    keyboard_rows.append([btn("🗑️ حذف سرویس", f"delete_service_{service['service_id']}")])
+    if is_from_menu:
+        keyboard_rows.append(nav_row(back_cb="back_to_services", home_cb="home_menu"))
+    return markup(keyboard_rows)
+
+
+def _not_found_view(service: dict):
+    kb = [
+        [btn("🗑️ حذف سرویس از ربات", f"delete_service_{service['service_id']}")],
+        [btn("🔄 تلاش مجدد", f"refresh_{service['service_id']}")],
+        nav_row(back_cb="back_to_services", home_cb="home_menu")
+    ]
+    text = "❌ اطلاعات این سرویس در پنل یافت نشد. احتمالاً حذف شده است.\nمی‌خواهید این سرویس از ربات هم حذف شود؟"
+    return text, markup(kb)
+
+
+def _details_caption(info: dict, service: dict, sub_url: str) -> str:
+    return utils.create_service_info_caption(info, service_db_record=service, title="اطلاعات سرویس شما", override_sub_url=sub_url)
 
 
 async def send_service_details(
@@ -89,8 +129,14 @@ async def send_service_details(
     chat_id: int,
     service_id: int,
     original_message: Message | None = None,
-    is_from_menu: bool = False
+    is_from_menu: bool = False,
+    force_live: bool = False
 ):
+    """
+    جزئیات سرویس. اگر آخرین وضعیت پنل در service_state باشد، همان فوراً (با برچسب زمان) نمایش داده می‌شود
+    و وضعیت زنده در پس‌زمینه گرفته می‌شود؛ caption فقط در صورت تغییر ویرایش می‌شود.
+    بدون snapshot یا با force_live (دکمه به‌روزرسانی)، منتظر پاسخ پنل می‌ماند.
+    """
     service = db.get_service(service_id)
     if not service:
         text = "❌ سرویس مورد نظر یافت نشد."
@@ -115,25 +161,32 @@ async def send_service_details(
     try:
         # پنل صحیح را از روی لینک سرویس پیدا کن
         panel = pnl.find_panel_for_link(service.get('sub_link') or "")
-        info = await hiddify_api.get_user_info(service['sub_uuid'], panel=panel)
-
-        if not info or (isinstance(info, dict) and info.get('_not_found')):
-            kb = [
-                [btn("🗑️ حذف سرویس از ربات", f"delete_service_{service['service_id']}")],
-                [btn("🔄 تلاش مجدد", f"refresh_{service['service_id']}")],
-                nav_row(back_cb="back_to_services", home_cb="home_menu")
-            ]
-            text = "❌ اطلاعات این سرویس در پنل یافت نشد. احتمالاً حذف شده است.\nمی‌خواهید این سرویس از ربات هم حذف شود؟"
-            if original_message:
-                await original_message.edit_text(text, reply_markup=markup(kb))
+
+        state = db.get_service_state(service_id)
+        cached = state.get("info") if state else None
+        age = usage_snapshot.age_seconds(state.get("updated_at")) if state else None
+        if cached and not cached.get('_not_found') and not force_live:
+            info = cached
+        else:
+            info = await _panel_info(service['sub_uuid'], panel)
+            if not info and cached and not cached.get('_not_found'):
+                info = cached  # پنل در دسترس نیست؛ همان snapshot با برچسب زمان
             else:
-                await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=markup(kb))
-            return
+                age = None
+            if not info or (isinstance(info, dict) and info.get('_not_found')):
+                text, kb = _not_found_view(service)
+                if original_message:
+                    await original_message.edit_text(text, reply_markup=kb)
+                else:
+                    await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=kb)
+                return
+            if isinstance(info, dict) and info is not cached:
+                db.upsert_service_states([(service_id, service['user_id'], info)])
 
         config_name = (info.get('name', 'config') if isinstance(info, dict) else 'config') or 'config'
 
         # انتخاب دامنه بر اساس تنظیمات ادمین و نوع پلن (حجمی/نامحدود)
-        plan = db.get_plan(service['plan_id']) if service.get('plan_id') else None
+        plan = plan_catalog.get_plan(service['plan_id']) if service.get('plan_id') else None
         plan_gb = int(plan['gb']) if plan and 'gb' in plan else None
         preferred_url = utils.build_subscription_url(
             service['sub_uuid'],
@@ -142,33 +195,31 @@ async def send_service_details(
             panel=panel  # Multi-panel: لینک از پنل مربوطه
         )
 
-        caption = utils.create_service_info_caption(info, service_db_record=service, title="اطلاعات سرویس شما", override_sub_url=preferred_url)
-        keyboard_rows = [
-            [
-                btn("🔄 به‌روزرسانی اطلاعات", f"refresh_{service['service_id']}"),
-                btn("🔗 لینک‌های بیشتر", f"more_links_{service['sub_uuid']}"),
-            ],
-        ]
-        if plan:
-            keyboard_rows.append([btn(f"⏳ تمدید سرویس ({int(plan['price']):,} تومان)", f"renew_{service['service_id']}")])
-        keyboard_rows.append([btn("🗑️ حذف سرویس", f"delete_service_{service['service_id']}")])
-        if is_from_menu:
-            keyboard_rows.append(nav_row(back_cb="back_to_services", home_cb="home_menu"))
-
-        qr_bio = utils.make_qr_bytes(preferred_url)
+        body = _details_caption(info, service, preferred_url)
+        caption = body
+        if info is cached:
+            caption += f"\n\n🕒 داده ذخیره‌شده ({usage_snapshot.format_age(age)})"
+        reply_markup = _details_keyboard(service, plan, is_from_menu)
+
         if original_message:
             try:
                 await original_message.delete()
             except BadRequest:
                 pass
 
-        await context.bot.send_photo(
-            chat_id=chat_id,
-            photo=InputFile(qr_bio),
+        msg = await qr_cache.send_qr_photo(
+            context.bot,
+            chat_id,
+            preferred_url,
             caption=caption,
             parse_mode=ParseMode.MARKDOWN,
-            reply_markup=markup(keyboard_rows)
+            reply_markup=reply_markup
         )
+
+        if info is cached and (age is None or age > SERVICE_DETAILS_FRESH_SEC) and msg:
+            context.application.create_task(
+                _revalidate_details(context.bot, msg, service, panel, preferred_url, caption, reply_markup)
+            )
     except Exception as e:
         logger.error("send_service_details error for service_id %s: %s", service_id, e, exc_info=True)
         text = "❌ خطا در دریافت اطلاعات سرویس. لطفاً بعداً دوباره تلاش کنید."
@@ -178,6 +229,41 @@ async def send_service_details(
             await context.bot.send_message(chat_id=chat_id, text=text)
 
 
+async def _revalidate_details(bot, message: Message, service: dict, panel, sub_url: str, shown_caption: str, reply_markup):
+    """
+    دریافت وضعیت زنده پس از نمایش snapshot؛ caption با داده زنده (بدون برچسب «داده ذخیره‌شده») ویرایش
+    می‌شود، مگر اینکه دقیقاً همان متن نمایش‌داده‌شده باشد.
+    svc: را busy نمی‌کند: پیام snapshot قبلاً نمایش داده شده و کاربر ممکن است آن را ببندد و دوباره
+    همین سرویس را باز کند (درخواست‌های همزمان پنل با _panel_info ادغام می‌شوند).
+    """
+    service_id = service['service_id']
+    try:
+        info = await _panel_info(service['sub_uuid'], panel)
+    except Exception as e:
+        logger.warning("Revalidate service %s failed: %s", service_id, e)
+        return
+    if not isinstance(info, dict) or not info:
+        return
+    try:
+        # بدون QR (pool پر بود) پیام متنی است و متن ویرایش می‌شود نه caption
+        edit, field = (bot.edit_message_caption, "caption") if message.photo else (bot.edit_message_text, "text")
+        target = {"chat_id": message.chat_id, "message_id": message.message_id}
+        if info.get('_not_found'):
+            text, kb = _not_found_view(service)
+            await edit(**target, **{field: text}, reply_markup=kb)
+            return
+        db.upsert_service_states([(service_id, service['user_id'], info)])
+        body = _details_caption(info, service, sub_url)
+        if body == shown_caption:
+            return
+        await edit(**target, **{field: body}, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    except BadRequest as e:
+        # پیام توسط کاربر حذف/جایگزین شده
+        logger.debug("Revalidate edit skipped for service %s: %s", service_id, e)
+    except Exception as e:
+        logger.warning("Revalidate service %s failed: %s", service_id, e)
+
+
 async def more_links_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
@@ -224,7 +310,7 @@ async def get_link_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Multi-panel: panel مناسب را پیدا کن
     panel = pnl.find_panel_for_link(service.get('sub_link') or "")
 
-    info = await hiddify_api.get_user_info(user_uuid, panel=panel)
+    info = await _panel_info(user_uuid, panel)
     config_name = (info.get('name', 'config') if isinstance(info, dict) else 'config') or 'config'
 
     # حالت full: مسیر …/<uuid>/all.txt (بدون suffix نوع لینک)
@@ -257,7 +343,7 @@ async def get_link_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # سایر انواع لینک: بر اساس تنظیمات ادمین + نوع پلن و پنل صحیح
-    plan = db.get_plan(service['plan_id']) if service.get('plan_id') else None
+    plan = plan_catalog.get_plan(service['plan_id']) if service.get('plan_id') else None
     plan_gb = int(plan['gb']) if plan and 'gb' in plan else None
     final_link = utils.build_subscription_url(
         user_uuid,
@@ -296,8 +382,9 @@ async def refresh_service_details(update: Update, context: ContextTypes.DEFAULT_
         await q.message.delete()
     except BadRequest:
         pass
-    msg = await context.bot.send_message(chat_id=q.from_user.id, text="در حال به‌روزرسانی اطلاعات...")
-    await send_service_details(context, q.from_user.id, service_id, original_message=msg, is_from_menu=True)
+    with antiflood.busy(f"svc:{service_id}"):
+        msg = await context.bot.send_message(chat_id=q.from_user.id, text="در حال به‌روزرسانی اطلاعات...")
+        await send_service_details(context, q.from_user.id, service_id, original_message=msg, is_from_menu=True, force_live=True)
 
 
 async def back_to_services_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -380,7 +467,7 @@ async def renew_service_handler(update: Update, context: ContextTypes.DEFAULT_TY
     if not service or not _same_user(service['user_id'], user_id):
         await context.bot.send_message(chat_id=user_id, text="❌ سرویس نامعتبر است یا متعلق به شما نیست.")
         return
-    plan = db.get_plan(service['plan_id']) if service.get('plan_id') else None
+    plan = plan_catalog.get_plan(service['plan_id']) if service.get('plan_id') else None
     if not plan:
         await context.bot.send_message(chat_id=user_id, text="❌ پلن تمدید یافت نشد.")
         return
@@ -392,7 +479,7 @@ async def renew_service_handler(update: Update, context: ContextTypes.DEFAULT_TY
     # Multi-panel: پنل این سرویس
     panel = pnl.find_panel_for_link(service.get('sub_link') or "")
 
-    info = await hiddify_api.get_user_info(service['sub_uuid'], panel=panel)
+    info = await _panel_info(service['sub_uuid'], panel)
     if not info:
         await context.bot.send_message(chat_id=user_id, text="❌ دریافت اطلاعات از پنل ممکن نیست.")
         return
@@ -435,7 +522,7 @@ async def proceed_with_renewal(update: Update, context: ContextTypes.DEFAULT_TYP
             pass
 
     service = db.get_service(service_id)
-    plan = db.get_plan(plan_id)
+    plan = plan_catalog.get_plan(plan_id)
     if not service or not plan or not _same_user(service['user_id'], user_id):
         await _send_renewal_error(original_message, "❌ اطلاعات سرویس یا پلن نامعتبر است.")
         return
@@ -466,6 +553,9 @@ async def proceed_with_renewal(update: Update, context: ContextTypes.DEFAULT_TYP
             raise ValueError("Panel verification failed")
 
         db.finalize_renewal_transaction(txn_id, plan_id)
+        # snapshot تازه تا صفحه جزئیات وضعیت قبل از تمدید را نشان ندهد
+        if isinstance(new_info, dict):
+            db.upsert_service_states([(service_id, service['user_id'], new_info)])
 
         if original_message:
             try:
@@ -0,0 +1,321 @@
+# filename: bot/incremental_backup.py
+# -*- coding: utf-8 -*-
+"""
+پشتیبان‌گیری افزایشی در سطح صفحه (page) دیتابیس SQLite.
+
+- base: کپی خام فایل دیتابیس؛ همزمان hash هر صفحه در pages.idx (پوشه backups/incremental) ذخیره می‌شود.
+- delta: فقط صفحه‌هایی که hash آن‌ها نسبت به بکاپ قبلی عوض شده (+ تعداد صفحه جدید و sha256 نتیجه).
+  اگر چیزی تغییر نکرده باشد فایلی ساخته نمی‌شود.
+- restore(base, deltas, out): base را کپی و delta ها را به ترتیب seq اعمال می‌کند و sha256 نهایی را می‌سنجد.
+
+خواندن فایل در یک تراکنش خواندنی انجام می‌شود که بلافاصله بعد از wal_checkpoint(TRUNCATE) و با WAL خالی
+شروع شده است؛ تا پایان آن تراکنش checkpoint نمی‌تواند فایل اصلی را تغییر دهد، پس صفحه‌ها سازگارند.
+وضعیت جدید (index) تا commit_pending() (بعد از ارسال موفق) اعمال نمی‌شود؛ اگر ارسال شکست بخورد،
+delta بعدی تغییرات همین دوره را هم شامل می‌شود. در حالت worker ارسال فقط یعنی ثبت در admin_outbox؛
+شناسه ردیف‌ها در state زنجیره می‌مانند و اگر یکی هرگز ارسال نشود، بکاپ بعدی base جدید می‌گیرد (force_base).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import database as db
+
+try:
+    from config import BACKUP_MODE
+except Exception:
+    BACKUP_MODE = "full"
+
+try:
+    from config import BACKUP_FULL_EVERY
+except Exception:
+    BACKUP_FULL_EVERY = 24
+
+try:
+    from config import BACKUP_DELTA_MAX_RATIO
+except Exception:
+    BACKUP_DELTA_MAX_RATIO = 0.5
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"VBDELTA1"
+DELTA_EXT = ".vbd"
+STATE_DIR = "incremental"
+_DIGEST = 16
+_PGNO = struct.Struct(">I")
+_HDR_LEN = struct.Struct(">I")
+_FREEZE_ATTEMPTS = 5
+
+
+def mode() -> str:
+    v = str(db.get_setting("backup_mode") or BACKUP_MODE or "full").strip().lower()
+    return v if v in ("full", "incremental") else "full"
+
+
+def _digest(page: bytes) -> bytes:
+    return hashlib.blake2b(page, digest_size=_DIGEST).digest()
+
+
+@contextmanager
+def _frozen_db(db_path: str):
+    """(فایل باز دیتابیس، page_size) در حالی که محتوای فایل اصلی ثابت و برابر آخرین commit است."""
+    conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+    try:
+        page_size = int(conn.execute("PRAGMA page_size").fetchone()[0])
+        wal = db_path + "-wal"
+        for _ in range(_FREEZE_ATTEMPTS):
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            conn.execute("BEGIN")
+            conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            # WAL خالی یعنی snapshot این تراکنش همان فایل اصلی است (در حالت غیر WAL قفل SHARED کافی است)
+            if not os.path.exists(wal) or os.path.getsize(wal) == 0:
+                with open(db_path, "rb") as f:
+                    yield f, page_size
+                conn.execute("COMMIT")
+                return
+            conn.execute("ROLLBACK")
+            time.sleep(0.2)
+        raise RuntimeError("WAL could not be checkpointed (busy writers)")
+    finally:
+        conn.close()
+
+
+def _state_paths(backup_dir: str) -> Tuple[str, str]:
+    d = os.path.join(backup_dir, STATE_DIR)
+    os.makedirs(d, exist_ok=True)
+    return os.path.join(d, "state.json"), os.path.join(d, "pages.idx")
+
+
+def _load_state(backup_dir: str) -> Tuple[Optional[dict], bytes]:
+    state_path, idx_path = _state_paths(backup_dir)
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        with open(idx_path, "rb") as f:
+            index = f.read()
+    except (OSError, ValueError):
+        return None, b""
+    if len(index) != state.get("page_count", -1) * _DIGEST:
+        logger.warning("Incremental backup: page index does not match state; a new base will be taken")
+        return None, b""
+    return state, index
+
+
+def queued_outbox_ids(backup_dir: str) -> List[int]:
+    """شناسه ردیف‌های admin_outbox فایل‌های زنجیره فعلی (فقط در حالت worker پر می‌شود)."""
+    state_path, _ = _state_paths(backup_dir)
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return [int(i) for i in json.load(f).get("outbox_ids") or []]
+    except (OSError, ValueError, TypeError):
+        return []
+
+
+def _stage_state(backup_dir: str, state: dict, index: bytes) -> None:
+    state_path, idx_path = _state_paths(backup_dir)
+    with open(idx_path + ".pending", "wb") as f:
+        f.write(index)
+    with open(state_path + ".pending", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def commit_pending(backup_dir: str, outbox_ids: Optional[List[int]] = None) -> None:
+    """
+    بعد از ارسال موفق فایل: وضعیت جدید جایگزین وضعیت قبلی می‌شود.
+    outbox_ids (فایل‌های صف‌شده در حالت worker) به شناسه‌های قبلی همان زنجیره اضافه می‌شوند.
+    """
+    state_path, idx_path = _state_paths(backup_dir)
+    if not (os.path.exists(state_path + ".pending") and os.path.exists(idx_path + ".pending")):
+        return
+    with open(state_path + ".pending", "r", encoding="utf-8") as f:
+        new_state = json.load(f)
+    old_state, _ = _load_state(backup_dir)
+    ids = queued_outbox_ids(backup_dir) if old_state and old_state.get("base") == new_state.get("base") else []
+    ids += [int(i) for i in outbox_ids or []]
+    if ids:
+        new_state["outbox_ids"] = ids
+        with open(state_path + ".pending", "w", encoding="utf-8") as f:
+            json.dump(new_state, f)
+    os.replace(idx_path + ".pending", idx_path)
+    os.replace(state_path + ".pending", state_path)
+
+
+def discard_pending(backup_dir: str) -> None:
+    for p in _state_paths(backup_dir):
+        try:
+            os.remove(p + ".pending")
+        except OSError:
+            pass
+
+
+def _write_base(db_path: str, backup_dir: str, ts: str) -> Tuple[str, dict]:
+    tmp = os.path.join(backup_dir, f".base_{ts}.tmp")
+    digests = bytearray()
+    sha = hashlib.sha256()
+    with _frozen_db(db_path) as (src, page_size), open(tmp, "wb") as dst:
+        while True:
+            page = src.read(page_size)
+            if not page:
+                break
+            digests += _digest(page)
+            sha.update(page)
+            dst.write(page)
+    base_id = sha.hexdigest()[:16]
+    path = os.path.join(backup_dir, f"auto_base_{ts}_{base_id}.sqlite3")
+    os.replace(tmp, path)
+    meta = {
+        "kind": "base", "base": base_id, "seq": 0, "page_size": page_size,
+        "page_count": len(digests) // _DIGEST, "sha256": sha.hexdigest(),
+        "pages": len(digests) // _DIGEST, "bytes": os.path.getsize(path),
+    }
+    _stage_state(backup_dir, {k: meta[k] for k in ("base", "seq", "page_size", "page_count")}, bytes(digests))
+    return path, meta
+
+
+def _write_delta(db_path: str, backup_dir: str, ts: str, state: dict, index: bytes) -> Tuple[Optional[str], dict]:
+    seq = int(state["seq"]) + 1
+    tmp = os.path.join(backup_dir, f".delta_{ts}.tmp")
+    digests = bytearray()
+    sha = hashlib.sha256()
+    changed = 0
+    with _frozen_db(db_path) as (src, page_size), open(tmp, "wb") as out:
+        if page_size != state["page_size"]:
+            raise ValueError("page_size changed")
+        pgno = 0
+        while True:
+            page = src.read(page_size)
+            if not page:
+                break
+            d = _digest(page)
+            off = pgno * _DIGEST
+            pgno += 1
+            digests += d
+            sha.update(page)
+            if index[off:off + _DIGEST] != d:
+                out.write(_PGNO.pack(pgno))
+                out.write(page)
+                changed += 1
+
+    page_count = len(digests) // _DIGEST
+    meta = {
+        "kind": "delta", "base": state["base"], "seq": seq, "page_size": page_size,
+        "page_count": page_count, "sha256": sha.hexdigest(), "pages": changed,
+    }
+    if changed == 0 and page_count == state["page_count"]:
+        os.remove(tmp)
+        meta["bytes"] = 0
+        return None, meta
+
+    path = os.path.join(backup_dir, f"auto_delta_{state['base']}_{seq:04d}_{ts}{DELTA_EXT}")
+    header = json.dumps({k: meta[k] for k in ("base", "seq", "page_size", "page_count", "sha256", "pages")}).encode()
+    with open(path, "wb") as f, open(tmp, "rb") as body:
+        f.write(MAGIC)
+        f.write(_HDR_LEN.pack(len(header)))
+        f.write(header)
+        shutil.copyfileobj(body, f)
+    os.remove(tmp)
+    meta["bytes"] = os.path.getsize(path)
+    _stage_state(backup_dir, {k: meta[k] for k in ("base", "seq", "page_size", "page_count")}, bytes(digests))
+    return path, meta
+
+
+def take(db_path: str, backup_dir: str, ts: str, force_base: bool = False) -> Tuple[Optional[str], dict]:
+    """
+    base یا delta بعدی را می‌سازد (در thread pool اجرا شود). (مسیر فایل یا None اگر تغییری نبوده، meta)
+    base جدید وقتی: force_base (مثلاً فایلی از زنجیره از outbox ارسال نشد)، وضعیتی نیست، BACKUP_FULL_EVERY
+    delta گرفته شده، یا delta از BACKUP_DELTA_MAX_RATIO اندازه DB بزرگ‌تر است.
+    """
+    discard_pending(backup_dir)
+    state, index = _load_state(backup_dir)
+    if force_base or state is None or int(state["seq"]) >= max(1, int(BACKUP_FULL_EVERY)):
+        return _write_base(db_path, backup_dir, ts)
+    try:
+        path, meta = _write_delta(db_path, backup_dir, ts, state, index)
+    except ValueError as e:
+        logger.info("Incremental backup: %s; taking a new base", e)
+        return _write_base(db_path, backup_dir, ts)
+    if path and meta["pages"] > BACKUP_DELTA_MAX_RATIO * max(1, meta["page_count"]):
+        os.remove(path)
+        discard_pending(backup_dir)
+        return _write_base(db_path, backup_dir, ts)
+    return path, meta
+
+
+def prune(backup_dir: str, keep_chains: int = 2) -> None:
+    """فقط base و delta های keep_chains زنجیره آخر نگه داشته می‌شوند."""
+    try:
+        bases = sorted(
+            (f for f in os.listdir(backup_dir) if f.startswith("auto_base_") and f.endswith(".sqlite3")),
+            key=lambda f: os.path.getmtime(os.path.join(backup_dir, f)),
+        )
+        keep = {f[:-len(".sqlite3")].rsplit("_", 1)[-1] for f in bases[-keep_chains:]}
+        for f in os.listdir(backup_dir):
+            if f.startswith("auto_base_") and f.endswith(".sqlite3"):
+                chain = f[:-len(".sqlite3")].rsplit("_", 1)[-1]
+            elif f.startswith("auto_delta_") and f.endswith(DELTA_EXT):
+                chain = f[len("auto_delta_"):].split("_", 1)[0]
+            else:
+                continue
+            if chain not in keep:
+                os.remove(os.path.join(backup_dir, f))
+                logger.info("Removed old incremental backup file: %s", f)
+    except Exception as e:
+        logger.error("Error pruning incremental backups: %s", e, exc_info=True)
+
+
+# -------------------- Restore --------------------
+def read_delta_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{os.path.basename(path)}: not a delta file")
+        (n,) = _HDR_LEN.unpack(f.read(_HDR_LEN.size))
+        hdr = json.loads(f.read(n).decode())
+        hdr["_offset"] = len(MAGIC) + _HDR_LEN.size + n
+    return hdr
+
+
+def _sha256_file(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def restore(base_path: str, delta_paths: List[str], out_path: str) -> dict:
+    """base + delta ها -> out_path. ترتیب با seq هدر تعیین می‌شود و زنجیره باید از 1 پیوسته باشد."""
+    base_id = _sha256_file(base_path)[:16]
+    headers = sorted((dict(read_delta_header(p), _path=p) for p in delta_paths), key=lambda h: h["seq"])
+    for i, h in enumerate(headers, start=1):
+        if h["base"] != base_id:
+            raise ValueError(f"{os.path.basename(h['_path'])}: belongs to base {h['base']}, not {base_id}")
+        if h["seq"] != i:
+            raise ValueError(f"missing delta #{i} (found #{h['seq']})")
+
+    tmp = out_path + ".tmp"
+    shutil.copyfile(base_path, tmp)
+    with open(tmp, "r+b") as out:
+        for h in headers:
+            ps = int(h["page_size"])
+            with open(h["_path"], "rb") as f:
+                f.seek(h["_offset"])
+                for _ in range(int(h["pages"])):
+                    (pgno,) = _PGNO.unpack(f.read(_PGNO.size))
+                    page = f.read(ps)
+                    if len(page) != ps:
+                        raise ValueError(f"{os.path.basename(h['_path'])}: truncated")
+                    out.seek((pgno - 1) * ps)
+                    out.write(page)
+            out.truncate(int(h["page_count"]) * ps)
+    if headers and _sha256_file(tmp) != headers[-1]["sha256"]:
+        os.remove(tmp)
+        raise ValueError("checksum mismatch after applying deltas")
+    os.replace(tmp, out_path)
+    return {"base": base_id, "deltas": len(headers), "bytes": os.path.getsize(out_path)}
@@ -6,16 +6,16 @@ import logging
 import shutil
 import os
 import sqlite3
+import tempfile
 from collections import defaultdict
 from datetime import datetime, timedelta, time
 from telegram.ext import Application, ContextTypes
 from telegram.error import Forbidden, BadRequest, RetryAfter, TimedOut, NetworkError
-from telegram import InputFile
 
 import database as db
 import hiddify_api
 from config import ADMIN_ID
-from bot.utils import get_service_status
+from bot import backup_archive, db_maintenance, domain_health, executors, incremental_backup, outbox, reconcile, retention, service_status
 from bot.handlers.admin.reports import send_daily_summary, send_weekly_summary
 
 # Optional usage aggregation configs (fallback if not present)
@@ -25,8 +25,24 @@ except Exception:
     USAGE_AGGREGATION_ENABLED = False
     USAGE_UPDATE_INTERVAL_MIN = 10
 
+# "inline" (پیش‌فرض): jobها در همین پروسس؛ "worker": در پروسس جداگانه job_worker.py
+try:
+    from config import JOB_RUNNER_MODE
+except Exception:
+    JOB_RUNNER_MODE = "inline"
+JOB_RUNNER_MODE = str(JOB_RUNNER_MODE or "inline").strip().lower()
+
+# نگهداری لایه‌ای بکاپ‌های خودکار کامل
+try:
+    from config import BACKUP_KEEP_HOURLY, BACKUP_KEEP_DAILY, BACKUP_KEEP_WEEKLY
+except Exception:
+    BACKUP_KEEP_HOURLY, BACKUP_KEEP_DAILY, BACKUP_KEEP_WEEKLY = 24, 7, 4
+
 logger = logging.getLogger(__name__)
 
+# فاصله بین ارسال یادآورها (مثل reconcile._NOTIFY_DELAY_SEC) تا به flood-limit تلگرام نخوریم
+_REMINDER_SEND_DELAY_SEC = 0.2
+
 # -------------------- Auto-backup --------------------
 async def auto_backup_job(context: ContextTypes.DEFAULT_TYPE):
     logger.info("Job: running auto-backup...")
@@ -39,52 +55,30 @@ async def auto_backup_job(context: ContextTypes.DEFAULT_TYPE):
     backup_filename = f"auto_backup_{timestamp}.sqlite3"
     backup_path = os.path.join(backup_dir, backup_filename)
 
-    manage_old_backups(backup_dir)
     target_chat_id = db.get_setting("backup_target_chat_id") or ADMIN_ID
+    if incremental_backup.mode() == "incremental":
+        await _auto_backup_incremental(context, backup_dir, timestamp, target_chat_id)
+        return
 
     db_closed = False
     try:
         db.close_db()
         db_closed = True
 
-        try:
-            # Prefer VACUUM INTO (SQLite >= 3.27)
-            version = sqlite3.sqlite_version_info
-            if version >= (3, 27, 0):
-                path_escaped = backup_path.replace("'", "''")
-                with sqlite3.connect(db.DB_NAME) as conn:
-                    conn.execute(f"VACUUM INTO '{path_escaped}'")
-                logger.info("Auto-backup: VACUUM INTO succeeded")
-            else:
-                # backup() API for older SQLite
-                with sqlite3.connect(db.DB_NAME) as src, sqlite3.connect(backup_path) as dst:
-                    src.backup(dst)
-                logger.info("Auto-backup: backup() API succeeded")
-        except Exception as e:
-            logger.error("SQLite backup methods failed (%s). Falling back to file copy.", e, exc_info=True)
-            try:
-                with sqlite3.connect(db.DB_NAME) as conn:
-                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-            except Exception:
-                pass
-            shutil.copy2(db.DB_NAME, backup_path)
-            for ext in ("-wal", "-shm"):
-                sp = db.DB_NAME + ext
-                if os.path.exists(sp):
-                    try:
-                        shutil.copy2(sp, backup_path + ext)
-                    except Exception:
-                        pass
-            logger.info("Auto-backup: file copy succeeded")
-
-        # Send file
-        with open(backup_path, "rb") as f:
-            await context.bot.send_document(
-                chat_id=target_chat_id,
-                document=InputFile(f, filename=backup_filename),
-                caption=f"پشتیبان خودکار دیتابیس - {timestamp}",
-            )
-        logger.info("Auto-backup sent to chat %s", target_chat_id)
+        await executors.run_io(_write_backup_snapshot, backup_path)
+        db.init_db()
+        db_closed = False
+
+        # فشرده و قطعه‌بندی؛ فقط نسخه فشرده نگه داشته می‌شود
+        paths, manifest = await executors.run_io(backup_archive.pack, backup_path, backup_dir, backup_filename)
+        _remove_quietly(backup_path)
+        await backup_archive.send_files(context.bot, target_chat_id, paths, f"پشتیبان خودکار دیتابیس - {timestamp}")
+        logger.info(
+            "Auto-backup sent to chat %s (%s, %d -> %d bytes in %d part(s))",
+            target_chat_id, manifest["codec"], manifest["size"],
+            sum(p["size"] for p in manifest["parts"]), len(manifest["parts"]),
+        )
+        manage_old_backups(backup_dir)
 
     except Exception as e:
         logger.error("Auto-backup failed: %s", e, exc_info=True)
@@ -98,14 +92,122 @@ async def auto_backup_job(context: ContextTypes.DEFAULT_TYPE):
     finally:
         if db_closed:
             db.init_db()
+        _remove_quietly(backup_path)
+
+
+def _remove_quietly(path: str) -> None:
+    for p in (path, path + "-wal", path + "-shm"):
+        try:
+            if os.path.exists(p):
+                os.remove(p)
+        except Exception:
+            pass
+
+
+async def _auto_backup_incremental(context: ContextTypes.DEFAULT_TYPE, backup_dir: str, timestamp: str, target_chat_id):
+    """base یا delta صفحه‌ای (bot/incremental_backup)؛ اگر از بکاپ قبلی چیزی تغییر نکرده باشد چیزی ارسال نمی‌شود."""
+    path = None
+    try:
+        # حالت worker: فایل‌های قبلی زنجیره فقط صف شده‌اند؛ اگر یکی هرگز ارسال نشد زنجیره ناقص است
+        force_base = outbox.delivery_failed(incremental_backup.queued_outbox_ids(backup_dir))
+        if force_base:
+            logger.warning("Auto-backup: a queued backup file was never delivered; taking a new base")
+        path, meta = await executors.run_io(incremental_backup.take, db.DB_NAME, backup_dir, timestamp, force_base)
+        if path is None:
+            logger.info("Auto-backup: no changes since delta #%s of base %s; nothing sent", meta["seq"] - 1, meta["base"])
+            return
+        if meta["kind"] == "base":
+            caption = f"پشتیبان خودکار (پایه {meta['base']}) - {timestamp}"
+        else:
+            caption = (
+                f"پشتیبان افزایشی #{meta['seq']} (پایه {meta['base']}) - {timestamp}\n"
+                f"{meta['pages']} صفحه تغییرکرده از {meta['page_count']}"
+            )
+        # فایل محلی خام می‌ماند (برای restore_backup.py)؛ نسخه ارسالی فشرده و در صورت نیاز چندقطعه‌ای است
+        out_dir = tempfile.mkdtemp(prefix="vpnbot_ship_")
+        try:
+            parts, _ = await executors.run_io(backup_archive.pack, path, out_dir)
+            sent = await backup_archive.send_files(context.bot, target_chat_id, parts, caption)
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+        # با OutboxBot نتیجه شناسه ردیف صف است (تحویل واقعی بعداً با delivery_failed بررسی می‌شود)
+        incremental_backup.commit_pending(backup_dir, [r for r in sent if isinstance(r, int)])
+        path = None
+        logger.info("Auto-backup (%s #%s, %d bytes) sent to chat %s", meta["kind"], meta["seq"], meta["bytes"], target_chat_id)
+        incremental_backup.prune(backup_dir)
+    except Exception as e:
+        logger.error("Incremental auto-backup failed: %s", e, exc_info=True)
+        # وضعیت اعمال نمی‌شود؛ delta بعدی تغییرات این دوره را هم در بر می‌گیرد
+        incremental_backup.discard_pending(backup_dir)
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+        try:
+            await context.bot.send_message(
+                chat_id=target_chat_id,
+                text=f"⚠️ بکاپ خودکار با خطا مواجه شد:\n{e}",
+            )
+        except Exception as msg_err:
+            logger.error("Failed to send backup error notification: %s", msg_err, exc_info=True)
 
 
-def manage_old_backups(backup_dir: str, max_backups: int = 10):
+def _write_backup_snapshot(backup_path: str):
+    """کپی سازگار دیتابیس در backup_path (در thread pool اجرا می‌شود)."""
     try:
-        files = [f for f in os.listdir(backup_dir) if f.startswith("auto_backup_") and f.endswith(".sqlite3")]
-        files.sort(key=lambda f: os.path.getmtime(os.path.join(backup_dir, f)))
-        if len(files) > max_backups:
-            for old in files[:-max_backups]:
+        # Prefer VACUUM INTO (SQLite >= 3.27)
+        version = sqlite3.sqlite_version_info
+        if version >= (3, 27, 0):
+            path_escaped = backup_path.replace("'", "''")
+            with sqlite3.connect(db.DB_NAME) as conn:
+                conn.execute(f"VACUUM INTO '{path_escaped}'")
+            logger.info("Auto-backup: VACUUM INTO succeeded")
+        else:
+            # backup() API for older SQLite
+            with sqlite3.connect(db.DB_NAME) as src, sqlite3.connect(backup_path) as dst:
+                src.backup(dst)
+            logger.info("Auto-backup: backup() API succeeded")
+    except Exception as e:
+        logger.error("SQLite backup methods failed (%s). Falling back to file copy.", e, exc_info=True)
+        try:
+            with sqlite3.connect(db.DB_NAME) as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception:
+            pass
+        shutil.copy2(db.DB_NAME, backup_path)
+        for ext in ("-wal", "-shm"):
+            sp = db.DB_NAME + ext
+            if os.path.exists(sp):
+                try:
+                    shutil.copy2(sp, backup_path + ext)
+                except Exception:
+                    pass
+        logger.info("Auto-backup: file copy succeeded")
+
+
+def _backup_stamp(filename: str):
+    """auto_backup_<YYYY-mm-dd_HH-MM>... -> datetime (یا None)."""
+    try:
+        return datetime.strptime(filename[len("auto_backup_"):len("auto_backup_") + 16], "%Y-%m-%d_%H-%M")
+    except ValueError:
+        return None
+
+
+def manage_old_backups(backup_dir: str):
+    """نگهداری لایه‌ای بکاپ‌های خودکار (همه فایل‌های یک بکاپ: قطعه‌ها، manifest یا فایل خام قدیمی)."""
+    try:
+        groups = defaultdict(list)
+        for f in os.listdir(backup_dir):
+            if f.startswith("auto_backup_"):
+                stamp = _backup_stamp(f)
+                if stamp is not None:
+                    groups[stamp].append(f)
+        keep = backup_archive.retention_keep(groups, BACKUP_KEEP_HOURLY, BACKUP_KEEP_DAILY, BACKUP_KEEP_WEEKLY)
+        for stamp, files in groups.items():
+            if stamp in keep:
+                continue
+            for old in files:
                 os.remove(os.path.join(backup_dir, old))
                 logger.info("Removed old backup file: %s", old)
     except Exception as e:
@@ -131,23 +233,6 @@ def _extract_usage_gb(payload: dict) -> float | None:
 
 
 # -------------------- Expiry reminder --------------------
-_P2E = str.maketrans("۰۱۲۳۴۵۶۷۸۹", "0123456789")
-
-def _norm_digits(s: str) -> str:
-    return (s or "").translate(_P2E)
-
-def _days_left_from_jalali(expiry_jalali: str) -> int | None:
-    if not expiry_jalali or expiry_jalali in ("N/A", "نامشخص"):
-        return None
-    try:
-        import jdatetime
-        s = _norm_digits(expiry_jalali).replace("-", "/").strip()
-        y, m, d = map(int, s.split("/")[:3])
-        g = jdatetime.date(y, m, d).togregorian()
-        return (g - datetime.now().date()).days
-    except Exception:
-        return None
-
 async def expiry_reminder_job(context: ContextTypes.DEFAULT_TYPE):
     try:
         if str(db.get_setting("expiry_reminder_enabled")).lower() in ("0", "false", "off"):
@@ -196,71 +281,70 @@ async def expiry_reminder_job(context: ContextTypes.DEFAULT_TYPE):
         services = db.get_all_active_services()
         today = datetime.now().strftime("%Y-%m-%d")
 
+        checked, infos = [], []
         for svc in services:
             try:
                 info = await hiddify_api.get_user_info(svc["sub_uuid"])
                 if isinstance(info, dict) and info.get("_not_found"):
                     await _remove_stale_service(svc, context)
                     continue
-                if not info:
-                    continue
+                if info:
+                    checked.append(svc)
+                    infos.append(info)
+                await asyncio.sleep(0.2)
+            except Exception as e:
+                logger.debug("expiry check for service %s failed: %s", svc.get("service_id"), e)
 
-                # از رکورد DB برای محاسبه دقیق انقضا استفاده می‌کنیم
-                status, expiry_jalali, is_expired = get_service_status(info, svc)
-                if is_expired or not expiry_jalali or expiry_jalali == "N/A":
-                    continue
+        # یک پاس روی همه سرویس‌ها (از رکورد DB برای محاسبه دقیق انقضا استفاده می‌شود)
+        st = service_status.evaluate(
+            service_status.to_columns(infos, checked), days_threshold=days_threshold, gb_threshold=gb_threshold
+        )
 
+        for i, svc in enumerate(checked):
+            if not (st["remind_days"][i] or st["remind_gb"][i]):
+                continue
+            try:
                 sent = False
 
-                if days_threshold is not None:
-                    days_left = _days_left_from_jalali(expiry_jalali)
-                    if (days_left is not None) and (0 < days_left <= days_threshold):
-                        if not (db.was_reminder_sent(svc["service_id"], "expiry_days", today) or
-                                db.was_reminder_sent(svc["service_id"], "expiry", today)):
-                            text = template_days.format(days=days_left, service_name=(svc.get("name") or "سرویس"))
-                            try:
-                                await context.bot.send_message(chat_id=svc["user_id"], text=text)
-                                db.mark_reminder_sent(svc["service_id"], "expiry_days", today)
-                                db.mark_reminder_sent(svc["service_id"], "expiry", today)
-                                sent = True
-                            except RetryAfter as e:
-                                await asyncio.sleep(getattr(e, "retry_after", 1) + 1)
-                                await context.bot.send_message(chat_id=svc["user_id"], text=text)
-                                db.mark_reminder_sent(svc["service_id"], "expiry_days", today)
-                                db.mark_reminder_sent(svc["service_id"], "expiry", today)
-                                sent = True
-                            except (Forbidden, BadRequest, TimedOut, NetworkError):
-                                pass
-
-                if (gb_threshold is not None) and (not sent):
-                    try:
-                        u_limit = float(info.get("usage_limit_GB"))
-                    except Exception:
-                        u_limit = None
-                    if (u_limit is not None) and (u_limit > 0):
-                        used = _extract_usage_gb(info)
-                        if used is not None:
-                            rem = max(0.0, u_limit - float(used))
-                            if rem <= float(gb_threshold):
-                                if not db.was_reminder_sent(svc["service_id"], "expiry_gb", today):
-                                    text = template_gb.format(
-                                        service_name=(svc.get("name") or "سرویس"),
-                                        gb=float(gb_threshold),
-                                        gb_left=f"{rem:.2f}".rstrip("0").rstrip(".")
-                                    )
-                                    try:
-                                        await context.bot.send_message(chat_id=svc["user_id"], text=text)
-                                        db.mark_reminder_sent(svc["service_id"], "expiry_gb", today)
-                                    except RetryAfter as e:
-                                        await asyncio.sleep(getattr(e, "retry_after", 1) + 1)
-                                        await context.bot.send_message(chat_id=svc["user_id"], text=text)
-                                        db.mark_reminder_sent(svc["service_id"], "expiry_gb", today)
-                                    except (Forbidden, BadRequest, TimedOut, NetworkError):
-                                        pass
-
-                await asyncio.sleep(0.2)
+                if st["remind_days"][i]:
+                    days_left = st["days_to_expiry"][i]
+                    if not (db.was_reminder_sent(svc["service_id"], "expiry_days", today) or
+                            db.was_reminder_sent(svc["service_id"], "expiry", today)):
+                        text = template_days.format(days=days_left, service_name=(svc.get("name") or "سرویس"))
+                        try:
+                            await context.bot.send_message(chat_id=svc["user_id"], text=text)
+                            db.mark_reminder_sent(svc["service_id"], "expiry_days", today)
+                            db.mark_reminder_sent(svc["service_id"], "expiry", today)
+                            sent = True
+                        except RetryAfter as e:
+                            await asyncio.sleep(getattr(e, "retry_after", 1) + 1)
+                            await context.bot.send_message(chat_id=svc["user_id"], text=text)
+                            db.mark_reminder_sent(svc["service_id"], "expiry_days", today)
+                            db.mark_reminder_sent(svc["service_id"], "expiry", today)
+                            sent = True
+                        except (Forbidden, BadRequest, TimedOut, NetworkError):
+                            pass
+
+                if st["remind_gb"][i] and not sent:
+                    rem = st["remaining_gb"][i]
+                    if not db.was_reminder_sent(svc["service_id"], "expiry_gb", today):
+                        text = template_gb.format(
+                            service_name=(svc.get("name") or "سرویس"),
+                            gb=float(gb_threshold),
+                            gb_left=f"{rem:.2f}".rstrip("0").rstrip(".")
+                        )
+                        try:
+                            await context.bot.send_message(chat_id=svc["user_id"], text=text)
+                            db.mark_reminder_sent(svc["service_id"], "expiry_gb", today)
+                        except RetryAfter as e:
+                            await asyncio.sleep(getattr(e, "retry_after", 1) + 1)
+                            await context.bot.send_message(chat_id=svc["user_id"], text=text)
+                            db.mark_reminder_sent(svc["service_id"], "expiry_gb", today)
+                        except (Forbidden, BadRequest, TimedOut, NetworkError):
+                            pass
             except Exception as e:
-                logger.debug("expiry check for service %s failed: %s", svc.get("service_id"), e)
+                logger.debug("expiry reminder for service %s failed: %s", svc.get("service_id"), e)
+            await asyncio.sleep(_REMINDER_SEND_DELAY_SEC)
 
     except Exception as e:
         logger.error("expiry_reminder_job error: %s", e, exc_info=True)
@@ -283,13 +367,10 @@ async def _remove_stale_service(service: dict, context: ContextTypes.DEFAULT_TYP
 # -------------------- Usage aggregation --------------------
 async def update_user_usage_snapshot(context: ContextTypes.DEFAULT_TYPE):
     try:
-        base_services = db.get_all_active_services() or []
-        endpoints = db.list_all_endpoints_with_user() or []
-
         tasks = []
         sem = asyncio.Semaphore(8)
 
-        async def fetch_usage(user_id: int, sub_uuid: str, server_name: str):
+        async def fetch_usage(user_id: int, sub_uuid: str, server_name: str, service_id: int | None = None):
             async with sem:
                 if not sub_uuid:
                     return None
@@ -300,14 +381,18 @@ async def update_user_usage_snapshot(context: ContextTypes.DEFAULT_TYPE):
                     usage = _extract_usage_gb(info)
                     if usage is None:
                         return None
+                    if service_id is not None:
+                        service_states.append((service_id, user_id, info))
                     return (user_id, server_name or "Unknown", float(usage))
                 except Exception:
                     return None
 
-        for s in base_services:
-            tasks.append(fetch_usage(s["user_id"], s["sub_uuid"], s.get("server_name") or "Unknown"))
-        for ep in endpoints:
-            tasks.append(fetch_usage(ep["user_id"], ep.get("sub_uuid"), ep.get("server_name") or "Unknown"))
+        service_states = []
+        # اسکن تنبل: هر task فقط چند مقدار لازم را نگه می‌دارد، نه ردیف کامل
+        for s in db.iter_active_services():
+            tasks.append(fetch_usage(s.user_id, s.sub_uuid, s.server_name or "Unknown", s.service_id))
+        for ep in db.iter_endpoints_with_user():
+            tasks.append(fetch_usage(ep.user_id, ep.sub_uuid, ep.server_name or "Unknown"))
 
         if not tasks:
             return
@@ -323,8 +408,24 @@ async def update_user_usage_snapshot(context: ContextTypes.DEFAULT_TYPE):
             agg[(uid, srv)] += usage
             seen_by_user[uid].add(srv)
 
-        for (uid, srv), total in agg.items():
-            db.upsert_user_traffic(uid, srv, total)
+        # دلتا نسبت به snapshot قبلی برای سری زمانی (کاهش مصرف = ریست/تمدید → کل مقدار جدید دلتاست)
+        try:
+            previous = db.get_user_traffic_map()
+            deltas = []
+            for (uid, srv), total in agg.items():
+                prev = previous.get((uid, srv))
+                if prev is None:
+                    continue  # اولین snapshot؛ مبدا نامشخص
+                deltas.append((uid, srv, total - prev if total >= prev else total))
+            db.record_traffic_deltas(deltas)
+        except Exception as e:
+            logger.warning("record traffic deltas failed: %s", e)
+
+        db.upsert_user_traffic_many([(uid, srv, total) for (uid, srv), total in agg.items()])
+        try:
+            db.upsert_service_states(service_states)
+        except Exception as e:
+            logger.warning("service_state snapshot failed: %s", e)
 
         try:
             interval_min = int(db.get_setting("usage_update_interval_min") or USAGE_UPDATE_INTERVAL_MIN or 10)
@@ -350,6 +451,23 @@ async def update_user_usage_snapshot(context: ContextTypes.DEFAULT_TYPE):
         logger.error("update_user_usage_snapshot failed: %s", e, exc_info=True)
 
 
+async def traffic_rollup_job(context: ContextTypes.DEFAULT_TYPE):
+    def _days(key: str, default: int) -> int:
+        try:
+            return max(1, int(float(db.get_setting(key) or default)))
+        except Exception:
+            return default
+    try:
+        out = db.rollup_traffic_series(
+            raw_hours=48,
+            hourly_days=_days("traffic_hourly_retention_days", 30),
+            daily_days=_days("traffic_daily_retention_days", 365),
+        )
+        logger.info("Traffic rollup: %s", out)
+    except Exception as e:
+        logger.error("traffic_rollup_job failed: %s", e, exc_info=True)
+
+
 # -------------------- One-time Backfill --------------------
 async def initial_backfill_job(context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -369,60 +487,112 @@ def _is_on(keys: list[str], default: str = "0") -> bool:
     return str(default).lower() in ("1", "true", "on", "yes")
 
 
-async def post_init(app: Application):
+def schedule_jobs(jq):
     """
-    Called by ApplicationBuilder.post_init in app.py
+    زمان‌بندی jobهای پس‌زمینه. jq می‌تواند JobQueue ربات (حالت inline) یا
+    صف lease‌دار job_worker.py (حالت worker) باشد؛ هر دو run_once/run_repeating/run_daily دارند.
     """
+    # One-time backfill
+    jq.run_once(initial_backfill_job, when=timedelta(seconds=2), name="initial_backfill")
+
+    # Reports
+    if _is_on(["report_daily_enabled", "daily_report_enabled"], default="0"):
+        jq.run_daily(send_daily_summary, time=time(hour=23, minute=50), name="daily_report")
+        logger.info("Daily report job scheduled.")
+    if _is_on(["report_weekly_enabled", "weekly_report_enabled"], default="0"):
+        jq.run_daily(send_weekly_summary, time=time(hour=22, minute=0), days=(4,), name="weekly_report")
+        logger.info("Weekly report job scheduled.")
+
+    # Auto-backup
     try:
-        jq = app.job_queue
-
-        # One-time backfill
-        jq.run_once(initial_backfill_job, when=timedelta(seconds=2), name="initial_backfill")
+        backup_interval = int(db.get_setting("auto_backup_interval_hours") or 0)
+    except Exception:
+        backup_interval = 0
+    if backup_interval > 0:
+        jq.run_repeating(
+            auto_backup_job,
+            interval=timedelta(hours=backup_interval),
+            first=timedelta(hours=1),
+            name="auto_backup_job",
+        )
+        logger.info("Auto-backup job scheduled every %d hours.", backup_interval)
 
-        # Reports
-        if _is_on(["report_daily_enabled", "daily_report_enabled"], default="0"):
-            jq.run_daily(send_daily_summary, time=time(hour=23, minute=50), name="daily_report")
-            logger.info("Daily report job scheduled.")
-        if _is_on(["report_weekly_enabled", "weekly_report_enabled"], default="0"):
-            jq.run_daily(send_weekly_summary, time=time(hour=22, minute=0), days=(4,), name="weekly_report")
-            logger.info("Weekly report job scheduled.")
+    # Expiry reminder
+    try:
+        exp_hour = int(float(db.get_setting("expiry_reminder_hour") or 9))
+    except Exception:
+        exp_hour = 9
+    if _is_on(["expiry_reminder_enabled"], default="1"):
+        jq.run_daily(expiry_reminder_job, time=time(hour=exp_hour, minute=0), name="expiry_reminder")
+        logger.info("Expiry reminder job scheduled at %02d:00", exp_hour)
 
-        # Auto-backup
+    # Usage aggregation
+    if _is_on(["usage_aggregation_enabled"], default="1" if USAGE_AGGREGATION_ENABLED else "0"):
         try:
-            backup_interval = int(db.get_setting("auto_backup_interval_hours") or 0)
+            interval_min = int(db.get_setting("usage_update_interval_min") or USAGE_UPDATE_INTERVAL_MIN or 10)
         except Exception:
-            backup_interval = 0
-        if backup_interval > 0:
-            jq.run_repeating(
-                auto_backup_job,
-                interval=timedelta(hours=backup_interval),
-                first=timedelta(hours=1),
-                name="auto_backup_job",
-            )
-            logger.info("Auto-backup job scheduled every %d hours.", backup_interval)
+            interval_min = USAGE_UPDATE_INTERVAL_MIN or 10
+        jq.run_repeating(
+            update_user_usage_snapshot,
+            interval=timedelta(minutes=interval_min),
+            first=timedelta(minutes=1),
+            name="usage_aggregation_job",
+        )
+        logger.info("Usage aggregation job scheduled every %d minutes.", interval_min)
+        jq.run_repeating(
+            traffic_rollup_job,
+            interval=timedelta(hours=1),
+            first=timedelta(minutes=5),
+            name="traffic_rollup",
+        )
 
-        # Expiry reminder
-        try:
-            exp_hour = int(float(db.get_setting("expiry_reminder_hour") or 9))
-        except Exception:
-            exp_hour = 9
-        if _is_on(["expiry_reminder_enabled"], default="1"):
-            jq.run_daily(expiry_reminder_job, time=time(hour=exp_hour, minute=0), name="expiry_reminder")
-            logger.info("Expiry reminder job scheduled at %02d:00", exp_hour)
+    # Sub-domain health probe (انتخاب وزن‌دار هاست لینک‌ها)
+    if _is_on(["domain_probe_enabled"], default="1"):
+        jq.run_repeating(
+            domain_health.domain_health_job,
+            interval=timedelta(minutes=max(1, int(domain_health.DOMAIN_PROBE_INTERVAL_MIN))),
+            first=timedelta(seconds=20),
+            name="domain_health_probe",
+        )
 
-        # Usage aggregation
-        if _is_on(["usage_aggregation_enabled"], default="1" if USAGE_AGGREGATION_ENABLED else "0"):
-            try:
-                interval_min = int(db.get_setting("usage_update_interval_min") or USAGE_UPDATE_INTERVAL_MIN or 10)
-            except Exception:
-                interval_min = USAGE_UPDATE_INTERVAL_MIN or 10
-            jq.run_repeating(
-                update_user_usage_snapshot,
-                interval=timedelta(minutes=interval_min),
-                first=timedelta(minutes=1),
-                name="usage_aggregation_job",
-            )
-            logger.info("Usage aggregation job scheduled every %d minutes.", interval_min)
+    # تطبیق DB با پنل‌ها (گزارش به ادمین؛ اعمال اصلاحات طبق reconcile_policy)
+    if _is_on(["reconcile_enabled"], default="1"):
+        jq.run_daily(reconcile.reconcile_job, time=time(hour=5, minute=0), name="panel_reconcile")
+
+    # Retention (حذف ردیف‌های قدیمی جداول افزایشی)
+    if _is_on(["retention_enabled"], default="1"):
+        jq.run_daily(retention.retention_job, time=time(hour=4, minute=30), name="retention")
+
+    # checkpoint دوره‌ای WAL و PRAGMA optimize در ساعات کم‌ترافیک
+    if _is_on(["db_maintenance_enabled"], default="1"):
+        jq.run_repeating(
+            db_maintenance.db_maintenance_job,
+            interval=timedelta(minutes=max(1, int(db_maintenance.DB_MAINTENANCE_INTERVAL_MIN))),
+            first=timedelta(minutes=2),
+            name="db_maintenance",
+        )
+
+
+async def post_init(app: Application):
+    """
+    Called by ApplicationBuilder.post_init in app.py
+    """
+    try:
+        jq = app.job_queue
+
+        if JOB_RUNNER_MODE == "worker":
+            # jobها در job_worker.py اجرا می‌شوند؛ این پروسس فقط outbox را ارسال می‌کند
+            logger.info("JOB_RUNNER_MODE=worker: background jobs are left to job_worker.py")
+        else:
+            schedule_jobs(jq)
+
+        # Admin notification outbox
+        jq.run_repeating(
+            outbox.admin_outbox_dispatch_job,
+            interval=timedelta(seconds=max(1, int(outbox.ADMIN_OUTBOX_INTERVAL_SEC))),
+            first=timedelta(seconds=3),
+            name="admin_outbox_dispatch",
+        )
 
         # Mini-app start (optional, non-blocking)
         try:
@@ -431,6 +601,9 @@ async def post_init(app: Application):
             logger.warning("Mini-app در دسترس نیست (احتمالاً aiohttp نصب نیست): %s", e)
         else:
             async def _start_ws(context: ContextTypes.DEFAULT_TYPE):
+                if _ws.is_running():
+                    # در حالت webhook سرور قبلاً توسط main_bot بالا آمده است
+                    return
                 try:
                     await _ws.start_webapp()
                     logger.info("Mini-app started on %s:%s", _ws.WEBAPP_HOST, _ws.WEBAPP_PORT)
@@ -448,6 +621,10 @@ async def post_shutdown(app: Application):
     Called by ApplicationBuilder.post_shutdown in app.py
     """
     logger.info("Jobs shutdown.")
+    try:
+        executors.shutdown()
+    except Exception:
+        pass
     # Stop mini-app gracefully (if running)
     try:
         from bot import webapp_stats as _ws
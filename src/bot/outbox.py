@@ -0,0 +1,227 @@
+# filename: bot/outbox.py
+# -*- coding: utf-8 -*-
+"""
+ارسال پیام‌های صف‌شده در admin_outbox از طریق context.bot.
+
+- پیام‌های معوق هر چت در یک پیام (تا سقف طول تلگرام) ادغام می‌شوند؛ فایل‌ها (kind=document) جداگانه.
+- پیام‌های دارای options (reply_markup و ...) ادغام نمی‌شوند و با همان پارامترها ارسال می‌شوند.
+- بین ارسال‌ها فاصله رعایت می‌شود؛ RetryAfter/خطای شبکه -> تلاش مجدد با backoff.
+- فایل spool شده بعد از ارسال یا تمام شدن تلاش‌ها حذف می‌شود.
+- چون صف در DB است، پیام‌ها بعد از ری‌استارت از دست نمی‌روند.
+- OutboxBot: جایگزین context.bot در job_worker.py؛ به‌جای تماس با تلگرام در صف ثبت می‌کند.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict
+
+from telegram import InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from telegram.error import Forbidden, BadRequest, RetryAfter
+
+import database as db
+
+try:
+    from config import ADMIN_OUTBOX_INTERVAL_SEC
+except Exception:
+    ADMIN_OUTBOX_INTERVAL_SEC = 5
+
+try:
+    from config import ADMIN_OUTBOX_SEND_DELAY_SEC
+except Exception:
+    ADMIN_OUTBOX_SEND_DELAY_SEC = 0.35
+
+logger = logging.getLogger(__name__)
+
+_MAX_ATTEMPTS = 8
+_MAX_TEXT_LEN = 3800
+_SEPARATOR = "\n\n———\n\n"
+# پارامترهای ساده‌ای که همان‌طور ذخیره و بازپخش می‌شوند (علاوه بر reply_markup)
+_PLAIN_OPTIONS = ("disable_web_page_preview", "disable_notification", "protect_content")
+_running = False
+
+
+def _backoff(attempts: int) -> int:
+    return min(3600, 15 * (2 ** max(0, attempts)))
+
+
+def _encode_options(kwargs: dict) -> str | None:
+    """kwargs ارسال -> JSON برای ستون options؛ پارامتر پشتیبانی‌نشده TypeError می‌دهد (نه حذف بی‌صدا)."""
+    opts = {}
+    for key, value in kwargs.items():
+        if value is None:
+            continue
+        if key == "reply_markup":
+            if not isinstance(value, InlineKeyboardMarkup):
+                raise TypeError(f"OutboxBot: unsupported reply_markup type {type(value).__name__}")
+            opts[key] = value.to_dict()
+        elif key in _PLAIN_OPTIONS:
+            opts[key] = bool(value)
+        elif key != "chat_id":
+            raise TypeError(f"OutboxBot: unsupported argument {key!r}")
+    return json.dumps(opts, ensure_ascii=False) if opts else None
+
+
+def _decode_options(raw) -> dict:
+    if not raw:
+        return {}
+    try:
+        opts = json.loads(raw)
+    except ValueError:
+        return {}
+    if opts.get("reply_markup"):
+        opts["reply_markup"] = InlineKeyboardMarkup.de_json(opts["reply_markup"], None)
+    return opts
+
+
+def _spool_dir() -> str:
+    path = os.path.join(os.path.dirname(os.path.abspath(db.DB_NAME)), "outbox_files")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class OutboxBot:
+    """
+    حداقل API مورد استفاده jobها (send_message / send_document) که پیام را در admin_outbox
+    ثبت می‌کند تا پروسس ربات ارسال کند. خطاهای تلگرام (RetryAfter و ...) هرگز رخ نمی‌دهند.
+    پارامترهای اضافه (reply_markup با InlineKeyboardMarkup، _PLAIN_OPTIONS) ذخیره و بازپخش می‌شوند؛
+    بقیه TypeError می‌دهند. send_document به جای Message شناسه ردیف صف را برمی‌گرداند (delivery_failed).
+    """
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        db.enqueue_outbox(chat_id, text, parse_mode, options=_encode_options(kwargs))
+
+    async def send_document(self, chat_id, document, caption=None, filename=None, parse_mode=None, **kwargs):
+        options = _encode_options(kwargs)
+        content = getattr(document, "input_file_content", None)
+        filename = filename or getattr(document, "filename", None) or "file"
+        if content is None:
+            if isinstance(document, (bytes, bytearray)):
+                content = bytes(document)
+            elif hasattr(document, "read"):
+                content = document.read()
+            else:
+                with open(document, "rb") as f:
+                    content = f.read()
+        path = os.path.join(_spool_dir(), f"{uuid.uuid4().hex}__{os.path.basename(filename)}")
+        with open(path, "wb") as f:
+            f.write(content)
+        return db.enqueue_outbox(chat_id, caption or "", parse_mode, kind="document", file_path=path, options=options)
+
+
+def delivery_failed(ids: list) -> bool:
+    """آیا ردیفی از ids بعد از _MAX_ATTEMPTS تلاش هرگز ارسال نشده است؟"""
+    return bool(ids) and db.count_failed_outbox(ids, _MAX_ATTEMPTS) > 0
+
+
+def _group_batches(rows: list) -> list:
+    """
+    ردیف‌ها را بر اساس chat_id/parse_mode دسته و تا سقف طول پیام ادغام می‌کند.
+    خروجی: (chat_id, parse_mode, ids, payload, attempts)؛ payload متن ادغام‌شده یا برای فایل و
+    پیام دارای options خود ردیف (dict) است.
+    """
+    by_chat: "OrderedDict[tuple, list]" = OrderedDict()
+    batches = []
+    for r in rows:
+        if r.get("kind") == "document" or r.get("options"):
+            batches.append((r["chat_id"], r.get("parse_mode"), [r["id"]], r, int(r.get("attempts") or 0)))
+            continue
+        by_chat.setdefault((r["chat_id"], r.get("parse_mode")), []).append(r)
+
+    for (chat_id, parse_mode), items in by_chat.items():
+        cur_ids, cur_texts, cur_len, attempts = [], [], 0, 0
+        for r in items:
+            t = r["text"] or ""
+            add_len = len(t) + (len(_SEPARATOR) if cur_texts else 0)
+            if cur_texts and cur_len + add_len > _MAX_TEXT_LEN:
+                batches.append((chat_id, parse_mode, cur_ids, _SEPARATOR.join(cur_texts), attempts))
+                cur_ids, cur_texts, cur_len, attempts = [], [], 0, 0
+                add_len = len(t)
+            cur_ids.append(r["id"])
+            cur_texts.append(t)
+            cur_len += add_len
+            attempts = max(attempts, int(r.get("attempts") or 0))
+        if cur_ids:
+            batches.append((chat_id, parse_mode, cur_ids, _SEPARATOR.join(cur_texts), attempts))
+    return batches
+
+
+async def _send_document(context: ContextTypes.DEFAULT_TYPE, chat_id, row: dict, parse_mode):
+    path = row.get("file_path") or ""
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    filename = os.path.basename(path).split("__", 1)[-1]
+    with open(path, "rb") as f:
+        await context.bot.send_document(
+            chat_id=chat_id, document=f, filename=filename, caption=row.get("text") or None, parse_mode=parse_mode,
+            **_decode_options(row.get("options")),
+        )
+    _remove_spooled(row)
+
+
+async def _send_row_message(context: ContextTypes.DEFAULT_TYPE, chat_id, row: dict, parse_mode):
+    opts = {"disable_web_page_preview": True}
+    opts.update(_decode_options(row.get("options")))
+    await context.bot.send_message(chat_id=chat_id, text=row.get("text") or "", parse_mode=parse_mode, **opts)
+
+
+def _remove_spooled(row) -> None:
+    if isinstance(row, dict) and row.get("file_path"):
+        try:
+            os.remove(row["file_path"])
+        except OSError:
+            pass
+
+
+def _mark_failed(ids: list, payload, attempts: int, error: str, retry_in_sec: float) -> None:
+    """ثبت شکست؛ اگر این آخرین تلاش بود فایل spool شده ردیف حذف می‌شود (دیگر ارسال نخواهد شد)."""
+    db.mark_admin_outbox_failed(ids, error, retry_in_sec)
+    if attempts + 1 >= _MAX_ATTEMPTS:
+        _remove_spooled(payload)
+
+
+async def admin_outbox_dispatch_job(context: ContextTypes.DEFAULT_TYPE):
+    global _running
+    if _running:
+        return
+    _running = True
+    try:
+        rows = db.get_due_admin_outbox(limit=50, max_attempts=_MAX_ATTEMPTS)
+        if not rows:
+            return
+        for chat_id, parse_mode, ids, payload, attempts in _group_batches(rows):
+            try:
+                target = int(chat_id)
+            except Exception:
+                target = chat_id
+            try:
+                if isinstance(payload, dict) and payload.get("kind") == "document":
+                    await _send_document(context, target, payload, parse_mode)
+                elif isinstance(payload, dict):
+                    await _send_row_message(context, target, payload, parse_mode)
+                else:
+                    await context.bot.send_message(
+                        chat_id=target, text=payload, parse_mode=parse_mode, disable_web_page_preview=True
+                    )
+                db.mark_admin_outbox_sent(ids)
+            except RetryAfter as e:
+                wait = float(getattr(e, "retry_after", 5) or 5)
+                _mark_failed(ids, payload, attempts, f"RetryAfter {wait}", wait + 1)
+                logger.warning("Admin outbox rate-limited; pausing for %.0fs", wait)
+                break
+            except (Forbidden, BadRequest) as e:
+                # احتمالاً خطای دائمی (چت نامعتبر/متن خراب)؛ تا سقف تلاش‌ها با backoff
+                _mark_failed(ids, payload, attempts, str(e), _backoff(attempts))
+                logger.warning("Admin outbox send to %s failed: %s", chat_id, e)
+            except Exception as e:
+                _mark_failed(ids, payload, attempts, str(e), _backoff(attempts))
+                logger.warning("Admin outbox send to %s failed (will retry): %s", chat_id, e)
+            await asyncio.sleep(ADMIN_OUTBOX_SEND_DELAY_SEC)
+    except Exception as e:
+        logger.error("admin_outbox_dispatch_job error: %s", e, exc_info=True)
+    finally:
+        _running = False
+
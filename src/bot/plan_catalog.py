@@ -0,0 +1,142 @@
+# filename: bot/plan_catalog.py
+# -*- coding: utf-8 -*-
+"""
+کاتالوگ پلن‌ها در حافظه: پلن‌ها، دسته‌بندی‌های قابل نمایش، برچسب دکمه‌های خرید و تنظیمات منوی خرید
+(تخفیف همگانی، حالت نگهداری) یک بار از DB خوانده می‌شوند و ساخت منوی خرید بدون دسترسی به DB است.
+
+- مسیرهای افزودن/ویرایش/نمایش-مخفی/حذف پلن (admin/plans.py)، تغییر تنظیمات SETTING_KEYS و بازیابی
+  بکاپ invalidate() را صدا می‌زنند؛ ساخت دوباره در اولین استفاده بعدی.
+- PLAN_CATALOG_TTL_SEC فقط شبکه اطمینان برای تغییراتی است که از بیرون این پروسس انجام می‌شوند.
+- بازه زمانی تخفیف همگانی کش می‌شود و فعال بودن آن در هر نمایش با ساعت فعلی سنجیده می‌شود.
+"""
+
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import database as db
+from bot import utils
+
+try:
+    from config import PLAN_CATALOG_TTL_SEC
+except Exception:
+    PLAN_CATALOG_TTL_SEC = 300
+
+logger = logging.getLogger(__name__)
+
+SETTING_KEYS = (
+    "global_discount_enabled", "global_discount_percent", "global_discount_days",
+    "global_discount_starts_at", "global_discount_expires_at",
+    "maintenance_enabled", "maintenance_message",
+)
+
+_DEFAULT_MAINT_MSG = "⛔️ ربات در حال بروزرسانی است. لطفاً کمی بعد مراجعه کنید."
+
+_snapshot: Optional[dict] = None
+
+
+def invalidate() -> None:
+    global _snapshot
+    _snapshot = None
+
+
+def _truthy(v) -> bool:
+    return str(v or "").lower() in ("1", "true", "on", "yes")
+
+
+def vol_label(gb: int) -> str:
+    """برچسب حجم پلن (0 = نامحدود) با ارقام فارسی؛ در buy.py هم استفاده می‌شود."""
+    g = int(gb)
+    return "نامحدود" if g == 0 else f"{utils.to_persian_digits(str(g))} گیگ"
+
+
+def _short_label(p: dict, off_tag: str = "") -> str:
+    name = (p.get('name') or 'پلن')[:18]
+    days_fa = utils.to_persian_digits(str(int(p.get('days', 0))))
+    vol = vol_label(int(p.get('gb', 0)))
+    price_str = utils.format_toman(p.get('price', 0), persian_digits=True)
+    label = f"{name} | {days_fa} روز | {vol} | {price_str}{off_tag}"
+    return label[:62] + "…" if len(label) > 63 else label
+
+
+def _build() -> dict:
+    settings = {k: db.get_setting(k) for k in SETTING_KEYS}
+    try:
+        percent = float(settings["global_discount_percent"] or 0)
+    except Exception:
+        percent = 0.0
+    starts_raw, expires_raw = settings["global_discount_starts_at"], settings["global_discount_expires_at"]
+    discount = (
+        _truthy(settings["global_discount_enabled"]) and percent > 0,
+        percent,
+        utils.parse_date_flexible(starts_raw) if starts_raw else None,
+        utils.parse_date_flexible(expires_raw) if expires_raw else None,
+    )
+    off_tag = f" | {int(percent)}٪ آف" if percent > 0 else ""
+
+    plans: Dict[int, dict] = {}
+    by_category: Dict[str, List[dict]] = {}
+    labels: Dict[int, Tuple[str, str]] = {}
+    # list_plans مرتب بر اساس days, gb است؛ همان ترتیب منوی خرید
+    for p in db.list_plans(only_visible=False):
+        plans[int(p["plan_id"])] = p
+        labels[int(p["plan_id"])] = (_short_label(p), _short_label(p, off_tag))
+        if p.get("is_visible") and p.get("category") is not None:
+            by_category.setdefault(p["category"], []).append(p)
+
+    return {
+        "plans": plans,
+        "categories": sorted(by_category),
+        "by_category": by_category,
+        "labels": labels,
+        "discount": discount,
+        "maintenance": (_truthy(settings["maintenance_enabled"]), settings["maintenance_message"] or _DEFAULT_MAINT_MSG),
+        "built_at": time.monotonic(),
+    }
+
+
+def _get() -> dict:
+    global _snapshot
+    snap = _snapshot
+    if snap is None or time.monotonic() - snap["built_at"] > PLAN_CATALOG_TTL_SEC:
+        snap = _snapshot = _build()
+        logger.debug("Plan catalog rebuilt: %d plans", len(snap["plans"]))
+    return snap
+
+
+def get_plan(plan_id) -> Optional[dict]:
+    """مثل db.get_plan (شامل پلن‌های مخفی)؛ یک کپی برمی‌گرداند."""
+    try:
+        p = _get()["plans"].get(int(plan_id))
+    except (TypeError, ValueError):
+        return None
+    return dict(p) if p else None
+
+
+def categories() -> List[str]:
+    return list(_get()["categories"])
+
+
+def plan_buttons(category: str) -> List[Tuple[int, str]]:
+    """[(plan_id, label)] پلن‌های قابل نمایش دسته؛ برچسب با تگ تخفیف اگر تخفیف همگانی الان فعال باشد."""
+    snap = _get()
+    idx = 1 if global_discount()[0] else 0
+    return [(p["plan_id"], snap["labels"][int(p["plan_id"])][idx]) for p in snap["by_category"].get(category, [])]
+
+
+def global_discount(now: Optional[datetime] = None) -> Tuple[bool, float]:
+    enabled, percent, starts, expires = _get()["discount"]
+    if not enabled:
+        return False, 0.0
+    now = now or datetime.now().astimezone()
+    if starts and now < starts:
+        return False, 0.0
+    if expires and now > expires:
+        return False, 0.0
+    return True, percent
+
+
+def maintenance() -> Tuple[bool, str]:
+    """(روشن بودن حالت نگهداری، پیام آن)"""
+    return _get()["maintenance"]
@@ -0,0 +1,93 @@
+# filename: bot/qr_cache.py
+# -*- coding: utf-8 -*-
+
+import io
+import logging
+import threading
+from collections import OrderedDict
+
+from telegram import InputFile
+from telegram.error import BadRequest
+
+import database as db
+from bot import utils, executors
+
+try:
+    from config import QR_CACHE_SIZE
+except Exception:
+    QR_CACHE_SIZE = 256
+
+logger = logging.getLogger(__name__)
+
+# LRU در حافظه: url -> PNG bytes
+_png_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_png_lock = threading.Lock()
+
+
+async def get_qr_png(url: str) -> bytes:
+    """
+    PNG مربوط به url را از LRU برمی‌گرداند؛ در صورت نبود، تولید و ذخیره می‌کند.
+    """
+    with _png_lock:
+        data = _png_cache.get(url)
+        if data is not None:
+            _png_cache.move_to_end(url)
+            return data
+
+    # رندر PNG کار CPU است؛ خارج از event loop
+    data = await executors.run_cpu(utils.render_qr_png, url)
+
+    with _png_lock:
+        _png_cache[url] = data
+        _png_cache.move_to_end(url)
+        while len(_png_cache) > max(1, int(QR_CACHE_SIZE)):
+            _png_cache.popitem(last=False)
+    return data
+
+
+def _as_input_file(data: bytes) -> InputFile:
+    bio = io.BytesIO(data)
+    bio.name = "qr.png"
+    return InputFile(bio)
+
+
+async def send_qr_photo(bot, chat_id: int, url: str, **kwargs):
+    """
+    ارسال QR لینک اشتراک.
+    اگر قبلاً برای همین url عکسی ارسال شده باشد، file_id تلگرام دوباره استفاده می‌شود
+    (بدون تولید تصویر و بدون آپلود). در غیر این صورت تصویر ساخته، ارسال و file_id ذخیره می‌شود.
+    kwargs مستقیماً به bot.send_photo پاس داده می‌شود (caption, parse_mode, reply_markup, ...).
+    اگر pool پردازش پر باشد (ExecutorBusy)، caption بدون QR به صورت پیام متنی ارسال می‌شود.
+    """
+    file_id = None
+    try:
+        file_id = db.get_qr_file_id(url)
+    except Exception as e:
+        logger.debug("qr file_id lookup failed: %s", e)
+
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+        except BadRequest as e:
+            # file_id نامعتبر (مثلاً توکن ربات عوض شده) -> حذف و آپلود مجدد
+            logger.warning("Cached QR file_id rejected, re-uploading: %s", e)
+            try:
+                db.delete_qr_file_id(url)
+            except Exception:
+                pass
+
+    try:
+        png = await get_qr_png(url)
+    except executors.ExecutorBusy:
+        logger.warning("QR render skipped (CPU pool busy); sending caption as text")
+        text_kwargs = dict(kwargs)
+        text = text_kwargs.pop("caption", None) or url
+        return await bot.send_message(chat_id=chat_id, text=text, **text_kwargs)
+
+    msg = await bot.send_photo(chat_id=chat_id, photo=_as_input_file(png), **kwargs)
+    try:
+        if msg and msg.photo:
+            db.set_qr_file_id(url, msg.photo[-1].file_id)
+    except Exception as e:
+        logger.debug("qr file_id store failed: %s", e)
+    return msg
@@ -0,0 +1,249 @@
+# filename: bot/reconcile.py
+# -*- coding: utf-8 -*-
+"""
+تطبیق دیتابیس ربات با کاربران پنل‌ها.
+
+برای هر پنل لیست کامل کاربران صفحه به صفحه (hiddify_api.iter_users) خوانده و با یک hash join روی uuid
+با active_services و service_endpoints مقایسه می‌شود:
+- db_orphans: سرویس/endpoint در ربات که در پنل وجود ندارد
+- panel_orphans: کاربر پنل که ربات آن را نمی‌شناسد
+- mismatches: روز/حجم پنل با پلن سرویس در ربات یکی نیست (فقط گزارش)
+سرویس‌های تطبیق‌یافته همزمان در service_state به‌روز می‌شوند.
+
+سیاست (setting «reconcile_policy» یا RECONCILE_POLICY):
+  report -> فقط گزارش به ادمین
+  fix    -> حذف گروهی db_orphans و اطلاع به کاربر؛ اگر نسبت حذف بیش از RECONCILE_MAX_REMOVE_RATIO باشد
+            (مثلاً API key اشتباه یا لیست ناقص) برای آن پنل اعمال نمی‌شود.
+کاربران ناشناخته پنل هرگز حذف نمی‌شوند (ممکن است خارج از ربات ساخته شده باشند).
+لیست خالی از پنلی که ربات برایش سرویس دارد مثل خطای دریافت لیست رفتار می‌شود (هیچ حذفی).
+"""
+
+import asyncio
+import html
+import logging
+from typing import Dict, List, Optional
+
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+
+import database as db
+import hiddify_api
+from bot import panels as pnl
+from bot import plan_catalog
+
+try:
+    from config import ADMIN_ID
+except Exception:
+    ADMIN_ID = None
+
+try:
+    from config import RECONCILE_POLICY
+except Exception:
+    RECONCILE_POLICY = "report"
+
+try:
+    from config import RECONCILE_PAGE_SIZE
+except Exception:
+    RECONCILE_PAGE_SIZE = 500
+
+try:
+    from config import RECONCILE_MAX_REMOVE_RATIO
+except Exception:
+    RECONCILE_MAX_REMOVE_RATIO = 0.2
+
+logger = logging.getLogger(__name__)
+
+_UNKNOWN = "?"
+_GB_TOLERANCE = 0.01
+_REPORT_EXAMPLES = 5
+_REPORT_MSG_LEN = 3900
+_NOTIFY_DELAY_SEC = 0.1
+
+
+def policy() -> str:
+    v = str(db.get_setting("reconcile_policy") or RECONCILE_POLICY or "report").strip().lower()
+    return v if v in ("report", "fix") else "report"
+
+
+def _expected_by_panel() -> Dict[str, Dict[str, dict]]:
+    """{panel_id: {uuid: ref}}؛ ref نوع ردیف (service/endpoint) و شناسه‌ها را نگه می‌دارد."""
+    panels = pnl.load_panels()
+    single = panels[0]["id"] if len(panels) == 1 else None
+    out: Dict[str, Dict[str, dict]] = {}
+
+    def _add(link: str, uuid: Optional[str], ref: dict):
+        if not uuid:
+            return
+        p = pnl.find_panel_for_link(link or "")
+        pid = p["id"] if p else (single or _UNKNOWN)
+        out.setdefault(pid, {})[str(uuid).lower()] = ref
+
+    for s in db.iter_active_services():
+        _add(s.sub_link, s.sub_uuid, {"kind": "service", **s})
+    for ep in db.iter_endpoints_with_user():
+        _add(ep.sub_link, ep.sub_uuid, {"kind": "endpoint", **ep})
+    return out
+
+
+def _mismatch(ref: dict, user: dict) -> Optional[str]:
+    if ref["kind"] != "service" or not ref.get("plan_id"):
+        return None
+    plan = plan_catalog.get_plan(ref["plan_id"])
+    if not plan:
+        return None
+    diffs = []
+    try:
+        if int(user.get("package_days") or 0) != int(plan["days"]):
+            diffs.append(f"روز {user.get('package_days')}≠{plan['days']}")
+    except (TypeError, ValueError):
+        pass
+    # پلن نامحدود (gb=0) بسته به استراتژی پنل با سهمیه بزرگ ساخته می‌شود؛ مقایسه نمی‌شود
+    try:
+        if float(plan["gb"]) > 0 and abs(float(user.get("usage_limit_GB") or 0) - float(plan["gb"])) > _GB_TOLERANCE:
+            diffs.append(f"حجم {user.get('usage_limit_GB')}≠{plan['gb']}")
+    except (TypeError, ValueError):
+        pass
+    return "، ".join(diffs) or None
+
+
+async def _reconcile_panel(panel: dict, expected: Dict[str, dict]) -> dict:
+    res = {
+        "panel_id": panel["id"], "panel_name": panel.get("name") or panel["id"],
+        "expected": len(expected), "panel_users": 0, "matched": 0,
+        "db_orphans": [], "panel_orphans": [], "mismatches": [], "error": None,
+    }
+    pending = dict(expected)
+    states = []
+    try:
+        async for page in hiddify_api.iter_users(panel, page_size=RECONCILE_PAGE_SIZE):
+            res["panel_users"] += len(page)
+            for u in page:
+                key = str(u.get("uuid") or "").lower()
+                ref = pending.pop(key, None)
+                if ref is None:
+                    if key and key not in expected:
+                        res["panel_orphans"].append({"uuid": key, "name": u.get("name"), "comment": u.get("comment")})
+                    continue
+                res["matched"] += 1
+                if ref["kind"] == "service":
+                    states.append((ref["service_id"], ref["user_id"], u))
+                diff = _mismatch(ref, u)
+                if diff:
+                    res["mismatches"].append({"service_id": ref["service_id"], "name": ref.get("name"), "diff": diff})
+    except Exception as e:
+        # لیست ناقص: هیچ سرویسی orphan فرض نمی‌شود
+        res["error"] = str(e)[:200]
+        logger.error("Reconcile: listing panel %s failed: %s", panel["id"], e)
+        return res
+    if res["panel_users"] == 0 and res["expected"] > 0:
+        # لیست خالی در حالی که ربات سرویس دارد: به احتمال زیاد پاسخ خراب/API key اشتباه، نه حذف همه کاربران
+        res["error"] = "پنل لیست کاربران خالی برگرداند؛ هیچ سرویسی حذف نشد"
+        logger.error("Reconcile: panel %s returned no users but %d are expected", panel["id"], res["expected"])
+        return res
+
+    res["db_orphans"] = list(pending.values())
+    if states:
+        try:
+            db.upsert_service_states(states)
+        except Exception as e:
+            logger.warning("Reconcile: service_state update failed: %s", e)
+    return res
+
+
+async def _apply_fixes(res: dict, bot) -> int:
+    orphans = res["db_orphans"]
+    if not orphans:
+        return 0
+    if res["expected"] and len(orphans) > max(5, RECONCILE_MAX_REMOVE_RATIO * res["expected"]):
+        res["skipped_fix"] = True
+        logger.warning("Reconcile: %d/%d orphans on panel %s exceeds ratio; not removing",
+                       len(orphans), res["expected"], res["panel_id"])
+        return 0
+    services = [o for o in orphans if o["kind"] == "service"]
+    endpoints = [o for o in orphans if o["kind"] == "endpoint"]
+    removed = db.delete_services_bulk([o["service_id"] for o in services])
+    removed += db.delete_endpoints_bulk([o["id"] for o in endpoints])
+    for o in services:
+        name = o.get("name") or ""
+        name_part = f"({name}) " if name else ""
+        try:
+            await bot.send_message(chat_id=o["user_id"], text=f"🗑️ سرویس {name_part}در پنل یافت نشد و از لیست شما حذف شد.")
+        except Exception as e:
+            logger.debug("Reconcile notify %s failed: %s", o["user_id"], e)
+        await asyncio.sleep(_NOTIFY_DELAY_SEC)
+    return removed
+
+
+async def run(bot=None, apply: Optional[bool] = None) -> List[dict]:
+    """تطبیق همه پنل‌ها (همزمان). apply=None یعنی طبق policy()."""
+    apply = (policy() == "fix") if apply is None else apply
+    expected = _expected_by_panel()
+    panels = pnl.load_panels()
+    results = list(await asyncio.gather(*(_reconcile_panel(p, expected.get(p["id"], {})) for p in panels)))
+    for res in results:
+        res["removed"] = 0
+        if apply and not res["error"] and bot is not None:
+            res["removed"] = await _apply_fixes(res, bot)
+    unknown = expected.get(_UNKNOWN) or {}
+    if unknown:
+        results.append({"panel_id": _UNKNOWN, "unresolved": len(unknown)})
+    return results
+
+
+def _report_lines(results: List[dict], applied: bool) -> List[str]:
+    """هر عضو خروجی HTML کاملی است (تگ باز بین دو عضو نمی‌ماند)."""
+    e = html.escape
+    lines = ["🧮 <b>تطبیق دیتابیس با پنل‌ها</b>" + (" (اعمال اصلاحات)" if applied else " (فقط گزارش)")]
+    for r in results:
+        if r["panel_id"] == _UNKNOWN:
+            lines.append(f"\n⚪️ {r['unresolved']} سرویس/endpoint با لینکی که به هیچ پنلی نمی‌خورد (بررسی نشد)")
+            continue
+        lines.append(f"\n<b>{e(str(r['panel_name']))}</b>")
+        if r["error"]:
+            lines.append(f"❌ خطا در دریافت لیست کاربران: {e(r['error'])}")
+            continue
+        lines.append(
+            f"کاربران پنل: {r['panel_users']} | در ربات: {r['expected']} | تطبیق: {r['matched']}\n"
+            f"در ربات ولی نه در پنل: {len(r['db_orphans'])}"
+            + (f" (حذف‌شده: {r['removed']})" if r.get("removed") else "")
+            + (" ⚠️ بیش از حد مجاز؛ حذف انجام نشد" if r.get("skipped_fix") else "")
+            + f"\nدر پنل ولی نه در ربات: {len(r['panel_orphans'])}\n"
+            f"مغایرت پلن: {len(r['mismatches'])}"
+        )
+        for o in r["db_orphans"][:_REPORT_EXAMPLES]:
+            ident = f"#{o['service_id']}" if o["kind"] == "service" else f"endpoint {o['id']} (#{o['service_id']})"
+            lines.append(f"  • {ident} کاربر {o['user_id']}: <code>{e(str(o.get('sub_uuid')))}</code>")
+        for o in r["panel_orphans"][:_REPORT_EXAMPLES]:
+            lines.append(f"  • پنل: {e(str(o.get('name') or '-'))} <code>{e(o['uuid'])}</code> {e(str(o.get('comment') or ''))[:40]}")
+        for m in r["mismatches"][:_REPORT_EXAMPLES]:
+            lines.append(f"  • #{m['service_id']} {e(str(m.get('name') or ''))}: {e(m['diff'])}")
+    return lines
+
+
+def format_report(results: List[dict], applied: bool) -> str:
+    return "\n".join(_report_lines(results, applied))
+
+
+def format_report_parts(results: List[dict], applied: bool, limit: int = _REPORT_MSG_LEN) -> List[str]:
+    """گزارش در چند پیام، فقط در مرز خطوط شکسته می‌شود تا HTML ناقص ارسال نشود."""
+    parts, buf, size = [], [], 0
+    for line in _report_lines(results, applied):
+        if buf and size + 1 + len(line) > limit:
+            parts.append("\n".join(buf))
+            buf, size = [], 0
+        buf.append(line)
+        size += len(line) + 1
+    if buf:
+        parts.append("\n".join(buf))
+    return parts
+
+
+async def reconcile_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        applied = policy() == "fix"
+        results = await run(context.bot, apply=applied)
+        if ADMIN_ID:
+            for part in format_report_parts(results, applied):
+                await context.bot.send_message(chat_id=ADMIN_ID, text=part, parse_mode=ParseMode.HTML)
+    except Exception as e:
+        logger.error("reconcile_job failed: %s", e, exc_info=True)
@@ -0,0 +1,158 @@
+# filename: bot/retention.py
+# -*- coding: utf-8 -*-
+"""
+نگهداری (retention) جداول افزایشی.
+
+هر policy یک جدول، شرط حذف و تعداد روز پیش‌فرض دارد (قابل تغییر با setting «retention_<name>_days»؛
+مقدار 0 یعنی غیرفعال). حذف‌ها در chunk های کوچک و با اتصال جداگانه انجام می‌شوند تا قفل نوشتن
+طولانی نشود. در صورت تنظیم RETENTION_ARCHIVE_PATH، ردیف‌ها قبل از حذف به دیتابیس آرشیو منتقل می‌شوند.
+EXPIRE_POLICIES ردیف‌ها را حذف نمی‌کنند و فقط وضعیتشان را عوض می‌کنند (مثلاً خرید/تمدید pending رهاشده
+-> expired). درخواست‌های شارژ pending (کارت به کارت) منتظر تصمیم ادمین‌اند و هرگز لمس نمی‌شوند.
+در پایان PRAGMA optimize (و در صورت فعال بودن auto_vacuum=INCREMENTAL، incremental_vacuum) اجرا می‌شود.
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from telegram.ext import ContextTypes
+
+import database as db
+from bot import executors
+
+try:
+    from config import RETENTION_ARCHIVE_PATH
+except Exception:
+    RETENTION_ARCHIVE_PATH = ""
+
+try:
+    from config import RETENTION_CHUNK_SIZE
+except Exception:
+    RETENTION_CHUNK_SIZE = 2000
+
+logger = logging.getLogger(__name__)
+
+_TS = "%Y-%m-%d %H:%M:%S"
+
+# name, table, where (یک پارامتر: cutoff), default_days, cutoff format
+POLICIES = [
+    ("reminder_log", "reminder_log", "date < ?", 30, "%Y-%m-%d"),
+    ("transactions_failed", "transactions", "status IN ('failed', 'rejected', 'expired') AND updated_at < ?", 90, _TS),
+    ("promo_code_usages", "promo_code_usages",
+     "code NOT IN (SELECT code FROM promo_codes) AND used_at < ?", 180, _TS),
+    ("user_traffic", "user_traffic", "last_updated < ?", 30, _TS),
+    ("admin_outbox", "admin_outbox", "sent_at IS NOT NULL AND sent_at < ?", 7, _TS),
+]
+
+# name, table, where, set (به جای حذف), default_days, cutoff format
+EXPIRE_POLICIES = [
+    ("transactions_pending", "transactions",
+     "status = 'pending' AND type IN ('purchase', 'renewal') AND updated_at < ?",
+     "status = 'expired', updated_at = datetime('now', 'localtime')", 30, _TS),
+]
+
+
+def _policy_days(name: str, default: int) -> int:
+    try:
+        v = db.get_setting(f"retention_{name}_days")
+        if v is not None and str(v).strip() != "":
+            return max(0, int(float(v)))
+    except Exception:
+        pass
+    return default
+
+
+def _ensure_archive_table(conn: sqlite3.Connection, table: str):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS arch.{table} AS SELECT * FROM main.{table} WHERE 0")
+
+
+def _prune(conn: sqlite3.Connection, table: str, where: str, cutoff: str, archive: bool,
+           set_clause: str | None = None) -> int:
+    """حذف (یا با set_clause به‌روزرسانی) ردیف‌های منطبق بر where در chunk ها؛ تعداد ردیف‌ها."""
+    total = 0
+    while True:
+        rowids = [r[0] for r in conn.execute(
+            f"SELECT rowid FROM main.{table} WHERE {where} LIMIT ?", (cutoff, RETENTION_CHUNK_SIZE)
+        ).fetchall()]
+        if not rowids:
+            break
+        marks = ",".join("?" * len(rowids))
+        # هر chunk یک تراکنش کوتاه (آرشیو + حذف با هم)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if set_clause:
+                conn.execute(f"UPDATE main.{table} SET {set_clause} WHERE rowid IN ({marks})", rowids)
+            else:
+                if archive:
+                    conn.execute(f"INSERT INTO arch.{table} SELECT * FROM main.{table} WHERE rowid IN ({marks})", rowids)
+                conn.execute(f"DELETE FROM main.{table} WHERE rowid IN ({marks})", rowids)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        total += len(rowids)
+        if len(rowids) < RETENTION_CHUNK_SIZE:
+            break
+        time.sleep(0.05)  # فرصت به نویسنده‌های دیگر
+    return total
+
+
+def build_plan(policies: list | None = None, expire_policies: list | None = None) -> list:
+    """
+    policy ها با cutoff محاسبه‌شده (خواندن settings روی اتصال اصلی، در event loop).
+    هر عضو: (name, table, where, cutoff, set_clause)؛ set_clause برای policy های حذف None است.
+    """
+    plan = []
+    entries = [(n, t, w, None, d, f) for n, t, w, d, f in (POLICIES if policies is None else policies)]
+    entries += EXPIRE_POLICIES if expire_policies is None else expire_policies
+    for name, table, where, set_clause, default_days, fmt in entries:
+        days = _policy_days(name, default_days)
+        if days > 0:
+            plan.append((name, table, where, (datetime.now() - timedelta(days=days)).strftime(fmt), set_clause))
+    return plan
+
+
+def run_retention(plan: list) -> dict:
+    """
+    اجرای plan روی اتصال جداگانه (sync؛ از job با executors.run_io صدا زده می‌شود).
+    خروجی: {policy_name: deleted_rows (یا ردیف‌های به‌روزشده در EXPIRE_POLICIES)}
+    """
+    result = {}
+    conn = sqlite3.connect(db.DB_NAME, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA busy_timeout = 30000")
+        archive = bool(RETENTION_ARCHIVE_PATH)
+        if archive:
+            conn.execute("ATTACH DATABASE ? AS arch", (os.path.abspath(RETENTION_ARCHIVE_PATH),))
+
+        for name, table, where, cutoff, set_clause in plan:
+            try:
+                if archive and not set_clause:
+                    _ensure_archive_table(conn, table)
+                result[name] = _prune(conn, table, where, cutoff, archive, set_clause)
+            except sqlite3.Error as e:
+                logger.error("Retention policy %s failed: %s", name, e)
+                result[name] = -1
+
+        if archive:
+            conn.execute("DETACH DATABASE arch")
+
+        conn.execute("PRAGMA optimize")
+        if int(conn.execute("PRAGMA auto_vacuum").fetchone()[0] or 0) == 2:
+            conn.execute("PRAGMA incremental_vacuum(2000)")
+    finally:
+        conn.close()
+    return result
+
+
+async def retention_job(context: ContextTypes.DEFAULT_TYPE):
+    logger.info("Job: running retention...")
+    started = time.monotonic()
+    try:
+        result = await executors.run_io(run_retention, build_plan())
+        deleted = {k: v for k, v in result.items() if v}
+        logger.info("Retention finished in %.1fs: %s", time.monotonic() - started, deleted or "nothing to prune")
+    except Exception as e:
+        logger.error("retention_job failed: %s", e, exc_info=True)
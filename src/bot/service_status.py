@@ -0,0 +1,177 @@
+# filename: bot/service_status.py
+# -*- coding: utf-8 -*-
+"""
+ارزیابی دسته‌ای وضعیت سرویس‌ها برای jobها (بدون ساخت متن/تاریخ شمسی).
+
+ورودی ستونی است (to_columns): برای هر فیلد پنل/DB یک لیست هم‌طول. evaluate در یک پاس روی ستون‌ها
+روزهای باقیمانده، منقضی بودن، حجم باقیمانده و پرچم‌های آستانه یادآوری را به صورت عدد برمی‌گرداند.
+منطق همان utils.get_service_status / _format_expiry_and_days است، با این تفاوت که:
+- زمان‌ها epoch ثانیه (float) هستند و هر رشته تاریخ یک بار در کل batch پارس می‌شود؛
+- now و منطقه زمانی محلی یک بار برای کل batch محاسبه می‌شوند؛
+- «روز تا تاریخ انقضا» مستقیم از epoch حساب می‌شود (بدون رفت‌وبرگشت از تاریخ شمسی).
+"""
+
+import math
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from bot.utils import parse_date_flexible
+
+DAY_SEC = 86400.0
+_FRESH_SEC = 36 * 3600
+_FUTURE_SLACK_SEC = 2 * 3600
+_START_KEYS = ("last_reset_time", "start_date", "created_at", "create_time")
+_USAGE_KEYS = ("current_usage_GB", "usage_GB", "used_GB")
+PANEL_FIELDS = ("expire", "package_days", "status", "usage_limit_GB") + _USAGE_KEYS + _START_KEYS
+
+
+def to_columns(infos: List[dict], records: List[dict]) -> Dict[str, list]:
+    """infos (پاسخ پنل) و records (ردیف active_services) هم‌ترتیب -> ستون‌ها."""
+    cols = {k: [(i or {}).get(k) for i in infos] for k in PANEL_FIELDS}
+    cols["db_created_at"] = [((r or {}).get("created_at") or (r or {}).get("create_time")) for r in records]
+    return cols
+
+
+def _num(v, default: float = 0.0) -> float:
+    try:
+        if v is None or (isinstance(v, str) and v.strip().lower() in ("", "none", "null", "nan")):
+            return default
+        return float(v)
+    except Exception:
+        return default
+
+
+class _EpochParser:
+    """رشته/عدد تاریخ -> epoch ثانیه؛ مقدارهای تکراری فقط یک بار پارس می‌شوند."""
+
+    def __init__(self):
+        self._memo: Dict[object, Optional[float]] = {}
+        self._local_tz = datetime.now().astimezone().tzinfo
+
+    def __call__(self, v) -> Optional[float]:
+        if v is None or v == "":
+            return None
+        try:
+            return self._memo[v]
+        except KeyError:
+            pass
+        except TypeError:
+            return None
+        ts = None
+        try:
+            if isinstance(v, (int, float)):
+                ts = float(v)
+            else:
+                s = str(v).strip()
+                try:
+                    ts = float(s)
+                except ValueError:
+                    dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+                    if dt.tzinfo is None:
+                        dt = dt.replace(tzinfo=self._local_tz)
+                    ts = dt.timestamp()
+            if ts is not None and not math.isfinite(ts):
+                ts = None
+            elif ts is not None and ts > 1e12:
+                ts /= 1000.0
+        except ValueError:
+            dt = parse_date_flexible(v)  # قالب‌های غیر ISO (مثل 2024/01/02)
+            ts = dt.timestamp() if dt else None
+        self._memo[v] = ts
+        return ts
+
+
+def _panel_expire(v) -> Optional[float]:
+    # مثل utils._get_panel_expire_dt: فقط مقدار عددی
+    if isinstance(v, (int, float, str)):
+        try:
+            val = float(v)
+        except Exception:
+            return None
+        return val / 1000.0 if val > 1e12 else val
+    return None
+
+
+def evaluate(
+    cols: Dict[str, list],
+    now: Optional[float] = None,
+    days_threshold: Optional[int] = None,
+    gb_threshold: Optional[float] = None,
+) -> Dict[str, list]:
+    """
+    خروجی (ستونی، هم‌طول ورودی):
+      days_left       همان عدد utils._format_expiry_and_days (سقف روزهای باقیمانده، حداقل 0)
+      expire_ts       epoch انقضا یا None (نامشخص)
+      days_to_expiry  اختلاف تاریخ تقویمی محلی انقضا با امروز یا None
+      expired         مثل سومین خروجی utils.get_service_status
+      remaining_gb    حجم باقیمانده یا None (نامحدود/نامشخص)
+      remind_days     0 < days_to_expiry <= days_threshold و منقضی نشده
+      remind_gb       remaining_gb <= gb_threshold و منقضی نشده
+    """
+    now = datetime.now().timestamp() if now is None else float(now)
+    today = date.fromtimestamp(now)
+    epoch = _EpochParser()
+    n = len(cols["package_days"])
+
+    out = {k: [None] * n for k in ("days_left", "expire_ts", "days_to_expiry", "expired", "remaining_gb", "remind_days", "remind_gb")}
+    starts = [cols[k] for k in _START_KEYS]
+    usages = [cols[k] for k in _USAGE_KEYS]
+
+    for i in range(n):
+        try:
+            pkg = int(cols["package_days"][i] or 0)
+        except Exception:
+            pkg = 0
+
+        exp = _panel_expire(cols["expire"][i])
+        days = max(0, math.ceil((exp - now) / DAY_SEC)) if exp is not None else None
+
+        created = epoch(cols["db_created_at"][i])
+        fresh = created is not None and 0 <= now - created <= _FRESH_SEC
+        if pkg > 0:
+            if fresh:
+                start = created
+            else:
+                cands = [t for t in (epoch(col[i]) for col in starts) if t is not None and t <= now + _FUTURE_SLACK_SEC]
+                start = max(cands) if cands else created
+            if start is not None:
+                alt = start + pkg * DAY_SEC
+                if days is None or (fresh and days < max(0, pkg - 2)) or days > pkg + 2:
+                    exp, days = alt, max(0, math.ceil((alt - now) / DAY_SEC))
+            if exp is None:
+                exp, days = now + pkg * DAY_SEC, pkg
+        days = int(days or 0)
+
+        limit = _num(cols["usage_limit_GB"][i])
+        used = _num(cols["current_usage_GB"][i])
+        expired = (
+            days <= 0
+            or str(cols["status"][i] or "").lower() in ("disabled", "limited")
+            or (limit > 0 and used >= limit)
+        )
+
+        raw_used = next((u[i] for u in usages if u[i] is not None), None)
+        remaining = None
+        if limit > 0 and raw_used is not None:
+            try:
+                remaining = max(0.0, limit - float(raw_used))
+            except Exception:
+                remaining = None
+
+        try:
+            cal = (date.fromtimestamp(exp) - today).days if exp is not None else None
+        except (OverflowError, OSError, ValueError):
+            cal = None
+
+        out["days_left"][i] = days
+        out["expire_ts"][i] = exp
+        out["days_to_expiry"][i] = cal
+        out["expired"][i] = expired
+        out["remaining_gb"][i] = remaining
+        out["remind_days"][i] = bool(
+            not expired and days_threshold and cal is not None and 0 < cal <= days_threshold
+        )
+        out["remind_gb"][i] = bool(
+            not expired and gb_threshold is not None and remaining is not None and remaining <= float(gb_threshold)
+        )
+    return out
@@ -0,0 +1,121 @@
+# filename: bot/update_processor.py
+# -*- coding: utf-8 -*-
+"""
+پردازش همزمان آپدیت‌ها با حفظ ترتیب برای هر چت.
+
+آپدیت‌های یک چت پشت سر هم اجرا می‌شوند (state کانورسیشن‌ها سازگار می‌ماند)
+ولی چت‌های مختلف موازی پردازش می‌شوند. سقف کل همزمانی همان max_concurrent_updates است.
+gate (اختیاری، مثل antiflood.gate) قبل از قفل چت اجرا می‌شود؛ آپدیت ردشده اصلاً صف نمی‌شود.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSerializedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_refs: Dict[int, int] = {}
+        self.gate: Optional[Callable[[object], Awaitable[bool]]] = None
+        # metrics
+        self.pending = 0
+        self.running = 0
+        self.processed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @staticmethod
+    def _chat_key(update: object) -> int | None:
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return update.effective_user.id
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if self.gate is not None and not await self.gate(update):
+            coroutine.close()
+            self.rejected += 1
+            return
+        # ابتدا قفل چت و سپس semaphore کلی؛ تا آپدیت‌های صف‌شده یک چت ظرفیت کلی را اشغال نکنند.
+        self.pending += 1
+        enqueued = time.monotonic()
+        key = self._chat_key(update)
+        if key is None:
+            await super().process_update(update, self._timed(coroutine, enqueued))
+            return
+
+        lock = self._chat_locks.get(key)
+        if lock is None:
+            lock = self._chat_locks[key] = asyncio.Lock()
+        self._chat_refs[key] = self._chat_refs.get(key, 0) + 1
+        try:
+            async with lock:
+                await super().process_update(update, self._timed(coroutine, enqueued))
+        finally:
+            self._chat_refs[key] -= 1
+            if self._chat_refs[key] <= 0:
+                self._chat_refs.pop(key, None)
+                self._chat_locks.pop(key, None)
+
+    async def _timed(self, coroutine: Awaitable[Any], enqueued: float) -> Any:
+        waited = time.monotonic() - enqueued
+        self.pending -= 1
+        self.running += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        try:
+            return await coroutine
+        finally:
+            self.running -= 1
+            self.processed += 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def metrics(self) -> dict:
+        return {
+            "limit": self.max_concurrent_updates,
+            "pending": self.pending,
+            "running": self.running,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "active_chats": len(self._chat_locks),
+            "avg_wait_ms": round((self.wait_total / self.processed) * 1000, 1) if self.processed else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 1),
+        }
+
+
+_processor: ChatSerializedUpdateProcessor | None = None
+
+
+def get_processor(max_concurrent_updates: int) -> ChatSerializedUpdateProcessor:
+    global _processor
+    _processor = ChatSerializedUpdateProcessor(max_concurrent_updates)
+    return _processor
+
+
+def format_metrics() -> str:
+    if _processor is None:
+        return "پردازش ترتیبی (همزمانی غیرفعال)"
+    m = _processor.metrics()
+    return (
+        f"updates: در صف {m['pending']} | در حال اجرا {m['running']}/{m['limit']} | "
+        f"چت‌های فعال {m['active_chats']} | ردشده {m['rejected']} | انتظار میانگین {m['avg_wait_ms']}ms (حداکثر {m['max_wait_ms']}ms)"
+    )
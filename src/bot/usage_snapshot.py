@@ -0,0 +1,137 @@
+# filename: bot/usage_snapshot.py
+# -*- coding: utf-8 -*-
+"""
+خلاصه مصرف کاربر از snapshot دیتابیس (service_state + سری زمانی traffic_*)؛ بدون تماس با پنل.
+مورد استفاده: صفحه «📊 مصرف من» و مینی‌اپ کاربر.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+
+import database as db
+from bot import antiflood, utils
+
+logger = logging.getLogger(__name__)
+
+
+def age_seconds(updated_at: Optional[str]) -> Optional[int]:
+    dt = utils.parse_date_flexible(updated_at) if updated_at else None
+    if not dt:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return max(0, int((datetime.now() - dt).total_seconds()))
+
+
+def format_age(seconds: Optional[int]) -> str:
+    if seconds is None:
+        return "نامشخص"
+    if seconds < 60:
+        return "لحظاتی پیش"
+    if seconds < 3600:
+        return utils.to_persian_digits(f"{seconds // 60}") + " دقیقه پیش"
+    if seconds < 86400:
+        return utils.to_persian_digits(f"{seconds // 3600}") + " ساعت پیش"
+    return utils.to_persian_digits(f"{seconds // 86400}") + " روز پیش"
+
+
+def service_rows(user_id: int) -> list[dict]:
+    services = db.get_user_services(user_id) or []
+    states = db.get_service_states_for_user(user_id)
+    rows = []
+    for svc in services:
+        sid = int(svc["service_id"])
+        st = states.get(sid)
+        row = {
+            "service_id": sid,
+            "name": svc.get("name") or "سرویس",
+            "usage_gb": None,
+            "limit_gb": None,
+            "expire": None,
+            "days_left": None,
+            "status": None,
+            "is_expired": None,
+            "updated_at": None,
+            "age_sec": None,
+        }
+        if st:
+            info = st.get("info") or {}
+            status_text, expire_jalali, is_expired = utils.get_service_status(info, svc)
+            _, days_left = utils._format_expiry_and_days(info, svc)
+            row.update({
+                "usage_gb": round(float(st.get("usage_gb") or 0.0), 3),
+                "limit_gb": round(float(st.get("limit_gb") or 0.0), 3),
+                "expire": expire_jalali,
+                "days_left": int(days_left),
+                "status": status_text,
+                "is_expired": bool(is_expired),
+                "updated_at": st.get("updated_at"),
+                "age_sec": age_seconds(st.get("updated_at")),
+            })
+        rows.append(row)
+    rows.sort(key=lambda r: float(r["usage_gb"] or 0.0), reverse=True)
+    return rows
+
+
+def user_payload(user_id: int) -> dict:
+    rows = service_rows(user_id)
+    now = int(time.time())
+    ages = [r["age_sec"] for r in rows if r["age_sec"] is not None]
+    return {
+        "services": rows,
+        "total_usage_gb": round(sum(float(r["usage_gb"] or 0.0) for r in rows), 3),
+        "oldest_age_sec": max(ages) if ages else None,
+        "history_hourly": db.get_traffic_series(now - 48 * 3600, now + 1, step=3600, user_id=user_id),
+        "history_daily": db.get_traffic_series(now - 30 * 86400, now + 1, step=86400, user_id=user_id),
+        "generated_at": now,
+    }
+
+
+def snapshot_summary(user_id: int) -> tuple[float, Optional[int], int]:
+    """(مجموع مصرف GB، سن قدیمی‌ترین snapshot به ثانیه، تعداد سرویس‌ها) بدون تماس با پنل."""
+    rows = service_rows(user_id)
+    if not rows:
+        return 0.0, None, 0
+    ages = [r["age_sec"] for r in rows]
+    if all(a is None for a in ages):
+        # هنوز service_state ثبت نشده؛ اسنپ‌شات قدیمی user_traffic
+        try:
+            return float(db.get_total_user_traffic(user_id) or 0.0), None, len(rows)
+        except Exception:
+            return 0.0, None, len(rows)
+    total = sum(float(r["usage_gb"] or 0.0) for r in rows)
+    # اگر سرویسی هنوز snapshot ندارد، سن نامشخص (= کهنه) در نظر گرفته می‌شود
+    return total, (None if None in ages else max(ages)), len(rows)
+
+
+async def refresh_user_services(user_id: int) -> int:
+    """
+    دریافت زنده اطلاعات سرویس‌های کاربر از پنل و ذخیره در service_state.
+    درخواست‌های همزمان برای یک کاربر در یک تماس ادغام می‌شوند. خروجی: تعداد سرویس‌های به‌روزشده.
+    """
+    return await antiflood.coalesce(f"user:{user_id}", lambda: _refresh_user_services(user_id))
+
+
+async def _refresh_user_services(user_id: int) -> int:
+    import hiddify_api
+
+    services = [s for s in (db.get_user_services(user_id) or []) if s.get("sub_uuid")]
+
+    async def fetch(svc):
+        try:
+            info = await hiddify_api.get_user_info(svc["sub_uuid"])
+        except Exception as e:
+            logger.warning("Live refresh failed for service %s: %s", svc.get("service_id"), e)
+            return None
+        if isinstance(info, dict) and not info.get("_not_found"):
+            return (int(svc["service_id"]), user_id, info)
+        return None
+
+    results = await asyncio.gather(*(fetch(s) for s in services))
+    states = [r for r in results if r]
+    if states:
+        db.upsert_service_states(states)
+    return len(states)
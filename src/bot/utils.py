@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 import io
 import sqlite3
-import random
 import logging
 from typing import Union, Optional, Tuple
 from datetime import datetime, timedelta, timezone
@@ -12,6 +11,7 @@ from urllib.parse import quote_plus, urlparse
 
 import qrcode
 import database as db
+from bot import domain_health
 
 try:
     from config import PANEL_DOMAIN, SUB_DOMAINS, PANEL_SECRET_UUID, SUB_PATH
@@ -186,12 +186,12 @@ def build_subscription_url(
         panel_domain = panel.get("panel_domain") or ""
         # انتخاب هاست از sub_domains یا خود panel_domain
         domains = [h for h in p_subs if h] or ([_hostname_only(panel_domain)] if panel_domain else [])
-        host = _hostname_only(random.choice(domains) if domains else panel_domain)
+        host = _hostname_only(domain_health.pick_host(domains) if domains else panel_domain)
         client_secret = _clean_path(panel.get("panel_secret_uuid"))
         sub_path = _clean_path(panel.get("sub_path") or "sub")
     else:
         domains = _pick_domains_from_settings(plan_gb)
-        host = _hostname_only(random.choice(domains) if domains else PANEL_DOMAIN)
+        host = _hostname_only(domain_health.pick_host(domains) if domains else PANEL_DOMAIN)
         client_secret = _clean_path(PANEL_SECRET_UUID)
         sub_path = _clean_path(SUB_PATH) or "sub"
 
@@ -231,6 +231,11 @@ def make_qr_bytes(data: str) -> io.BytesIO:
     return bio
 
 
+def render_qr_png(data: str) -> bytes:
+    """نسخه picklable برای اجرا در process pool (bot.executors.run_cpu)."""
+    return make_qr_bytes(data).getvalue()
+
+
 def _get_panel_expire_dt(user_data: dict) -> Optional[datetime]:
     expire_ts = user_data.get("expire")
     if isinstance(expire_ts, (int, float, str)):
@@ -6,11 +6,17 @@ import hmac
 import json
 import hashlib
 import asyncio
+import gzip
 from typing import Dict, Any, Optional
 
 from aiohttp import web
 import database as db
 
+try:
+    import brotli  # اختیاری؛ در نبودِ آن فقط gzip
+except Exception:
+    brotli = None
+
 # Configs (قابل ست‌شدن در config.py)
 try:
     import config as _cfg
@@ -23,6 +29,15 @@ DEFAULT_WEBAPP_PORT = int(getattr(_cfg, "WEBAPP_PORT", 8081))
 DEFAULT_WEBAPP_BASE_URL = getattr(_cfg, "WEBAPP_BASE_URL", f"http://localhost:{DEFAULT_WEBAPP_PORT}")
 BOT_TOKEN = getattr(_cfg, "BOT_TOKEN", "")
 
+# Webhook (وقتی BOT_UPDATE_MODE = "webhook")
+WEBHOOK_PATH = getattr(_cfg, "WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET_TOKEN = getattr(_cfg, "WEBHOOK_SECRET_TOKEN", "")
+WEBHOOK_RECORD_PATH = getattr(_cfg, "WEBHOOK_RECORD_PATH", "")  # اختیاری: ذخیره آپدیت‌ها برای replay/بنچمارک
+
+# Caching / compression
+WEBAPP_STATIC_MAX_AGE = int(getattr(_cfg, "WEBAPP_STATIC_MAX_AGE", 3600))
+WEBAPP_COMPRESS_MIN_BYTES = int(getattr(_cfg, "WEBAPP_COMPRESS_MIN_BYTES", 512))
+
 # ---------- helpers for effective runtime config ----------
 def _get_effective_port() -> int:
     try:
@@ -90,6 +105,17 @@ def _verify_init_data(init_data: str) -> bool:
     except Exception:
         return False
 
+def _init_data_user_id(init_data: str) -> Optional[int]:
+    """شناسه کاربر از فیلد user در initData (فقط بعد از _verify_init_data معتبر است)."""
+    try:
+        from urllib.parse import parse_qsl
+        data = dict(parse_qsl(init_data, strict_parsing=True))
+        user = json.loads(data.get("user") or "{}")
+        uid = user.get("id")
+        return int(uid) if uid is not None else None
+    except Exception:
+        return None
+
 # ---------- Stats helpers ----------
 def _get_stats_payload() -> Dict[str, Any]:
     # Basic stats from db.get_stats
@@ -218,21 +244,301 @@ STATS_HTML = """<!doctype html>
 </html>
 """
 
+USAGE_HTML = """<!doctype html>
+<html lang="fa" dir="rtl">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width,initial-scale=1,maximum-scale=1">
+<title>مصرف من</title>
+<script src="https://telegram.org/js/telegram-web-app.js"></script>
+<style>
+  body { font-family: sans-serif; margin: 0; background: var(--tg-theme-bg-color, #111); color: var(--tg-theme-text-color, #fff); }
+  .wrap { padding: 16px; }
+  .title { font-weight: 700; font-size: 18px; margin: 8px 0 4px; }
+  .fresh { font-size: 12px; opacity: 0.75; margin-bottom: 12px; }
+  .fresh.stale { color: #f0a020; opacity: 1; }
+  .card { background: rgba(255,255,255,0.06); border-radius: 12px; padding: 14px; margin: 10px 0; }
+  .row { display: flex; justify-content: space-between; margin: 4px 0; font-size: 14px; }
+  .bar { height: 8px; background: rgba(255,255,255,0.12); border-radius: 4px; overflow: hidden; margin: 8px 0; }
+  .bar > div { height: 100%; background: var(--tg-theme-button-color, #2ea6ff); }
+  .chart { display: flex; align-items: flex-end; gap: 2px; height: 90px; margin-top: 8px; }
+  .chart > div { flex: 1; background: var(--tg-theme-button-color, #2ea6ff); min-height: 1px; border-radius: 2px 2px 0 0; }
+  .muted { opacity: 0.75; font-size: 12px; }
+</style>
+</head>
+<body>
+<div class="wrap">
+  <div class="title">📊 مصرف من</div>
+  <div id="fresh" class="fresh">—</div>
+  <div class="card"><div class="row"><span>مجموع مصرف</span><b id="total">—</b></div></div>
+  <div id="services"></div>
+  <div class="card"><div>مصرف ۴۸ ساعت اخیر (ساعتی)</div><div id="hourly" class="chart"></div></div>
+  <div class="card"><div>مصرف ۳۰ روز اخیر (روزانه)</div><div id="daily" class="chart"></div></div>
+</div>
+<script>
+(function(){
+  const tg = window.Telegram && window.Telegram.WebApp;
+  if (tg) { tg.expand(); tg.ready(); }
+  function fa(n, d){ return Number(n || 0).toLocaleString('fa-IR', {maximumFractionDigits: d === undefined ? 2 : d}); }
+  function age(s){
+    if (s === null || s === undefined) return 'نامشخص';
+    if (s < 60) return 'لحظاتی پیش';
+    if (s < 3600) return fa(Math.floor(s/60),0) + ' دقیقه پیش';
+    if (s < 86400) return fa(Math.floor(s/3600),0) + ' ساعت پیش';
+    return fa(Math.floor(s/86400),0) + ' روز پیش';
+  }
+  function chart(el, points){
+    const max = Math.max(0.001, ...points.map(p => p.gb));
+    el.innerHTML = '';
+    points.forEach(p => {
+      const b = document.createElement('div');
+      b.style.height = (100 * p.gb / max) + '%';
+      b.title = fa(p.gb) + ' GB';
+      el.appendChild(b);
+    });
+    if (!points.length) el.outerHTML = '<div class="muted">هنوز داده‌ای ثبت نشده است.</div>';
+  }
+  function esc(s){ const d = document.createElement('div'); d.textContent = s; return d.innerHTML; }
+  async function load(){
+    try {
+      const resp = await fetch('/miniapp/api/usage', { headers: { 'X-Telegram-Web-App-Init-Data': tg ? (tg.initData || '') : '' } });
+      if (!resp.ok) throw new Error('HTTP ' + resp.status);
+      const d = await resp.json();
+      // پاسخ 304 همان بدنه قبلی است؛ سن‌ها نسبت به generated_at همان پاسخ به‌روز می‌شوند
+      const lag = d.generated_at ? Math.max(0, Date.now() / 1000 - d.generated_at) : 0;
+      const since = s => (s === null || s === undefined) ? s : s + lag;
+      const fresh = document.getElementById('fresh');
+      fresh.textContent = 'آخرین بروزرسانی: ' + age(since(d.oldest_age_sec));
+      if (d.oldest_age_sec === null || since(d.oldest_age_sec) > 3600) fresh.classList.add('stale');
+      document.getElementById('total').textContent = fa(d.total_usage_gb) + ' GB';
+      const box = document.getElementById('services');
+      box.innerHTML = '';
+      if (!d.services.length) box.innerHTML = '<div class="card muted">سرویس فعالی ندارید.</div>';
+      d.services.forEach(s => {
+        const limit = s.limit_gb || 0, used = s.usage_gb || 0;
+        const pct = limit > 0 ? Math.min(100, 100 * used / limit) : 0;
+        const c = document.createElement('div');
+        c.className = 'card';
+        c.innerHTML =
+          '<div class="row"><b>' + esc(s.name) + '</b><span>' + esc(s.status || '—') + '</span></div>' +
+          (s.updated_at ? (
+            '<div class="bar"><div style="width:' + pct + '%"></div></div>' +
+            '<div class="row"><span>مصرف</span><span>' + fa(used) + (limit > 0 ? ' / ' + fa(limit) : '') + ' GB</span></div>' +
+            '<div class="row"><span>انقضا</span><span>' + esc(s.expire || '—') + ' (' + fa(s.days_left, 0) + ' روز)</span></div>' +
+            '<div class="muted">' + age(since(s.age_sec)) + '</div>'
+          ) : '<div class="muted">هنوز اطلاعاتی ثبت نشده است.</div>');
+        box.appendChild(c);
+      });
+      chart(document.getElementById('hourly'), d.history_hourly || []);
+      chart(document.getElementById('daily'), d.history_daily || []);
+    } catch (e) {
+      alert('خطا در دریافت اطلاعات مصرف: ' + e.message);
+    }
+  }
+  load();
+})();
+</script>
+</body>
+</html>
+"""
+
+# ---------- Caching / compression ----------
+# name -> {"etag": str, "variants": {encoding|None: bytes}, "content_type": str}
+_static_assets: Dict[str, Dict[str, Any]] = {}
+# فیلدهایی از پاسخ JSON که فقط با گذشت زمان تغییر می‌کنند و در ETag حساب نمی‌شوند
+_VOLATILE_KEYS = frozenset({"generated_at", "age_sec", "oldest_age_sec"})
+
+
+def _compress(body: bytes, encoding: str, static: bool) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if static else 5)
+    return gzip.compress(body, compresslevel=9 if static else 6, mtime=0)
+
+def _precompress_static() -> None:
+    """HTML های ثابت یک بار در startup فشرده می‌شوند (gzip و در صورت نصب بودن brotli)."""
+    _static_assets.clear()
+    for name, html in (("stats", STATS_HTML), ("usage", USAGE_HTML)):
+        body = html.encode("utf-8")
+        variants = {None: body, "gzip": _compress(body, "gzip", True)}
+        if brotli is not None:
+            variants["br"] = _compress(body, "br", True)
+        _static_assets[name] = {
+            "etag": hashlib.sha256(body).hexdigest()[:32],
+            "variants": variants,
+            "content_type": "text/html",
+        }
+
+def _negotiate_encoding(request: web.Request, available) -> Optional[str]:
+    """بهترین encoding از Accept-Encoding (br بر gzip مقدم است؛ q=0 یعنی ممنوع)."""
+    accepted = {}
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    for enc in ("br", "gzip"):
+        if enc in available and accepted.get(enc, accepted.get("*", 0.0)) > 0:
+            return enc
+    return None
+
+def _variant_etag(base: str, encoding: Optional[str]) -> str:
+    # ETag قوی باید برای هر نمایش (encoding) متفاوت باشد
+    return f'"{base}-{encoding}"' if encoding else f'"{base}"'
+
+def _etag_matches(request: web.Request, base: str) -> bool:
+    inm = request.headers.get("If-None-Match", "")
+    if not inm:
+        return False
+    if inm.strip() == "*":
+        return True
+    for tag in inm.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == base or tag.startswith(base + "-"):
+            return True
+    return False
+
+def _cached_response(request: web.Request, base_etag: str, variants: Dict[Optional[str], bytes],
+                     content_type: str, cache_control: str, vary: str) -> web.Response:
+    encoding = _negotiate_encoding(request, [e for e in variants if e])
+    headers = {
+        "ETag": _variant_etag(base_etag, encoding),
+        "Cache-Control": cache_control,
+        "Vary": vary,
+    }
+    if _etag_matches(request, base_etag):
+        return web.Response(status=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return web.Response(body=variants[encoding], headers=headers, content_type=content_type, charset="utf-8")
+
+def _static_response(request: web.Request, name: str) -> web.Response:
+    if name not in _static_assets:
+        _precompress_static()
+    asset = _static_assets[name]
+    return _cached_response(
+        request, asset["etag"], asset["variants"], asset["content_type"],
+        f"public, max-age={WEBAPP_STATIC_MAX_AGE}", "Accept-Encoding",
+    )
+
+def _without_volatile(obj):
+    """حذف فیلدهایی که فقط با گذشت زمان عوض می‌شوند (در هر عمقی) برای محاسبه ETag."""
+    if isinstance(obj, dict):
+        return {k: _without_volatile(v) for k, v in obj.items() if k not in _VOLATILE_KEYS}
+    if isinstance(obj, list):
+        return [_without_volatile(v) for v in obj]
+    return obj
+
+
+def _json_response(request: web.Request, payload: Dict[str, Any]) -> web.Response:
+    """
+    JSON با ETag (بدون فیلدهای وابسته به زمان _VOLATILE_KEYS) و فشرده‌سازی در صورت توافق.
+    private, no-cache: کلاینت هر بار اعتبارسنجی می‌کند و در صورت تطابق 304 می‌گیرد؛ صفحه مینی‌اپ
+    سن‌ها را با generated_at همان بدنه به زمان حال می‌رساند.
+    """
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    stable = _without_volatile(payload)
+    etag = hashlib.sha256(
+        json.dumps(stable, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:32]
+
+    variants: Dict[Optional[str], bytes] = {None: body}
+    if len(body) >= WEBAPP_COMPRESS_MIN_BYTES and not _etag_matches(request, etag):
+        enc = _negotiate_encoding(request, ["br", "gzip"] if brotli is not None else ["gzip"])
+        if enc:
+            variants[enc] = _compress(body, enc, False)
+    return _cached_response(
+        request, etag, variants, "application/json",
+        "private, no-cache", "Accept-Encoding, X-Telegram-Web-App-Init-Data",
+    )
+
 # ---------- Aiohttp server ----------
 _app: Optional[web.Application] = None
 _runner: Optional[web.AppRunner] = None
 _site: Optional[web.TCPSite] = None
 _lock = asyncio.Lock()
 
+# PTB Application برای تحویل آپدیت‌های webhook (در حالت polling None می‌ماند)
+_tg_application = None
+
+
+def set_telegram_application(application) -> None:
+    global _tg_application
+    _tg_application = application
+
+
+def is_running() -> bool:
+    return _site is not None
+
+def public_url(path: str) -> Optional[str]:
+    """آدرس عمومی مسیر مینی‌اپ؛ فقط https (شرط دکمه WebApp تلگرام)."""
+    base = _resolve_base_url(_get_effective_port())
+    if not base or not base.startswith("https://"):
+        return None
+    return base.rstrip("/") + path
+
 async def _handle_stats_page(request: web.Request) -> web.Response:
-    return web.Response(text=STATS_HTML, content_type="text/html; charset=utf-8")
+    return _static_response(request, "stats")
 
 async def _handle_stats_api(request: web.Request) -> web.Response:
     init_data = request.headers.get("X-Telegram-Web-App-Init-Data", "")
     if not _verify_init_data(init_data):
         return web.json_response({"ok": False, "error": "unauthorized"}, status=403)
     payload = _get_stats_payload()
-    return web.json_response(payload)
+    return _json_response(request, payload)
+
+async def _handle_usage_page(request: web.Request) -> web.Response:
+    return _static_response(request, "usage")
+
+async def _handle_usage_api(request: web.Request) -> web.Response:
+    init_data = request.headers.get("X-Telegram-Web-App-Init-Data", "")
+    if not _verify_init_data(init_data):
+        return web.json_response({"ok": False, "error": "unauthorized"}, status=403)
+    user_id = _init_data_user_id(init_data)
+    if not user_id:
+        return web.json_response({"ok": False, "error": "no user"}, status=403)
+    from bot import usage_snapshot
+    return _json_response(request, usage_snapshot.user_payload(user_id))
+
+async def _handle_webhook(request: web.Request) -> web.Response:
+    """
+    دریافت آپدیت تلگرام و تحویل به application.update_queue.
+    هدر X-Telegram-Bot-Api-Secret-Token باید با WEBHOOK_SECRET_TOKEN برابر باشد؛ بدون secret هیچ آپدیتی پذیرفته نمی‌شود.
+    """
+    if _tg_application is None:
+        return web.json_response({"ok": False, "error": "webhook disabled"}, status=404)
+    received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not WEBHOOK_SECRET_TOKEN or not hmac.compare_digest(received, WEBHOOK_SECRET_TOKEN):
+        return web.json_response({"ok": False, "error": "unauthorized"}, status=403)
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response({"ok": False, "error": "bad json"}, status=400)
+
+    if WEBHOOK_RECORD_PATH:
+        try:
+            with open(WEBHOOK_RECORD_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(data, ensure_ascii=False) + "\n")
+        except Exception:
+            pass
+
+    from telegram import Update
+    try:
+        update = Update.de_json(data, _tg_application.bot)
+    except Exception:
+        return web.json_response({"ok": False, "error": "bad update"}, status=400)
+    await _tg_application.update_queue.put(update)
+    return web.Response(status=200)
 
 async def start_webapp() -> None:
     """
@@ -246,9 +552,14 @@ async def start_webapp() -> None:
             await stop_webapp()
 
         port = _get_effective_port()
+        _precompress_static()
         _app = web.Application()
         _app.router.add_get("/miniapp/stats", _handle_stats_page)
         _app.router.add_get("/miniapp/api/stats", _handle_stats_api)
+        _app.router.add_get("/miniapp/usage", _handle_usage_page)
+        _app.router.add_get("/miniapp/api/usage", _handle_usage_api)
+        if _tg_application is not None:
+            _app.router.add_post(WEBHOOK_PATH, _handle_webhook)
 
         _runner = web.AppRunner(_app)
         await _runner.setup()
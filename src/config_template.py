@@ -67,4 +67,102 @@ EXPIRY_REMINDER_DAYS = 3
 # USAGE & DEVICE LIMITS CONFIGURATION
 # ===============================================================
 USAGE_ALERT_THRESHOLD = 0.8
-DEVICE_LIMIT_ALERT_ENABLED = True
\ No newline at end of file
+DEVICE_LIMIT_ALERT_ENABLED = True
+# ===============================================================
+# PERFORMANCE / CACHING
+# ===============================================================
+# تعداد تصاویر QR نگه‌داری‌شده در حافظه (LRU)
+QR_CACHE_SIZE = 256
+
+# Executor مشترک برای کارهای سنگین (رندر QR، بررسی/تهیه بکاپ)
+EXECUTOR_CPU_WORKERS = 2
+EXECUTOR_IO_WORKERS = 4
+EXECUTOR_QUEUE_SIZE = 64
+EXECUTOR_QUEUE_TIMEOUT_SEC = 30
+
+# ===============================================================
+# UPDATE MODE (POLLING / WEBHOOK)
+# ===============================================================
+# "polling" (پیش‌فرض) یا "webhook". در حالت webhook آپدیت‌ها روی سرور aiohttp مینی‌اپ
+# (WEBAPP_HOST:WEBAPP_PORT + WEBHOOK_PATH) دریافت می‌شوند؛ جلوی آن یک reverse proxy با HTTPS لازم است.
+BOT_UPDATE_MODE = "polling"
+WEBHOOK_URL = ""              # مثال: "https://bot.example.com/telegram/webhook"
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_SECRET_TOKEN = ""     # رشته تصادفی (A-Z a-z 0-9 _ -)؛ اگر خالی باشد در هر اجرا یک مقدار تصادفی ساخته می‌شود
+WEBHOOK_RECORD_PATH = ""      # اختیاری: ذخیره آپدیت‌ها برای replay_updates.py
+
+# حداکثر آپدیت‌های همزمان (آپدیت‌های هر چت همچنان به ترتیب اجرا می‌شوند). 1 = پردازش ترتیبی
+UPDATE_CONCURRENCY = 32
+
+# صف پیام‌های ادمین (خرید/تمدید/تست): فاصله اجرای dispatcher و فاصله بین ارسال‌ها
+ADMIN_OUTBOX_INTERVAL_SEC = 5
+ADMIN_OUTBOX_SEND_DELAY_SEC = 0.35
+
+# کش عضویت اجباری کانال (ثانیه): نتیجه مثبت / منفی
+MEMBERSHIP_CACHE_TTL_POSITIVE = 900
+MEMBERSHIP_CACHE_TTL_NEGATIVE = 20
+
+# Retention: حذف دوره‌ای ردیف‌های قدیمی (روزها با setting «retention_<name>_days» قابل تغییرند)
+RETENTION_ARCHIVE_PATH = ""   # مثال: "vpn_bot_archive.db" (خالی = بدون آرشیو)
+RETENTION_CHUNK_SIZE = 2000
+
+# مینی‌اپ: کش HTML ثابت (ثانیه) و حداقل اندازه JSON برای فشرده‌سازی (brotli در صورت نصب، وگرنه gzip)
+WEBAPP_STATIC_MAX_AGE = 3600
+WEBAPP_COMPRESS_MIN_BYTES = 512
+
+# صفحه اطلاعات حساب: اگر snapshot مصرف قدیمی‌تر از این (ثانیه) باشد، در پس‌زمینه از پنل رفرش و پیام ویرایش می‌شود
+# None = دو برابر فاصله job به‌روزرسانی مصرف (usage_update_interval_min، پیش‌فرض ۱۰ دقیقه -> ۱۲۰۰ ثانیه)
+ACCOUNT_SNAPSHOT_MAX_AGE_SEC = None
+
+# اجرای jobهای پس‌زمینه: "inline" (در همان پروسس ربات) یا "worker" (پروسس جداگانه: python job_worker.py)
+# در حالت worker ارتباط دو پروسس فقط از طریق دیتابیس است (job_leases + admin_outbox)
+JOB_RUNNER_MODE = "inline"
+JOB_LEASE_TTL_SEC = 600       # lease یک worker از کار افتاده بعد از این مدت آزاد می‌شود
+WORKER_RESCHEDULE_SEC = 60    # فاصله بازخوانی تنظیمات زمان‌بندی در worker
+
+# سلامت ساب‌دامین‌ها: probe دوره‌ای و انتخاب وزن‌دار هاست لینک‌ها (setting «domain_probe_enabled» = 0 برای غیرفعال)
+DOMAIN_PROBE_INTERVAL_MIN = 5
+DOMAIN_PROBE_TIMEOUT_SEC = 6.0
+DOMAIN_FAIL_THRESHOLD = 2     # بعد از این تعداد خطای پشت سر هم، هاست از انتخاب حذف می‌شود
+
+# کاتالوگ پلن‌ها در حافظه (ثانیه): ویرایش‌های ادمین فوراً invalidate می‌کنند؛ این فقط سقف کهنگی برای تغییرات خارج از پروسس است
+PLAN_CATALOG_TTL_SEC = 300
+
+# محدودیت نرخ دکمه‌ها برای هر کاربر (token bucket). بودجه‌ها: {action: (burst, توکن در ثانیه)}
+# action ها: panel (refresh_/view_service_/getlink_/renew_)، refresh (acc_usage_refresh)، callback (سایر)
+ANTIFLOOD_ENABLED = True
+ANTIFLOOD_BUDGETS = {}   # مثال: {"panel": (4, 0.2)}
+
+# جزئیات سرویس: نمایش فوری از آخرین وضعیت ذخیره‌شده (service_state) و بروزرسانی پس‌زمینه؛
+# اگر snapshot تازه‌تر از این (ثانیه) باشد، درخواست پس‌زمینه به پنل زده نمی‌شود
+SERVICE_DETAILS_FRESH_SEC = 30
+
+# تطبیق روزانه DB با لیست کاربران پنل‌ها (setting «reconcile_enabled» = 0 برای غیرفعال)
+# "report" = فقط گزارش به ادمین | "fix" = حذف گروهی سرویس‌هایی که در پنل وجود ندارند (setting «reconcile_policy»)
+RECONCILE_POLICY = "report"
+RECONCILE_PAGE_SIZE = 500
+RECONCILE_MAX_REMOVE_RATIO = 0.2   # اگر سهم سرویس‌های یتیم یک پنل بیشتر باشد، حذف انجام نمی‌شود
+
+# بکاپ خودکار: "full" = هر بار کل دیتابیس | "incremental" = پایه + فقط صفحه‌های تغییرکرده (setting «backup_mode»)
+# بازسازی از پایه + delta ها: python restore_backup.py <base> <deltas...> -o vpn_bot.db
+BACKUP_MODE = "full"
+BACKUP_FULL_EVERY = 24         # بعد از این تعداد delta یک پایه جدید گرفته می‌شود
+BACKUP_DELTA_MAX_RATIO = 0.5   # اگر سهم صفحه‌های تغییرکرده بیشتر باشد، به جای delta پایه جدید گرفته می‌شود
+
+# ارسال بکاپ: فشرده‌سازی جریانی ("auto" = zstd در صورت نصب zstandard، وگرنه gzip | "gzip") و قطعه‌بندی
+# (حد دانلود ربات ۲۰ مگابایت است؛ کمتر از آن بماند تا قطعه‌ها از طریق بخش بازیابی ربات هم قابل بازگرداندن باشند)
+BACKUP_COMPRESSION = "auto"
+BACKUP_CHUNK_MB = 19
+# نگهداری لایه‌ای بکاپ‌های خودکار: جدیدترین هر ساعت/روز/هفته
+BACKUP_KEEP_HOURLY = 24
+BACKUP_KEEP_DAILY = 7
+BACKUP_KEEP_WEEKLY = 4
+
+# پروفایل PRAGMA اتصال دیتابیس (کلیدهای مجاز: cache_size, mmap_size, temp_store, busy_timeout, wal_autocheckpoint, synchronous)
+# پیش‌فرض‌ها در database.STORAGE_PROFILE؛ اینجا فقط مقادیری که باید تغییر کنند. مثال: {"cache_size": -64000}
+DB_STORAGE_PROFILE = {}
+# نگهداری دیتابیس (setting «db_maintenance_enabled» = 0 برای غیرفعال): checkpoint دوره‌ای WAL؛
+# در ساعات کم‌ترافیک [شروع، پایان) یا WAL بزرگ‌تر از DB_WAL_TRUNCATE_MB، کوچک‌سازی WAL و PRAGMA optimize
+DB_MAINTENANCE_INTERVAL_MIN = 15
+DB_MAINTENANCE_QUIET_HOURS = (3, 6)
+DB_WAL_TRUNCATE_MB = 64
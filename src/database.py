@@ -4,20 +4,65 @@
 import sqlite3
 import logging
 import json
+import time
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
 
-# NEW: for admin notifications
-import httpx
+from records import Endpoint, Plan, Service, Transaction, User
+
 try:
     from config import BOT_TOKEN, ADMIN_ID
 except Exception:
     BOT_TOKEN, ADMIN_ID = "", ""
 
+try:
+    from config import DB_STORAGE_PROFILE
+except Exception:
+    DB_STORAGE_PROFILE = {}
+
 DB_NAME = "vpn_bot.db"
 logger = logging.getLogger(__name__)
 _db_connection = None
 
+# پروفایل پیش‌فرض PRAGMA های هر اتصال (با DB_STORAGE_PROFILE قابل تغییر)
+STORAGE_PROFILE = {
+    "cache_size": -16000,            # منفی = KiB (حدود 16MB)
+    "mmap_size": 64 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,            # میلی‌ثانیه
+    "wal_autocheckpoint": 1000,      # صفحه
+    "synchronous": "NORMAL",
+}
+STORAGE_PROFILE.update(DB_STORAGE_PROFILE or {})
+
+_PRAGMA_CHOICES = {
+    "temp_store": ("DEFAULT", "FILE", "MEMORY"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+}
+
+
+def apply_storage_profile(conn: sqlite3.Connection, profile: dict | None = None):
+    """PRAGMA های پروفایل روی conn؛ کلید/مقدار نامعتبر نادیده گرفته می‌شود."""
+    for key, value in (profile or STORAGE_PROFILE).items():
+        if key in _PRAGMA_CHOICES:
+            value = str(value).upper()
+            if value not in _PRAGMA_CHOICES[key]:
+                logger.warning("Ignoring invalid PRAGMA %s=%s", key, value)
+                continue
+        elif key in ("cache_size", "mmap_size", "busy_timeout", "wal_autocheckpoint"):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                logger.warning("Ignoring invalid PRAGMA %s=%r", key, value)
+                continue
+        else:
+            logger.warning("Ignoring unknown storage profile key %s", key)
+            continue
+        try:
+            conn.execute(f"PRAGMA {key} = {value}")
+        except sqlite3.Error as e:
+            logger.warning("Failed to set PRAGMA %s: %s", key, e)
+
 
 def _get_connection():
     global _db_connection
@@ -27,15 +72,42 @@ def _get_connection():
         try:
             conn.execute("PRAGMA foreign_keys = ON")
             conn.execute("PRAGMA journal_mode = WAL")
-            conn.execute("PRAGMA synchronous = NORMAL")
         except sqlite3.Error as e:
             logger.warning(f"Failed to set PRAGMA options: {e}")
+        apply_storage_profile(conn)
         _db_connection = conn
     return _db_connection
 
 def _connect_db():
     return _get_connection()
 
+def _fetch_one(record_cls, sql: str, params=()):
+    cur = _connect_db().cursor()
+    cur.row_factory = record_cls.factory
+    return cur.execute(sql, params).fetchone()
+
+def _fetch_all(record_cls, sql: str, params=()) -> list:
+    cur = _connect_db().cursor()
+    cur.row_factory = record_cls.factory
+    return cur.execute(sql, params).fetchall()
+
+def _iter_rows(record_cls, sql: str, params=(), batch: int = 500):
+    """
+    ردیف‌ها به صورت تنبل (fetchmany). بین دو next نباید await شود: cursor روی اتصال مشترک باز می‌ماند
+    و snapshot خواندنی آن جلوی checkpoint کامل WAL را می‌گیرد.
+    """
+    cur = _connect_db().cursor()
+    cur.row_factory = record_cls.factory
+    cur.execute(sql, params)
+    try:
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cur.close()
+
 def close_db():
     global _db_connection
     if _db_connection is not None:
@@ -122,31 +194,25 @@ def _iter_admin_chat_ids():
             ids.append(item)
     return ids
 
-def _send_admin_message(text: str):
+def _queue_admin_message(text: str, conn=None):
     """
-    Sends a message to configured ADMIN_ID(s) via Telegram Bot API.
-    Safe: ignores errors and never raises.
+    پیام ادمین را در admin_outbox ثبت می‌کند (ارسال توسط bot/outbox.py انجام می‌شود).
+    اگر conn داده شود، درج داخل همان تراکنش انجام شده و commit بر عهده فراخواننده است.
     """
-    if not BOT_TOKEN:
-        return
     admin_ids = _iter_admin_chat_ids()
     if not admin_ids:
         return
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    payload_base = {"parse_mode": "HTML", "disable_web_page_preview": True}
-    try:
-        with httpx.Client(timeout=7.0, follow_redirects=True) as client:
-            for chat_id in admin_ids:
-                data = {"chat_id": chat_id, "text": text}
-                data.update(payload_base)
-                try:
-                    client.post(url, json=data)
-                except Exception as e:
-                    logger.warning("Admin notify failed for chat_id=%s: %s", chat_id, e)
-    except Exception as e:
-        logger.warning("Admin notify batch failed: %s", e)
+    own = conn is None
+    c = conn or _connect_db()
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    c.executemany(
+        "INSERT INTO admin_outbox (chat_id, text, parse_mode, created_at, next_attempt_at) VALUES (?, ?, 'HTML', ?, ?)",
+        [(str(chat_id), text, now_str, now_str) for chat_id in admin_ids]
+    )
+    if own:
+        c.commit()
 
-def _notify_purchase(user_id: int, plan_name: str, amount: float, custom_name: str, sub_uuid: str):
+def _notify_purchase(user_id: int, plan_name: str, amount: float, custom_name: str, sub_uuid: str, conn=None):
     ulink = f'<a href="tg://user?id={user_id}">{user_id}</a>'
     amt = 0
     try:
@@ -162,9 +228,9 @@ def _notify_purchase(user_id: int, plan_name: str, amount: float, custom_name: s
         f"• UUID: <code>{_escape_html(sub_uuid)}</code>\n"
         f"• زمان: {_escape_html(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}"
     )
-    _send_admin_message(text)
+    _queue_admin_message(text, conn)
 
-def _notify_renewal(user_id: int, service_id: int, plan_name: str, amount: float):
+def _notify_renewal(user_id: int, service_id: int, plan_name: str, amount: float, conn=None):
     ulink = f'<a href="tg://user?id={user_id}">{user_id}</a>'
     amt = 0
     try:
@@ -179,9 +245,9 @@ def _notify_renewal(user_id: int, service_id: int, plan_name: str, amount: float
         f"• مبلغ: {amt:,} تومان\n"
         f"• زمان: {_escape_html(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}"
     )
-    _send_admin_message(text)
+    _queue_admin_message(text, conn)
 
-def _notify_trial_used(user_id: int):
+def _notify_trial_used(user_id: int, conn=None):
     days = (get_setting("trial_days") or "-")
     gb = (get_setting("trial_gb") or "-")
     ulink = f'<a href="tg://user?id={user_id}">{user_id}</a>'
@@ -191,12 +257,45 @@ def _notify_trial_used(user_id: int):
         f"• شرایط: {gb} GB | {days} روز\n"
         f"• زمان: {_escape_html(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}"
     )
-    _send_admin_message(text)
+    _queue_admin_message(text, conn)
 # =========================================
 
 
-def init_db():
-    conn = _connect_db()
+# ===== Schema migrations (PRAGMA user_version) =====
+# هر migration دقیقاً یک بار اجرا می‌شود و بعد از آن user_version به شماره آن ست می‌شود.
+# migration جدید را فقط به انتهای _MIGRATIONS اضافه کنید؛ ترتیب/شماره‌های قبلی را تغییر ندهید.
+
+class _progress:
+    """
+    گزارش پیشرفت عملیات طولانی (ایجاد ایندکس/بازسازی جدول) از طریق progress handler سقلایت.
+    """
+    def __init__(self, conn: sqlite3.Connection, label: str, every_sec: float = 5.0):
+        self.conn = conn
+        self.label = label
+        self.every_sec = every_sec
+
+    def _tick(self):
+        now = time.monotonic()
+        if now - self._last >= self.every_sec:
+            self._last = now
+            logger.info("Migration: %s still running (%.0fs)...", self.label, now - self._start)
+        return 0
+
+    def __enter__(self):
+        self._start = self._last = time.monotonic()
+        self.conn.set_progress_handler(self._tick, 100000)
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.set_progress_handler(None, 0)
+        logger.info("Migration: %s done in %.1fs", self.label, time.monotonic() - self._start)
+        return False
+
+
+def _migration_001_base_schema(conn: sqlite3.Connection):
+    """
+    اسکیمای پایه. برای دیتابیس‌های قدیمی (بدون user_version) هم امن است چون همه دستورات idempotent هستند.
+    """
     cursor = conn.cursor()
 
     # users
@@ -335,6 +434,31 @@ def init_db():
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_endpoints_uuid ON service_endpoints(sub_uuid)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_endpoints_server ON service_endpoints(server_name)")
 
+    # Outbox پیام‌های ادمین (در همان تراکنش خرید/تمدید ثبت و به‌صورت async ارسال می‌شود)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admin_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            text TEXT NOT NULL,
+            parse_mode TEXT,
+            created_at TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT,
+            sent_at TEXT,
+            last_error TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_admin_outbox_pending ON admin_outbox(sent_at, next_attempt_at)")
+
+    # QR cache: sub URL -> Telegram file_id (بعد از اولین ارسال عکس)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS qr_file_ids (
+            url TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+
     # Default settings
     cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", ('card_number', '0000-0000-0000-0000'))
 
@@ -348,6 +472,164 @@ def init_db():
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)")
 
     conn.commit()
+
+
+def _migration_002_hot_query_indexes(conn: sqlite3.Connection):
+    """
+    ایندکس برای کوئری‌های پرتکرار گزارش‌ها/آمار/تاریخچه.
+    بررسی پلن‌ها: python query_plan_check.py
+    """
+    cur = conn.cursor()
+    # get_sales_report / آمار ۲۴ساعت مینی‌اپ: (sale_date, price) تا SUM(price) از خود ایندکس خوانده شود
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_log_date ON sales_log(sale_date, price)")
+    # get_new_users_count
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_join_date ON users(join_date)")
+    # get_user_referral_count
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users(referred_by)")
+    # get_user_sales_history / get_user_charge_count / get_user_charge_history
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_type_status ON transactions(user_id, type, status)")
+    # get_user_by_username (COLLATE NOCASE؛ ایندکس BINARY قبلی استفاده نمی‌شود)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE)")
+    # delete_plan_safe و FK plan_id
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_active_services_plan ON active_services(plan_id)")
+    # idx_transactions_user پیشوند ایندکس جدید است و دیگر لازم نیست
+    cur.execute("DROP INDEX IF EXISTS idx_transactions_user")
+    conn.commit()
+
+
+def _migration_003_retention_indexes(conn: sqlite3.Connection):
+    """ایندکس برای حذف‌های دوره‌ای (bot/retention.py)."""
+    cur = conn.cursor()
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reminder_log_date ON reminder_log(date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_status_updated ON transactions(status, updated_at)")
+    cur.execute("DROP INDEX IF EXISTS idx_transactions_status")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_traffic_updated ON user_traffic(last_updated)")
+    conn.commit()
+
+
+def _migration_004_traffic_series(conn: sqlite3.Connection):
+    """
+    سری زمانی مصرف: traffic_raw (دلتاهای ۴۸ ساعت اخیر)، traffic_hourly و traffic_daily.
+    ts/bucket به ثانیه (epoch) و delta به مگابایت (کسری؛ record_traffic_deltas) تا ردیف‌ها کوچک بمانند.
+    """
+    cur = conn.cursor()
+    for table, col in (("traffic_raw", "ts"), ("traffic_hourly", "bucket"), ("traffic_daily", "bucket")):
+        cur.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                user_id INTEGER NOT NULL,
+                server_name TEXT NOT NULL,
+                {col} INTEGER NOT NULL,
+                delta_mb INTEGER NOT NULL,
+                PRIMARY KEY (user_id, server_name, {col})
+            ) WITHOUT ROWID
+        ''')
+        # کوئری‌های کل ناوگان / هر سرور روی بازه زمانی
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_time ON {table}({col}, server_name, delta_mb)")
+    conn.commit()
+
+
+def _migration_005_service_state(conn: sqlite3.Connection):
+    """آخرین اطلاعات پنل هر سرویس (از job مصرف) برای نمایش بدون تماس زنده با پنل."""
+    cur = conn.cursor()
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS service_state (
+            service_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            info_json TEXT NOT NULL,
+            usage_gb REAL,
+            limit_gb REAL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY(service_id) REFERENCES active_services(service_id) ON DELETE CASCADE
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_service_state_user ON service_state(user_id)")
+    conn.commit()
+
+
+def _migration_006_job_worker(conn: sqlite3.Connection):
+    """
+    اجرای jobها در پروسس جداگانه (job_worker.py):
+    - job_leases: هر job در هر لحظه فقط توسط یک مالک اجرا می‌شود (lease با انقضا).
+    - admin_outbox برای پیام کاربران و فایل‌ها هم استفاده می‌شود (kind / file_path).
+    """
+    cur = conn.cursor()
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS job_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            lease_until REAL NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            last_status TEXT,
+            last_error TEXT
+        ) WITHOUT ROWID
+    ''')
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(admin_outbox)").fetchall()}
+    if "kind" not in cols:
+        cur.execute("ALTER TABLE admin_outbox ADD COLUMN kind TEXT NOT NULL DEFAULT 'message'")
+    if "file_path" not in cols:
+        cur.execute("ALTER TABLE admin_outbox ADD COLUMN file_path TEXT")
+    conn.commit()
+
+
+def _migration_007_domain_health(conn: sqlite3.Connection):
+    """نتیجه probe دوره‌ای ساب‌دامین‌ها (bot/domain_health.py) برای انتخاب وزن‌دار هاست لینک‌ها."""
+    cur = conn.cursor()
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS domain_health (
+            host TEXT PRIMARY KEY,
+            panel_id TEXT,
+            ok INTEGER NOT NULL DEFAULT 0,
+            latency_ms REAL,
+            consecutive_failures INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            checked_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+
+def _migration_008_outbox_options(conn: sqlite3.Connection):
+    """پارامترهای اضافه send_message/send_document در admin_outbox (JSON: reply_markup، disable_notification و ...)."""
+    cur = conn.cursor()
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(admin_outbox)").fetchall()}
+    if "options" not in cols:
+        cur.execute("ALTER TABLE admin_outbox ADD COLUMN options TEXT")
+    conn.commit()
+
+
+_MIGRATIONS = [
+    (1, "base schema", _migration_001_base_schema),
+    (2, "hot query indexes", _migration_002_hot_query_indexes),
+    (3, "retention indexes", _migration_003_retention_indexes),
+    (4, "traffic time series", _migration_004_traffic_series),
+    (5, "service state snapshot", _migration_005_service_state),
+    (6, "job leases and outbox kinds", _migration_006_job_worker),
+    (7, "sub-domain health", _migration_007_domain_health),
+    (8, "outbox send options", _migration_008_outbox_options),
+]
+SCHEMA_VERSION = _MIGRATIONS[-1][0]
+
+
+def get_schema_version() -> int:
+    conn = _connect_db()
+    return int(conn.execute("PRAGMA user_version").fetchone()[0] or 0)
+
+
+def init_db():
+    conn = _connect_db()
+    current = int(conn.execute("PRAGMA user_version").fetchone()[0] or 0)
+    if current >= SCHEMA_VERSION:
+        return
+
+    pending = [m for m in _MIGRATIONS if m[0] > current]
+    logger.info("Database schema v%d -> v%d (%d migrations)", current, SCHEMA_VERSION, len(pending))
+    for number, description, fn in pending:
+        logger.info("Applying migration %03d: %s", number, description)
+        with _progress(conn, f"{number:03d} {description}"):
+            fn(conn)
+        conn.execute(f"PRAGMA user_version = {int(number)}")
+        conn.commit()
     logger.info("Database initialized successfully.")
 
 def _resolve_server_name_from_link(sub_link: str) -> str | None:
@@ -375,19 +657,11 @@ def get_or_create_user(user_id: int, username: str = None) -> dict:
         conn.commit()
     return dict(user) if user else None
 
-def get_user(user_id: int) -> dict:
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    row = cur.fetchone()
-    return dict(row) if row else None
+def get_user(user_id: int) -> User | None:
+    return _fetch_one(User, "SELECT * FROM users WHERE user_id = ?", (user_id,))
 
-def get_user_by_username(username: str) -> dict:
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE username = ? COLLATE NOCASE", (username.lstrip('@'),))
-    row = cur.fetchone()
-    return dict(row) if row else None
+def get_user_by_username(username: str) -> User | None:
+    return _fetch_one(User, "SELECT * FROM users WHERE username = ? COLLATE NOCASE", (username.lstrip('@'),))
 
 def update_balance(user_id: int, amount: float):
     conn = _connect_db()
@@ -411,11 +685,11 @@ def set_user_trial_used(user_id: int):
     if row and int(row[0] or 0) == 1:
         return
     conn.execute("UPDATE users SET has_used_trial = 1 WHERE user_id = ?", (user_id,))
-    conn.commit()
     try:
-        _notify_trial_used(user_id)
+        _notify_trial_used(user_id, conn)
     except Exception as e:
-        logger.warning("Failed to notify trial used for user %s: %s", user_id, e)
+        logger.warning("Failed to queue trial notification for user %s: %s", user_id, e)
+    conn.commit()
 
 def reset_user_trial(user_id: int):
     conn = _connect_db()
@@ -468,12 +742,8 @@ def add_plan(name: str, price: float, days: int, gb: int, category: str):
     )
     conn.commit()
 
-def get_plan(plan_id: int) -> dict:
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM plans WHERE plan_id = ?", (plan_id,))
-    row = cur.fetchone()
-    return dict(row) if row else None
+def get_plan(plan_id: int) -> Plan | None:
+    return _fetch_one(Plan, "SELECT * FROM plans WHERE plan_id = ?", (plan_id,))
 
 def get_plan_categories() -> list[str]:
     conn = _connect_db()
@@ -481,9 +751,7 @@ def get_plan_categories() -> list[str]:
     cur.execute("SELECT DISTINCT category FROM plans WHERE is_visible = 1 AND category IS NOT NULL ORDER BY category ASC")
     return [row['category'] for row in cur.fetchall()]
 
-def list_plans(only_visible: bool = False, category: str = None) -> list:
-    conn = _connect_db()
-    cur = conn.cursor()
+def list_plans(only_visible: bool = False, category: str = None) -> list[Plan]:
     query = "SELECT * FROM plans"
     conditions = []
     params = []
@@ -498,9 +766,7 @@ def list_plans(only_visible: bool = False, category: str = None) -> list:
         query += " WHERE " + " AND ".join(conditions)
 
     query += " ORDER BY days ASC, gb ASC"
-
-    cur.execute(query, tuple(params))
-    return [dict(r) for r in cur.fetchall()]
+    return _fetch_all(Plan, query, tuple(params))
 
 def update_plan(plan_id: int, data: dict):
     fields, params = [], []
@@ -548,30 +814,21 @@ def add_active_service(user_id: int, name: str, sub_uuid: str, sub_link: str, pl
     )
     conn.commit()
 
-def get_service(service_id: int) -> dict:
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM active_services WHERE service_id = ?", (service_id,))
-    row = cur.fetchone()
-    return dict(row) if row else None
+def get_service(service_id: int) -> Service | None:
+    return _fetch_one(Service, "SELECT * FROM active_services WHERE service_id = ?", (service_id,))
 
-def get_service_by_uuid(uuid: str) -> dict:
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM active_services WHERE sub_uuid = ?", (uuid,))
-    row = cur.fetchone()
-    return dict(row) if row else None
+def get_service_by_uuid(uuid: str) -> Service | None:
+    return _fetch_one(Service, "SELECT * FROM active_services WHERE sub_uuid = ?", (uuid,))
 
-def get_user_services(user_id: int) -> list:
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM active_services WHERE user_id = ?", (user_id,))
-    return [dict(r) for r in cur.fetchall()]
+def get_user_services(user_id: int) -> list[Service]:
+    return _fetch_all(Service, "SELECT * FROM active_services WHERE user_id = ?", (user_id,))
 
-def get_all_active_services() -> list:
-    conn = _connect_db()
-    cur = conn.execute("SELECT * FROM active_services")
-    return [dict(r) for r in cur.fetchall()]
+def get_all_active_services() -> list[Service]:
+    return list(iter_active_services())
+
+def iter_active_services(batch: int = 500):
+    """مثل get_all_active_services ولی تنبل (نگاه کنید به _iter_rows)."""
+    return _iter_rows(Service, "SELECT * FROM active_services", batch=batch)
 
 def set_low_usage_alert_sent(service_id: int, status=True):
     conn = _connect_db()
@@ -628,15 +885,15 @@ def finalize_purchase_transaction(transaction_id: int, sub_uuid: str, sub_link:
             (txn['user_id'], txn['plan_id'], txn['amount'], now_str)
         )
         cursor.execute("UPDATE transactions SET status = 'completed', updated_at = ? WHERE transaction_id = ?", (now_str, transaction_id))
-        conn.commit()
-        logger.info(f"Purchase transaction {transaction_id} successfully finalized")
-        # Admin notify (safe, post-commit)
+        # Admin notify (outbox، داخل همان تراکنش)
         try:
             plan_row = get_plan(int(txn['plan_id'])) if txn['plan_id'] is not None else None
             plan_name = plan_row.get('name') if plan_row else None
-            _notify_purchase(int(txn['user_id']), plan_name or "", float(txn['amount']), str(custom_name or ""), str(sub_uuid or ""))
+            _notify_purchase(int(txn['user_id']), plan_name or "", float(txn['amount']), str(custom_name or ""), str(sub_uuid or ""), conn)
         except Exception as e:
-            logger.warning("Notify purchase failed for txn %s: %s", transaction_id, e)
+            logger.warning("Queue purchase notification failed for txn %s: %s", transaction_id, e)
+        conn.commit()
+        logger.info(f"Purchase transaction {transaction_id} successfully finalized")
     except Exception as e:
         logger.error(f"Error finalizing purchase {transaction_id}: {e}", exc_info=True)
         conn.rollback()
@@ -713,15 +970,15 @@ def finalize_renewal_transaction(transaction_id: int, new_plan_id: int):
                        (txn['user_id'], plan_to_apply, txn['amount'], now_str))
         # وضعیت تراکنش
         cursor.execute("UPDATE transactions SET status = 'completed', updated_at = ? WHERE transaction_id = ?", (now_str, transaction_id))
-        conn.commit()
-        logger.info(f"Renewal transaction {transaction_id} successfully finalized (plan {plan_to_apply})")
-        # Admin notify (safe, post-commit)
+        # Admin notify (outbox، داخل همان تراکنش)
         try:
             plan_row = get_plan(int(plan_to_apply)) if plan_to_apply else None
             plan_name = plan_row.get('name') if plan_row else None
-            _notify_renewal(int(txn['user_id']), int(txn['service_id']), plan_name or "", float(txn['amount']))
+            _notify_renewal(int(txn['user_id']), int(txn['service_id']), plan_name or "", float(txn['amount']), conn)
         except Exception as e:
-            logger.warning("Notify renewal failed for txn %s: %s", transaction_id, e)
+            logger.warning("Queue renewal notification failed for txn %s: %s", transaction_id, e)
+        conn.commit()
+        logger.info(f"Renewal transaction {transaction_id} successfully finalized (plan {plan_to_apply})")
     except Exception as e:
         logger.error(f"Error finalizing renewal {transaction_id}: {e}", exc_info=True)
         conn.rollback()
@@ -806,6 +1063,145 @@ def mark_reminder_sent(service_id: int, type_: str, date: str):
     conn.execute("INSERT OR IGNORE INTO reminder_log (service_id, date, type) VALUES (?, ?, ?)", (service_id, date, type_))
     conn.commit()
 
+# ===== Admin outbox =====
+def get_due_admin_outbox(limit: int = 50, max_attempts: int = 8) -> list:
+    conn = _connect_db()
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = conn.execute(
+        "SELECT * FROM admin_outbox WHERE sent_at IS NULL AND attempts < ? "
+        "AND (next_attempt_at IS NULL OR next_attempt_at <= ?) ORDER BY id LIMIT ?",
+        (max_attempts, now_str, limit)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+def mark_admin_outbox_sent(ids: list):
+    if not ids:
+        return
+    conn = _connect_db()
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany("UPDATE admin_outbox SET sent_at = ?, last_error = NULL WHERE id = ?", [(now_str, i) for i in ids])
+    conn.commit()
+
+def mark_admin_outbox_failed(ids: list, error: str, retry_in_sec: float):
+    if not ids:
+        return
+    conn = _connect_db()
+    nxt = (datetime.now() + timedelta(seconds=max(1, int(retry_in_sec)))).strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany(
+        "UPDATE admin_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+        [(nxt, (error or "")[:500], i) for i in ids]
+    )
+    conn.commit()
+
+def enqueue_outbox(chat_id, text: str, parse_mode: str | None = None,
+                   kind: str = "message", file_path: str | None = None, options: str | None = None):
+    """
+    پیام (یا فایل با kind='document') برای ارسال توسط bot/outbox.py در پروسس ربات.
+    options: JSON پارامترهای اضافه ارسال (bot/outbox.py آن را می‌سازد و بازپخش می‌کند).
+    """
+    conn = _connect_db()
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cur = conn.execute(
+        "INSERT INTO admin_outbox (chat_id, text, parse_mode, created_at, next_attempt_at, kind, file_path, options) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (str(chat_id), text or "", parse_mode, now_str, now_str, kind, file_path, options)
+    )
+    conn.commit()
+    return cur.lastrowid
+
+def count_failed_outbox(ids: list, max_attempts: int = 8) -> int:
+    """تعداد ردیف‌هایی از ids که تلاش‌هایشان تمام شده و ارسال نشده‌اند (ردیف حذف‌شده = ارسال‌شده)."""
+    ids = [int(i) for i in ids or []]
+    if not ids:
+        return 0
+    conn = _connect_db()
+    marks = ",".join("?" * len(ids))
+    row = conn.execute(
+        f"SELECT COUNT(*) FROM admin_outbox WHERE id IN ({marks}) AND sent_at IS NULL AND attempts >= ?",
+        (*ids, max_attempts)
+    ).fetchone()
+    return int(row[0] or 0)
+
+# ===== Job leases =====
+def acquire_job_lease(name: str, owner: str, ttl_sec: float) -> bool:
+    """lease را می‌گیرد اگر آزاد/منقضی باشد یا از قبل متعلق به همین owner باشد."""
+    now = time.time()
+    conn = _connect_db()
+    cur = conn.execute("""
+        INSERT INTO job_leases (name, owner, lease_until, started_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            owner = excluded.owner, lease_until = excluded.lease_until, started_at = excluded.started_at
+        WHERE job_leases.lease_until < ? OR job_leases.owner = excluded.owner
+    """, (name, owner, now + ttl_sec, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), now))
+    conn.commit()
+    return cur.rowcount > 0
+
+def renew_job_lease(name: str, owner: str, ttl_sec: float) -> bool:
+    conn = _connect_db()
+    cur = conn.execute(
+        "UPDATE job_leases SET lease_until = ? WHERE name = ? AND owner = ?",
+        (time.time() + ttl_sec, name, owner)
+    )
+    conn.commit()
+    return cur.rowcount > 0
+
+def release_job_lease(name: str, owner: str, status: str, error: str | None = None):
+    conn = _connect_db()
+    conn.execute(
+        "UPDATE job_leases SET lease_until = 0, finished_at = ?, last_status = ?, last_error = ? "
+        "WHERE name = ? AND owner = ?",
+        (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), status, (error or "")[:500] or None, name, owner)
+    )
+    conn.commit()
+
+# ===== Sub-domain health =====
+def save_domain_health(rows: list):
+    """rows: [{"host", "panel_id", "ok", "latency_ms", "consecutive_failures", "last_error"}, ...]"""
+    if not rows:
+        return
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = _connect_db()
+    conn.executemany(
+        "REPLACE INTO domain_health (host, panel_id, ok, latency_ms, consecutive_failures, last_error, checked_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(r["host"], r.get("panel_id"), 1 if r.get("ok") else 0, r.get("latency_ms"),
+          int(r.get("consecutive_failures") or 0), r.get("last_error"), now_str) for r in rows]
+    )
+    conn.commit()
+
+def get_domain_health() -> dict:
+    """{host: row}"""
+    conn = _connect_db()
+    return {r["host"]: dict(r) for r in conn.execute("SELECT * FROM domain_health").fetchall()}
+
+def delete_domain_health_except(hosts: list):
+    """حذف هاست‌هایی که دیگر در تنظیمات نیستند."""
+    conn = _connect_db()
+    if hosts:
+        marks = ",".join("?" * len(hosts))
+        conn.execute(f"DELETE FROM domain_health WHERE host NOT IN ({marks})", list(hosts))
+    else:
+        conn.execute("DELETE FROM domain_health")
+    conn.commit()
+
+def get_qr_file_id(url: str) -> str | None:
+    conn = _connect_db()
+    row = conn.execute("SELECT file_id FROM qr_file_ids WHERE url = ?", (url,)).fetchone()
+    return row['file_id'] if row else None
+
+def set_qr_file_id(url: str, file_id: str):
+    conn = _connect_db()
+    conn.execute(
+        "REPLACE INTO qr_file_ids (url, file_id, created_at) VALUES (?, ?, ?)",
+        (url, file_id, datetime.now().isoformat())
+    )
+    conn.commit()
+
+def delete_qr_file_id(url: str):
+    conn = _connect_db()
+    conn.execute("DELETE FROM qr_file_ids WHERE url = ?", (url,))
+    conn.commit()
+
 def get_stats() -> dict:
     conn = _connect_db()
     total_users = conn.execute("SELECT COUNT(user_id) FROM users").fetchone()[0]
@@ -850,12 +1246,8 @@ def get_user_sales_history(user_id: int) -> list:
     cur.execute(query, (user_id,))
     return [dict(r) for r in cur.fetchall()]
 
-def get_service_by_name(user_id: int, name: str) -> dict | None:
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM active_services WHERE user_id = ? AND name = ?", (user_id, name))
-    row = cur.fetchone()
-    return dict(row) if row else None
+def get_service_by_name(user_id: int, name: str) -> Service | None:
+    return _fetch_one(Service, "SELECT * FROM active_services WHERE user_id = ? AND name = ?", (user_id, name))
 
 def get_user_referral_count(user_id: int) -> int:
     conn = _connect_db()
@@ -938,10 +1330,8 @@ def create_charge_request(user_id: int, amount: float, note: str = "") -> int |
         logger.error(f"Failed to create charge request for user {user_id}: {e}")
         return None
 
-def get_charge_request(charge_id: int) -> dict | None:
-    conn = _connect_db()
-    row = conn.execute("SELECT * FROM transactions WHERE transaction_id = ? AND type = 'charge'", (charge_id,)).fetchone()
-    return dict(row) if row else None
+def get_charge_request(charge_id: int) -> Transaction | None:
+    return _fetch_one(Transaction, "SELECT * FROM transactions WHERE transaction_id = ? AND type = 'charge'", (charge_id,))
 
 def confirm_charge_request(charge_id: int) -> bool:
     conn = _connect_db()
@@ -1001,6 +1391,166 @@ def upsert_user_traffic(user_id: int, server_name: str, traffic_used_gb: float):
     """, (user_id, server_name or "Unknown", float(traffic_used_gb or 0), now_str))
     conn.commit()
 
+def upsert_user_traffic_many(rows: list):
+    """rows: [(user_id, server_name, traffic_used_gb), ...] در یک تراکنش."""
+    if not rows:
+        return
+    conn = _connect_db()
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany("""
+        INSERT INTO user_traffic (user_id, server_name, traffic_used, last_updated)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id, server_name) DO UPDATE SET
+            traffic_used = excluded.traffic_used,
+            last_updated = excluded.last_updated
+    """, [(uid, srv or "Unknown", float(gb or 0), now_str) for uid, srv, gb in rows])
+    conn.commit()
+
+def get_user_traffic_map() -> dict:
+    """{(user_id, server_name): traffic_used_gb} برای محاسبه دلتا."""
+    conn = _connect_db()
+    rows = conn.execute("SELECT user_id, server_name, traffic_used FROM user_traffic").fetchall()
+    return {(r["user_id"], r["server_name"]): float(r["traffic_used"] or 0) for r in rows}
+
+# ===== Service state snapshot =====
+def upsert_service_states(rows: list):
+    """rows: [(service_id, user_id, info_dict), ...]"""
+    if not rows:
+        return
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    data = []
+    for sid, uid, info in rows:
+        info = info or {}
+        try:
+            usage = float(info.get("current_usage_GB") or 0.0)
+        except Exception:
+            usage = None
+        try:
+            limit = float(info.get("usage_limit_GB") or 0.0)
+        except Exception:
+            limit = None
+        data.append((int(sid), int(uid), json.dumps(info, ensure_ascii=False, default=str), usage, limit, now_str))
+    conn = _connect_db()
+    conn.executemany("""
+        INSERT INTO service_state (service_id, user_id, info_json, usage_gb, limit_gb, updated_at)
+        SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM active_services WHERE service_id = ?1)
+        ON CONFLICT(service_id) DO UPDATE SET
+            info_json = excluded.info_json, usage_gb = excluded.usage_gb,
+            limit_gb = excluded.limit_gb, updated_at = excluded.updated_at
+    """, data)
+    conn.commit()
+
+def _service_state_row(r) -> dict:
+    d = dict(r)
+    try:
+        d["info"] = json.loads(d.pop("info_json") or "{}")
+    except Exception:
+        d["info"] = {}
+    return d
+
+def get_service_state(service_id: int) -> dict | None:
+    conn = _connect_db()
+    r = conn.execute("SELECT * FROM service_state WHERE service_id = ?", (service_id,)).fetchone()
+    return _service_state_row(r) if r else None
+
+def get_service_states_for_user(user_id: int) -> dict:
+    """{service_id: {"info": dict, "usage_gb", "limit_gb", "updated_at"}}"""
+    conn = _connect_db()
+    rows = conn.execute("SELECT * FROM service_state WHERE user_id = ?", (user_id,)).fetchall()
+    return {int(r["service_id"]): _service_state_row(r) for r in rows}
+
+# ===== Traffic time series =====
+_SERIES_TABLES = (("traffic_raw", "ts"), ("traffic_hourly", "bucket"), ("traffic_daily", "bucket"))
+
+_TRAFFIC_MB_DECIMALS = 3
+
+def record_traffic_deltas(rows: list, ts: int | None = None):
+    """
+    rows: [(user_id, server_name, delta_gb), ...]؛ فقط دلتاهای مثبت ذخیره می‌شوند.
+    delta_mb کسری (دقت حدود ۱ کیلوبایت) ذخیره می‌شود تا مصرف کمتر از ۱ مگابایت در هر نمونه گم نشود
+    (ستون INTEGER affinity دارد و مقدار کسری را به صورت REAL نگه می‌دارد).
+    """
+    ts = int(ts if ts is not None else time.time())
+    data = []
+    for uid, srv, delta_gb in rows:
+        mb = round(float(delta_gb or 0) * 1024, _TRAFFIC_MB_DECIMALS)
+        if mb > 0:
+            data.append((uid, srv or "Unknown", ts, mb))
+    if not data:
+        return 0
+    conn = _connect_db()
+    conn.executemany("""
+        INSERT INTO traffic_raw (user_id, server_name, ts, delta_mb) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id, server_name, ts) DO UPDATE SET delta_mb = delta_mb + excluded.delta_mb
+    """, data)
+    conn.commit()
+    return len(data)
+
+def rollup_traffic_series(raw_hours: int = 48, hourly_days: int = 30, daily_days: int = 365, now: int | None = None) -> dict:
+    """
+    downsampling: raw قدیمی‌تر از raw_hours -> hourly، hourly قدیمی‌تر از hourly_days -> daily،
+    و حذف daily قدیمی‌تر از daily_days. مرزها به ابتدای ساعت/روز گرد می‌شوند تا bucket ها کامل باشند.
+    """
+    now = int(now if now is not None else time.time())
+    raw_cutoff = ((now - raw_hours * 3600) // 3600) * 3600
+    hourly_cutoff = ((now - hourly_days * 86400) // 86400) * 86400
+    daily_cutoff = ((now - daily_days * 86400) // 86400) * 86400
+    conn = _connect_db()
+    out = {}
+    try:
+        conn.execute("BEGIN")
+        conn.execute("""
+            INSERT INTO traffic_hourly (user_id, server_name, bucket, delta_mb)
+            SELECT user_id, server_name, (ts / 3600) * 3600, SUM(delta_mb)
+            FROM traffic_raw WHERE ts < ? GROUP BY user_id, server_name, (ts / 3600)
+            ON CONFLICT(user_id, server_name, bucket) DO UPDATE SET delta_mb = delta_mb + excluded.delta_mb
+        """, (raw_cutoff,))
+        out["raw"] = conn.execute("DELETE FROM traffic_raw WHERE ts < ?", (raw_cutoff,)).rowcount
+        conn.execute("""
+            INSERT INTO traffic_daily (user_id, server_name, bucket, delta_mb)
+            SELECT user_id, server_name, (bucket / 86400) * 86400, SUM(delta_mb)
+            FROM traffic_hourly WHERE bucket < ? GROUP BY user_id, server_name, (bucket / 86400)
+            ON CONFLICT(user_id, server_name, bucket) DO UPDATE SET delta_mb = delta_mb + excluded.delta_mb
+        """, (hourly_cutoff,))
+        out["hourly"] = conn.execute("DELETE FROM traffic_hourly WHERE bucket < ?", (hourly_cutoff,)).rowcount
+        out["daily"] = conn.execute("DELETE FROM traffic_daily WHERE bucket < ?", (daily_cutoff,)).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return out
+
+def get_traffic_series(start_ts: int, end_ts: int, step: int = 0, user_id: int | None = None,
+                       server_name: str | None = None) -> list:
+    """
+    مصرف در بازه [start_ts, end_ts) به تفکیک bucket به طول step ثانیه.
+    user_id/server_name اختیاری‌اند (هر دو None = کل ناوگان). step=0 یعنی انتخاب خودکار.
+    خروجی: [{"bucket": epoch, "gb": float}, ...]
+    """
+    span = max(1, int(end_ts) - int(start_ts))
+    if not step:
+        step = 3600 if span <= 3 * 86400 else 86400
+    step = max(3600, int(step))
+    where, params = [], []
+    if user_id is not None:
+        where.append("user_id = ?")
+        params.append(int(user_id))
+    if server_name is not None:
+        where.append("server_name = ?")
+        params.append(server_name)
+    extra = (" AND " + " AND ".join(where)) if where else ""
+    parts = []
+    all_params = []
+    for table, col in _SERIES_TABLES:
+        parts.append(
+            f"SELECT ({col} / {step}) * {step} AS b, delta_mb FROM {table} WHERE {col} >= ? AND {col} < ?{extra}"
+        )
+        all_params += [int(start_ts), int(end_ts)] + params
+    sql = "SELECT b, SUM(delta_mb) AS mb FROM (" + " UNION ALL ".join(parts) + ") GROUP BY b ORDER BY b"
+    conn = _connect_db()
+    rows = conn.execute(sql, all_params).fetchall()
+    return [{"bucket": int(r["b"]), "gb": round(float(r["mb"] or 0) / 1024.0, 3)} for r in rows]
+
 def get_total_user_traffic(user_id: int) -> float:
     conn = _connect_db()
     cur = conn.cursor()
@@ -1069,27 +1619,57 @@ def add_service_endpoint(service_id: int, server_name: str | None, sub_uuid: str
     conn.commit()
     return cur.lastrowid
 
-def list_service_endpoints(service_id: int) -> list:
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM service_endpoints WHERE service_id = ? ORDER BY id ASC", (service_id,))
-    return [dict(r) for r in cur.fetchall()]
+def list_service_endpoints(service_id: int) -> list[Endpoint]:
+    return _fetch_all(Endpoint, "SELECT * FROM service_endpoints WHERE service_id = ? ORDER BY id ASC", (service_id,))
 
 def delete_service_endpoints(service_id: int):
     conn = _connect_db()
     conn.execute("DELETE FROM service_endpoints WHERE service_id = ?", (service_id,))
     conn.commit()
 
-def list_all_endpoints_with_user() -> list:
-    conn = _connect_db()
-    cur = conn.cursor()
-    cur.execute("""
+def list_all_endpoints_with_user() -> list[Endpoint]:
+    return list(iter_endpoints_with_user())
+
+def iter_endpoints_with_user(batch: int = 500):
+    """مثل list_all_endpoints_with_user ولی تنبل (نگاه کنید به _iter_rows)."""
+    return _iter_rows(Endpoint, """
         SELECT se.id, se.service_id, se.server_name, se.sub_uuid, se.sub_link, s.user_id
         FROM service_endpoints se
         JOIN active_services s ON s.service_id = se.service_id
         ORDER BY se.id ASC
-    """)
-    return [dict(r) for r in cur.fetchall()]
+    """, batch=batch)
+
+def delete_services_bulk(service_ids: list) -> int:
+    """حذف گروهی سرویس‌ها در یک تراکنش (service_endpoints و service_state با ON DELETE CASCADE)."""
+    ids = [(int(i),) for i in service_ids or []]
+    if not ids:
+        return 0
+    conn = _connect_db()
+    try:
+        conn.execute("BEGIN")
+        cur = conn.executemany("DELETE FROM active_services WHERE service_id = ?", ids)
+        conn.commit()
+        return cur.rowcount
+    except sqlite3.Error as e:
+        logger.error("Bulk delete of %d services failed: %s", len(ids), e, exc_info=True)
+        conn.rollback()
+        return 0
+
+def delete_endpoints_bulk(endpoint_ids: list) -> int:
+    """حذف گروهی endpoint ها در یک تراکنش."""
+    ids = [(int(i),) for i in endpoint_ids or []]
+    if not ids:
+        return 0
+    conn = _connect_db()
+    try:
+        conn.execute("BEGIN")
+        cur = conn.executemany("DELETE FROM service_endpoints WHERE id = ?", ids)
+        conn.commit()
+        return cur.rowcount
+    except sqlite3.Error as e:
+        logger.error("Bulk delete of %d endpoints failed: %s", len(ids), e, exc_info=True)
+        conn.rollback()
+        return 0
 
 # ========== Users list and segmentation ==========
 def get_users_with_no_orders() -> list[int]:
@@ -1130,12 +1710,9 @@ def get_total_users_count() -> int:
     count = cur.fetchone()[0]
     return count or 0
 
-def get_all_users_paginated(page: int = 1, page_size: int = 15) -> list[dict]:
-    conn = _connect_db()
-    cur = conn.cursor()
+def get_all_users_paginated(page: int = 1, page_size: int = 15) -> list[User]:
     offset = (page - 1) * page_size
-    cur.execute("SELECT * FROM users ORDER BY user_id DESC LIMIT ? OFFSET ?", (page_size, offset))
-    return [dict(row) for row in cur.fetchall()]
+    return _fetch_all(User, "SELECT * FROM users ORDER BY user_id DESC LIMIT ? OFFSET ?", (page_size, offset))
 
 def is_user_active(user_id: int) -> bool:
     conn = _connect_db()
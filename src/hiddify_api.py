@@ -4,7 +4,6 @@
 import asyncio
 import httpx
 import uuid
-import random
 import logging
 import types
 import time
@@ -12,6 +11,7 @@ from typing import Optional, Dict, Any
 from datetime import datetime
 
 from bot import panels as pnl
+from bot import domain_health
 
 # --- Robust config loader (fallbacks for single-panel setups) ---
 try:
@@ -285,7 +285,7 @@ async def create_hiddify_user(
     # ساخت لینک سابسکریپشن
     sub_domains = _get_panel_value(panel, "sub_domains") or []
     panel_domain = _get_panel_value(panel, "panel_domain") or ""
-    sub_host = _norm_host(random.choice(sub_domains) if sub_domains else panel_domain) or "localhost"
+    sub_host = _norm_host(domain_health.pick_host([_norm_host(h) for h in sub_domains]) if sub_domains else panel_domain) or "localhost"
 
     client_secret = str(_get_panel_value(panel, "panel_secret_uuid") or "").strip().strip("/")
     sub_path = str(_get_panel_value(panel, "sub_path") or "sub").strip().strip("/")
@@ -452,6 +452,33 @@ async def _apply_and_verify_plan(user_uuid: str, plan_days: int, plan_gb: float,
     return None
 
 
+async def iter_users(panel: Optional[Dict] = None, page_size: int = 500):
+    """
+    لیست کامل کاربران پنل، صفحه به صفحه (async generator از لیست‌های کاربر).
+    اگر پنل صفحه‌بندی را نادیده بگیرد (پاسخ بزرگ‌تر از page_size)، همان یک پاسخ کامل برگردانده می‌شود.
+    در صورت خطا RuntimeError می‌دهد تا فراخواننده لیست ناقص را «کامل» فرض نکند.
+    """
+    base = _get_base_url(panel) + "user/"
+    page, first_seen = 1, None
+    while True:
+        data = await _make_request("get", f"{base}?page={page}&per_page={page_size}", panel, timeout=60.0)
+        if data is None or (isinstance(data, dict) and data.get("_not_found")):
+            raise RuntimeError(f"listing users failed (page {page})")
+        if isinstance(data, dict):
+            data = data.get("results") or data.get("users") or data.get("items") or []
+        users = [u for u in data if isinstance(u, dict)] if isinstance(data, list) else []
+        if not users:
+            return
+        head = users[0].get("uuid")
+        if page > 1 and head == first_seen:
+            return  # پنل پارامتر page را نادیده گرفته و همان صفحه اول را تکرار کرده
+        first_seen = first_seen or head
+        yield users
+        if len(users) != page_size:
+            return
+        page += 1
+
+
 async def renew_user_subscription(user_uuid: str, plan_days: int, plan_gb: float, panel: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
     return await _apply_and_verify_plan(user_uuid, plan_days, plan_gb, panel=panel)
 
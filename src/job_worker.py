@@ -0,0 +1,197 @@
+# filename: job_worker.py
+# -*- coding: utf-8 -*-
+"""
+پروسس جداگانه برای jobهای پس‌زمینه (JOB_RUNNER_MODE = "worker").
+
+همان زمان‌بندی jobs.schedule_jobs اجرا می‌شود، ولی:
+- هر اجرا ابتدا lease همان job را در جدول job_leases می‌گیرد (دو worker هم‌زمان یک job را اجرا نمی‌کنند
+  و lease یک worker از کار افتاده بعد از JOB_LEASE_TTL_SEC آزاد می‌شود).
+- context.bot یک OutboxBot است؛ پیام‌ها و فایل‌ها در admin_outbox ثبت و توسط پروسس ربات ارسال می‌شوند.
+  ارتباط دو پروسس فقط از طریق دیتابیس SQLite است.
+- هر WORKER_RESCHEDULE_SEC ثانیه تنظیمات دوباره خوانده و jobهای تغییرکرده دوباره زمان‌بندی می‌شوند.
+
+    python job_worker.py
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import database as db
+from bot import executors, jobs
+from bot.outbox import OutboxBot
+
+try:
+    from config import JOB_LEASE_TTL_SEC
+except Exception:
+    JOB_LEASE_TTL_SEC = 600
+
+try:
+    from config import WORKER_RESCHEDULE_SEC
+except Exception:
+    WORKER_RESCHEDULE_SEC = 60
+
+logger = logging.getLogger("job_worker")
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _seconds(v) -> float:
+    return v.total_seconds() if isinstance(v, timedelta) else float(v or 0)
+
+
+def _next_daily(at, days) -> float:
+    """ثانیه تا اجرای بعدی؛ مثل JobQueue: زمان بدون tz یعنی UTC و days با 0 = یکشنبه."""
+    tz = at.tzinfo or timezone.utc
+    now = datetime.now(tz)
+    for add in range(8):
+        cand = datetime.combine((now + timedelta(days=add)).date(), at.replace(tzinfo=None), tzinfo=tz)
+        if cand > now and (cand.weekday() + 1) % 7 in days:
+            return (cand - now).total_seconds()
+    return 86400.0
+
+
+class LeasedJobQueue:
+    """
+    زیرمجموعه API JobQueue (run_once / run_repeating / run_daily) برای jobs.schedule_jobs.
+    فقط specها را ثبت می‌کند؛ اجرا با Worker.reconcile.
+    """
+
+    def __init__(self):
+        self.specs: dict = {}
+
+    def run_once(self, callback, when, name=None, **kwargs):
+        self.specs[name or callback.__name__] = ("once", callback, _seconds(when), None)
+
+    def run_repeating(self, callback, interval, first=None, name=None, **kwargs):
+        self.specs[name or callback.__name__] = (
+            "repeating", callback, _seconds(first if first is not None else interval), _seconds(interval)
+        )
+
+    def run_daily(self, callback, time, days=tuple(range(7)), name=None, **kwargs):
+        self.specs[name or callback.__name__] = ("daily", callback, time, tuple(days))
+
+
+class Worker:
+    def __init__(self):
+        self.bot = OutboxBot()
+        self.bot_data: dict = {}
+        self.specs: dict = {}
+        self.tasks: dict = {}
+        self._started = False
+
+    async def _run_job(self, name: str, callback):
+        if not db.acquire_job_lease(name, OWNER, JOB_LEASE_TTL_SEC):
+            logger.info("Job %s skipped: lease held by another worker", name)
+            return
+
+        async def _heartbeat():
+            while True:
+                await asyncio.sleep(max(5.0, JOB_LEASE_TTL_SEC / 3))
+                db.renew_job_lease(name, OWNER, JOB_LEASE_TTL_SEC)
+
+        hb = asyncio.create_task(_heartbeat())
+        ctx = SimpleNamespace(bot=self.bot, bot_data=self.bot_data, application=None, job=SimpleNamespace(name=name))
+        try:
+            await callback(ctx)
+            db.release_job_lease(name, OWNER, "ok")
+        except asyncio.CancelledError:
+            db.release_job_lease(name, OWNER, "cancelled")
+            raise
+        except Exception as e:
+            logger.error("Job %s failed: %s", name, e, exc_info=True)
+            db.release_job_lease(name, OWNER, "error", str(e))
+        finally:
+            hb.cancel()
+
+    async def _loop(self, name: str, spec):
+        kind, callback, a, b = spec
+        if kind == "once":
+            await asyncio.sleep(a)
+            await self._run_job(name, callback)
+        elif kind == "repeating":
+            await asyncio.sleep(a)
+            while True:
+                started = asyncio.get_running_loop().time()
+                await self._run_job(name, callback)
+                await asyncio.sleep(max(0.0, b - (asyncio.get_running_loop().time() - started)))
+        else:
+            while True:
+                await asyncio.sleep(_next_daily(a, b))
+                await self._run_job(name, callback)
+
+    def reconcile(self):
+        """specها را دوباره می‌سازد و فقط jobهای تغییرکرده را دوباره زمان‌بندی می‌کند (یک‌باره‌ها فقط در شروع)."""
+        jq = LeasedJobQueue()
+        if self._started:
+            # لاگ‌های «... scheduled» در هر دور تکرار نشوند
+            level = jobs.logger.level
+            jobs.logger.setLevel(logging.WARNING)
+            try:
+                jobs.schedule_jobs(jq)
+            finally:
+                jobs.logger.setLevel(level)
+        else:
+            jobs.schedule_jobs(jq)
+
+        wanted = {k: v for k, v in jq.specs.items() if v[0] != "once" or not self._started}
+        for name, spec in list(self.specs.items()):
+            if spec[0] != "once" and wanted.get(name) != spec:
+                self.tasks.pop(name).cancel()
+                self.specs.pop(name)
+                logger.info("Job %s unscheduled", name)
+        for name, spec in wanted.items():
+            if self.specs.get(name) == spec:
+                continue
+            self.specs[name] = spec
+            self.tasks[name] = asyncio.create_task(self._loop(name, spec), name=f"job:{name}")
+            logger.info("Job %s scheduled (%s)", name, spec[0])
+        self._started = True
+
+    async def run(self, stop: asyncio.Event):
+        self.reconcile()
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=WORKER_RESCHEDULE_SEC)
+            except asyncio.TimeoutError:
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    logger.error("Reschedule failed: %s", e, exc_info=True)
+        for t in self.tasks.values():
+            t.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+
+async def _main():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    logger.info("Job worker %s started", OWNER)
+    await Worker().run(stop)
+
+
+def main():
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    db.init_db()
+    if jobs.JOB_RUNNER_MODE != "worker":
+        logger.warning("JOB_RUNNER_MODE is not 'worker'; the bot process also runs these jobs.")
+    try:
+        asyncio.run(_main())
+    finally:
+        executors.shutdown()
+        db.close_db()
+        logger.info("Job worker stopped")
+
+
+if __name__ == "__main__":
+    main()
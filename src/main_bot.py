@@ -3,6 +3,7 @@
 
 import asyncio
 import logging
+import secrets
 from logging.handlers import RotatingFileHandler
 
 from app import build_application
@@ -16,6 +17,9 @@ except Exception:
     _cfg = _Cfg()
 REFERRAL_BONUS_AMOUNT = getattr(_cfg, "REFERRAL_BONUS_AMOUNT", 5000)
 PANEL_ENABLED = getattr(_cfg, "PANEL_ENABLED", False)
+# "polling" (پیش‌فرض) یا "webhook" (روی همان سرور aiohttp مینی‌اپ)
+BOT_UPDATE_MODE = str(getattr(_cfg, "BOT_UPDATE_MODE", "polling") or "polling").strip().lower()
+WEBHOOK_URL = getattr(_cfg, "WEBHOOK_URL", "")
 
 # --- Logging Configuration ---
 log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -53,6 +57,66 @@ logging.getLogger("telegram.network").addFilter(_SuppressHttpxReadError())
 # --- End of Logging Configuration ---
 
 
+async def _run_webhook(application) -> None:
+    """
+    اجرای ربات در حالت webhook: آپدیت‌ها توسط aiohttp (bot/webapp_stats.py) دریافت
+    و در application.update_queue قرار می‌گیرند. post_init/post_shutdown دستی صدا زده می‌شوند
+    چون run_polling/run_webhook استفاده نمی‌شود.
+    """
+    import signal
+    from telegram import Update
+    from bot import webapp_stats
+
+    log = logging.getLogger(__name__)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    if not webapp_stats.WEBHOOK_SECRET_TOKEN:
+        # بدون secret هر کسی می‌توانست آپدیت جعلی (مثلاً از طرف ADMIN_ID) به پورت عمومی بفرستد
+        webapp_stats.WEBHOOK_SECRET_TOKEN = secrets.token_urlsafe(32)
+        log.warning(
+            "WEBHOOK_SECRET_TOKEN is empty; generated a random one for this run "
+            "(set it in config.py to use replay_updates.py or a fixed webhook)."
+        )
+
+    webapp_stats.set_telegram_application(application)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await webapp_stats.start_webapp()
+
+        url = str(WEBHOOK_URL or "").rstrip("/")
+        if url:
+            if not url.endswith(webapp_stats.WEBHOOK_PATH):
+                url = url + webapp_stats.WEBHOOK_PATH
+            await application.bot.set_webhook(
+                url=url,
+                secret_token=webapp_stats.WEBHOOK_SECRET_TOKEN,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,
+            )
+            log.info("Webhook set: %s", url)
+        else:
+            log.warning("WEBHOOK_URL is empty; only local POSTs to %s will be processed.", webapp_stats.WEBHOOK_PATH)
+
+        await stop_event.wait()
+    finally:
+        try:
+            if application.running:
+                await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+        finally:
+            await application.shutdown()
+
+
 def main() -> None:
     db.init_db()
 
@@ -68,11 +132,17 @@ def main() -> None:
     logging.getLogger(__name__).info("Bot is running.")
 
     try:
-        application.run_polling(
-            timeout=60,
-            poll_interval=0.0,
-            drop_pending_updates=True
-        )
+        if BOT_UPDATE_MODE == "webhook":
+            logging.getLogger(__name__).info("Update mode: webhook")
+            asyncio.run(_run_webhook(application))
+        else:
+            from telegram import Update
+            application.run_polling(
+                timeout=60,
+                poll_interval=0.0,
+                drop_pending_updates=True,
+                allowed_updates=Update.ALL_TYPES  # شامل chat_member برای کش عضویت
+            )
     finally:
         db.close_db()
 
@@ -0,0 +1,163 @@
+# filename: query_plan_check.py
+# -*- coding: utf-8 -*-
+"""
+بررسی پلن اجرای کوئری‌های database.py (EXPLAIN QUERY PLAN).
+
+همه رشته‌های SQL ثابت در database.py استخراج می‌شوند، روی یک دیتابیس موقت با
+اسکیمای کامل (init_db) و داده نمونه اجرا می‌شوند و هر «SCAN <table>» بدون ایندکس
+که در EXPECTED_SCANS نیامده باشد گزارش می‌شود. کد خروج غیرصفر یعنی اسکن کامل ناخواسته.
+
+    python query_plan_check.py            # گزارش و کد خروج
+    python query_plan_check.py --verbose  # نمایش پلن همه کوئری‌ها
+"""
+
+import argparse
+import ast
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import database as db
+
+# تابع -> جداولی که اسکن کامل آن‌ها عمدی است (لیست/شمارش کل، جداول کوچک)
+EXPECTED_SCANS = {
+    "_migration_001_base_schema": {"users", "plans"},  # probe ستون‌ها با LIMIT 1
+    "get_all_user_ids": {"users"},
+    "get_stats": {"users", "active_services", "sales_log"},
+    "get_plan_categories": {"plans"},
+    "list_plans": {"plans"},
+    "iter_active_services": {"active_services"},
+    "get_all_gift_codes": {"gift_codes"},
+    "get_all_promo_codes": {"promo_codes"},
+    "get_popular_plans": {"sales_log", "p", "plans"},
+    "backfill_active_services_server_names": {"active_services"},
+    "iter_endpoints_with_user": {"se", "service_endpoints"},
+    "delete_user_traffic_not_in_and_older": {"user_traffic"},
+    "get_users_with_no_orders": {"u", "users"},
+    "get_users_with_no_orders_count": {"u", "users"},
+    "get_expired_user_ids": {"s", "active_services", "u", "users"},
+    "get_expired_users_count": {"s", "active_services", "u", "users"},
+    "get_total_users_count": {"users"},
+    "get_all_users_paginated": {"users", "u"},
+    "get_user_traffic_map": {"user_traffic"},  # یک بار در هر دور snapshot
+    "get_domain_health": {"domain_health"},  # چند ده ردیف
+}
+
+_SQL_START = re.compile(r"^\s*(SELECT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?", re.IGNORECASE)
+
+
+def _collect_statements(path: str) -> list[tuple[str, str]]:
+    """(function_name, sql) برای هر رشته SQL ثابت (f-string ها نادیده گرفته می‌شوند)."""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    out = []
+
+    def visit(node, func_name):
+        if isinstance(node, ast.JoinedStr):
+            return  # SQL پویا؛ قابل بررسی استاتیک نیست
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            func_name = node.name
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and _SQL_START.match(node.value):
+            out.append((func_name or "<module>", node.value))
+        for child in ast.iter_child_nodes(node):
+            visit(child, func_name)
+
+    visit(tree, None)
+    return out
+
+
+def _seed(conn: sqlite3.Connection, n_users: int = 300):
+    now = datetime.now()
+    ts = lambda d: (now - timedelta(days=d)).strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (user_id, username, join_date, referred_by) VALUES (?, ?, ?, ?)",
+        [(i, f"user{i}", ts(i % 90), (i // 10) or None) for i in range(1, n_users + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO plans (name, price, days, gb, category) VALUES (?, ?, ?, ?, ?)",
+        [(f"plan{i}", 100000 + i, 30, 50, "cat") for i in range(5)],
+    )
+    conn.executemany(
+        "INSERT INTO active_services (user_id, name, sub_uuid, sub_link, plan_id, created_at, server_name) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(i, f"svc{i}", f"uuid-{i}", f"https://s.example/{i}", 1 + i % 5, ts(i % 40), "s.example")
+         for i in range(1, n_users + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO sales_log (user_id, plan_id, price, sale_date) VALUES (?, ?, ?, ?)",
+        [(1 + i % n_users, 1 + i % 5, 100000, ts(i % 60)) for i in range(n_users * 3)],
+    )
+    conn.executemany(
+        "INSERT INTO transactions (user_id, plan_id, type, amount, status, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(1 + i % n_users, 1, ("purchase", "renewal", "charge")[i % 3], 1000, ("completed", "pending", "failed")[i % 3],
+          ts(i % 60), ts(i % 60)) for i in range(n_users * 5)],
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def _explain(conn: sqlite3.Connection, sql: str) -> list[str]:
+    n_params = sql.count("?")
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, (None,) * n_params).fetchall()
+    return [str(r[-1]) for r in rows]
+
+
+def _full_scans(plan: list[str]) -> set[str]:
+    tables = set()
+    for detail in plan:
+        if "USING" in detail.upper() or "CONSTANT ROW" in detail.upper():
+            continue
+        m = _SCAN.match(detail)
+        if m:
+            tables.add(m.group(2) or m.group(1))
+            tables.add(m.group(1))
+    return tables
+
+
+def run(verbose: bool = False) -> int:
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.py")
+    statements = _collect_statements(src)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.close_db()
+        old_name = db.DB_NAME
+        db.DB_NAME = os.path.join(tmp, "plan_check.db")
+        try:
+            db.init_db()
+            conn = db._connect_db()
+            _seed(conn)
+
+            problems = 0
+            for func, sql in statements:
+                one_line = " ".join(sql.split())
+                try:
+                    plan = _explain(conn, sql)
+                except sqlite3.Error as e:
+                    if "incomplete input" not in str(e):  # تکه SQL که در کد کامل می‌شود
+                        print(f"[skip] {func}: {e} :: {one_line[:100]}")
+                    continue
+                unexpected = _full_scans(plan) - EXPECTED_SCANS.get(func, set())
+                if verbose or unexpected:
+                    print(f"{'[FULL SCAN]' if unexpected else '[ok]'} {func}: {one_line[:120]}")
+                    for detail in plan:
+                        print(f"    {detail}")
+                if unexpected:
+                    problems += 1
+            print(f"{len(statements)} statements checked, {problems} with unexpected full scans.")
+            return 1 if problems else 0
+        finally:
+            db.close_db()
+            db.DB_NAME = old_name
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN check for database.py")
+    ap.add_argument("--verbose", action="store_true")
+    sys.exit(run(ap.parse_args().verbose))
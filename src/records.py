@@ -0,0 +1,162 @@
+# filename: records.py
+# -*- coding: utf-8 -*-
+"""
+رکوردهای سبک (__slots__) برای ردیف‌های پرتکرار دیتابیس: User، Service، Plan، Transaction، Endpoint.
+
+هر رکورد به جای یک dict کامل فقط یک شیء با slot های ثابت است (حافظه و هزینه ساخت کمتر در jobهایی
+که ده‌ها هزار ردیف نگه می‌دارند). برای مهاجرت تدریجی، دسترسی شبه-dict هم کار می‌کند:
+  rec["name"]، rec.get("x", default)، "x" in rec، keys()/items()، dict(rec)، {**rec}
+ستونی که در _fields نیست (مثلاً ستون اضافه شده با migration یا alias در JOIN) و کلیدهایی که بعداً
+با rec["key"] = v اضافه می‌شوند در _extra (dict تنبل) نگه داشته می‌شوند.
+json.dumps و isinstance(rec, dict) مستقیم کار نمی‌کنند؛ در این موارد rec.to_dict().
+
+row_factory(cls): row factory برای cursor.row_factory؛ نگاشت ستون‌ها یک بار برای هر statement ساخته می‌شود.
+"""
+
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+_MISSING = object()
+
+
+class Record:
+    __slots__ = ("_extra",)
+    _fields: Tuple[str, ...] = ()
+
+    def __init__(self, **values):
+        for f in self._fields:
+            setattr(self, f, values.pop(f, None))
+        self._extra = values or None
+
+    # ---- dict-style access ----
+    def __getitem__(self, key: str):
+        if key in self._fields:
+            return getattr(self, key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key in self._fields:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def get(self, key: str, default=None):
+        v = self._lookup(key)
+        return default if v is _MISSING else v
+
+    def _lookup(self, key: str):
+        if key in self._fields:
+            return getattr(self, key)
+        if self._extra is not None:
+            return self._extra.get(key, _MISSING)
+        return _MISSING
+
+    def __contains__(self, key) -> bool:
+        return key in self._fields or (self._extra is not None and key in self._extra)
+
+    def keys(self):
+        return list(self._fields) + (list(self._extra) if self._extra else [])
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self._fields) + (len(self._extra) if self._extra else 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {f: getattr(self, f) for f in self._fields}
+        if self._extra:
+            d.update(self._extra)
+        return d
+
+    copy = to_dict
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Record):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class User(Record):
+    _fields = ("user_id", "username", "balance", "join_date", "is_banned", "has_used_trial",
+               "referred_by", "has_received_referral_bonus")
+    __slots__ = _fields
+
+
+class Service(Record):
+    _fields = ("service_id", "user_id", "name", "sub_uuid", "sub_link", "plan_id", "created_at",
+               "low_usage_alert_sent", "server_name")
+    __slots__ = _fields
+
+
+class Plan(Record):
+    _fields = ("plan_id", "name", "price", "days", "gb", "is_visible", "category")
+    __slots__ = _fields
+
+
+class Transaction(Record):
+    _fields = ("transaction_id", "user_id", "plan_id", "service_id", "type", "amount", "status",
+               "created_at", "updated_at", "note")
+    __slots__ = _fields
+
+
+class Endpoint(Record):
+    # user_id فقط در کوئری‌های JOIN با active_services پر می‌شود
+    _fields = ("id", "service_id", "server_name", "sub_uuid", "sub_link", "created_at", "user_id")
+    __slots__ = _fields
+
+
+def _plan(cls, description) -> Tuple[list, Optional[list]]:
+    """(setter هر ستون یا None، ستون‌های خارج از _fields)."""
+    names = [d[0] for d in description]
+    setters = [getattr(cls, n).__set__ if n in cls._fields else None for n in names]
+    absent = [getattr(cls, f).__set__ for f in cls._fields if f not in names]
+    extras = [i for i, n in enumerate(names) if n not in cls._fields]
+    return setters, (absent, extras, names)
+
+
+def row_factory(cls):
+    memo: list = [None]  # [(description, plan)]
+
+    def factory(cursor, row):
+        desc = cursor.description
+        cached = memo[0]
+        if cached is None or cached[0] is not desc:
+            cached = memo[0] = (desc, _plan(cls, desc))
+        setters, (absent, extras, names) = cached[1]
+        obj = cls.__new__(cls)
+        for setter, v in zip(setters, row):
+            if setter is not None:
+                setter(obj, v)
+        for setter in absent:
+            setter(obj, None)
+        obj._extra = {names[i]: row[i] for i in extras} if extras else None
+        return obj
+
+    return factory
+
+
+for _cls in (User, Service, Plan, Transaction, Endpoint):
+    _cls.factory = staticmethod(row_factory(_cls))
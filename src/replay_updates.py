@@ -0,0 +1,75 @@
+# filename: replay_updates.py
+# -*- coding: utf-8 -*-
+"""
+ارسال آپدیت‌های ضبط‌شده (WEBHOOK_RECORD_PATH، هر خط یک JSON) به webhook محلی
+برای تست و بنچمارک سرعت پردازش آپدیت‌ها.
+
+نمونه:
+    python replay_updates.py updates.jsonl --url http://127.0.0.1:8081/telegram/webhook --concurrency 20
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+try:
+    import config as _cfg
+except Exception:
+    class _C: pass
+    _cfg = _C()
+
+
+async def _replay(path: str, url: str, secret: str, concurrency: int, repeat: int) -> None:
+    with open(path, "r", encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    if not updates:
+        print("no updates found")
+        return
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    sem = asyncio.Semaphore(max(1, concurrency))
+    latencies: list[float] = []
+    errors = 0
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        async def _post(payload: dict):
+            nonlocal errors
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post(url, json=payload, headers=headers)
+                    if r.status_code != 200:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - t0)
+
+        started = time.perf_counter()
+        for _ in range(max(1, repeat)):
+            await asyncio.gather(*(_post(u) for u in updates))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    n = len(latencies)
+    print(f"sent={n} errors={errors} elapsed={elapsed:.2f}s rate={n / elapsed:.1f} upd/s")
+    print(f"p50={latencies[n // 2] * 1000:.1f}ms p95={latencies[int(n * 0.95) - 1] * 1000:.1f}ms")
+
+
+def main() -> None:
+    port = int(getattr(_cfg, "WEBAPP_PORT", 8081))
+    path = getattr(_cfg, "WEBHOOK_PATH", "/telegram/webhook")
+    ap = argparse.ArgumentParser(description="Replay recorded Telegram updates to the local webhook")
+    ap.add_argument("file", help="JSONL file of recorded updates")
+    ap.add_argument("--url", default=f"http://127.0.0.1:{port}{path}")
+    ap.add_argument("--secret", default=getattr(_cfg, "WEBHOOK_SECRET_TOKEN", ""))
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--repeat", type=int, default=1)
+    args = ap.parse_args()
+    asyncio.run(_replay(args.file, args.url, args.secret, args.concurrency, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# filename: restore_backup.py
+# -*- coding: utf-8 -*-
+"""
+بازسازی دیتابیس از بکاپ افزایشی: فایل پایه (auto_base_*.sqlite3) + delta های آن (auto_delta_*.vbd).
+ترتیب delta ها از هدر خودشان خوانده می‌شود؛ زنجیره ناقص یا delta متعلق به پایه دیگر خطا می‌دهد.
+در پایان sha256 نتیجه با مقدار ثبت‌شده در آخرین delta مقایسه می‌شود.
+فایل‌های ارسالی ربات (.gz / .zst یا manifest.json یک بکاپ چندقطعه‌ای) هم مستقیم پذیرفته می‌شوند.
+
+نمونه:
+    python restore_backup.py auto_base_2024-01-01_00-00_ab12cd34ef56ab78.sqlite3 auto_delta_ab12cd34ef56ab78_*.vbd -o vpn_bot.db
+(ربات را قبل از جایگزینی vpn_bot.db متوقف کنید.)
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from bot import backup_archive
+from bot.incremental_backup import restore
+
+
+def _materialize(path: str, work_dir: str) -> str:
+    """فایل فشرده یا manifest -> مسیر فایل باز شده در work_dir؛ فایل خام همان path."""
+    if path.endswith(backup_archive.MANIFEST_SUFFIX):
+        manifest = backup_archive.read_manifest(path)
+        src_dir = os.path.dirname(os.path.abspath(path))
+        out = os.path.join(work_dir, manifest["name"])
+        parts = {p["name"]: os.path.join(src_dir, p["name"]) for p in manifest["parts"] if os.path.exists(os.path.join(src_dir, p["name"]))}
+        backup_archive.unpack(manifest, parts, out)
+        return out
+    if backup_archive.codec_for_name(path):
+        ext = backup_archive.CODEC_EXT[backup_archive.codec_for_name(path)]
+        out = os.path.join(work_dir, os.path.basename(path)[:-len(ext)])
+        backup_archive.decompress_file(path, out)
+        return out
+    return path
+
+
+def main():
+    ap = argparse.ArgumentParser(description="replay an incremental backup chain")
+    ap.add_argument("base", help="فایل پایه auto_base_*.sqlite3")
+    ap.add_argument("deltas", nargs="*", help="فایل‌های auto_delta_*.vbd (هر ترتیبی)")
+    ap.add_argument("-o", "--output", required=True, help="مسیر دیتابیس بازسازی‌شده")
+    ap.add_argument("--force", action="store_true", help="بازنویسی output اگر وجود دارد")
+    args = ap.parse_args()
+
+    if os.path.exists(args.output) and not args.force:
+        sys.exit(f"{args.output} exists; use --force to overwrite")
+
+    work_dir = tempfile.mkdtemp(prefix="vpnbot_restore_")
+    try:
+        base = _materialize(args.base, work_dir)
+        deltas = [_materialize(p, work_dir) for p in args.deltas]
+        info = restore(base, deltas, args.output)
+    except (OSError, ValueError) as e:
+        sys.exit(f"restore failed: {e}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with sqlite3.connect(args.output) as conn:
+        check = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    print(f"base {info['base']} + {info['deltas']} delta(s) -> {args.output} ({info['bytes']} bytes), integrity_check: {check}")
+    if check != "ok":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()